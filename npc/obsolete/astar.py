@@ -35,6 +35,8 @@
 #
 import numpy
 import math
+import random
+import collections
 
 #
 #   Data storage.
@@ -84,7 +86,7 @@ class AStarGraph(object):
         Stored in 4 lists because LSL has constant performance up to size 128,
         then it gets worse. So to allow for 32x32 storage, we do this.
         """
-        ix = y*self.ysize+x;
+        ix = y*self.xsize+x;
         ixitem = int(ix / 2)
         ixoffset = (ix % 2) * 16            # bit offset
         ixrow = ixitem % 4
@@ -115,7 +117,7 @@ class AStarGraph(object):
         assert(newval & ~0xffff == 0)           # stay in 16 bits
         newval = newval & mask                  # redundant, for safety
         self.datacheck[x][y] = (self.datacheck[x,y] & ~mask) | newval            # for checking only
-        ix = y*self.ysize+x;
+        ix = y*self.xsize+x;
         ixitem = int(ix / 2)
         ixoffset = (ix % 2) * 16            # bit offset
         ixrow = ixitem % 4
@@ -162,6 +164,13 @@ class AStarGraph(object):
         dx = start[0] - goal[0]
         dy = start[1] - goal[1]
         return int(4*math.sqrt(dx*dx + dy*dy))              # squared distance
+
+    def manhattan(self, start, goal) :
+        """
+        Distance in 4-way moves, at move_cost's 4 per move. Consistent, so
+        usable as a potential.
+        """
+        return 4*(abs(start[0] - goal[0]) + abs(start[1] - goal[1]))
  
     def get_vertex_neighbours(self, pos):
         """
@@ -238,33 +247,20 @@ class AStarGraph(object):
             
         
  
-def AStarSearch(start, end, graph, checkbarrier):
+def AStarSearch(start, end, graph, checkbarrier, counts=None):
  
     #   Initialize starting values
     openVertices = [(start, graph.heuristic(start, end))]            # our to-do ilst
  
     while len(openVertices) > 0:
         #   Get the vertex in the open list with the lowest F score.
-        current = None
-        currentFscore = None
-        for (pos, fscore) in openVertices:
-            if current is None or fscore < currentFscore :
-                currentFscore = fscore
-                current = pos
+        current = findlowestfscore(openVertices)
+        if counts is not None :
+            counts["expand"] += 1                                       # for measurement only
  
         #   Check if we have reached the goal
         if current == end :
-            #   Retrace our route backward
-            path = [current]
-            while current != start :
-                currentdirix = graph.camefromarray[current[0]][current[1]]
-                currentdir = graph.ALLOWEDMOVES[currentdirix]       # get current dir offset
-                current = (current[0] - currentdir[0], current[1] - currentdir[1])
-                if graph.barrierarray[current[0]][current[1]] > 0 :
-                    RuntimeError("ERROR: path through blocked point at " + str(current))
-                path.append(current)
-            path.reverse()
-            return path                                                 # done
+            return retrace(graph, start, current)                       # done
  
         #   Mark the current vertex as closed
         ix = findinpairlist(openVertices, current)                      # index of vertex to remove
@@ -313,6 +309,117 @@ def AStarSearch(start, end, graph, checkbarrier):
  
     raise RuntimeError("A* failed to find a solution")
     
+def retrace(graph, start, current) :
+    """
+    Route from start to current, following camefrom back from current
+    """
+    path = [current]
+    while current != start :
+        currentdirix = graph.camefromarray[current[0]][current[1]]
+        currentdir = graph.ALLOWEDMOVES[currentdirix]       # get current dir offset
+        current = (current[0] - currentdir[0], current[1] - currentdir[1])
+        if graph.barrierarray[current[0]][current[1]] > 0 :
+            raise RuntimeError("ERROR: path through blocked point at " + str(current))
+        path.append(current)
+    path.reverse()
+    return path
+
+TIEBREAK = AStarGraph.MAXCOST + 1                                   # bidirectional keys leave room below for g
+
+def AStarBidirectionalSearch(start, end, graph, checkbarrier, backgraph=None, counts=None) :
+    """
+    A* from both ends at once, meeting in the middle.
+
+    "graph" holds the barrier layer, probed once for both directions,
+    and the search from start. "backgraph" holds the search from end.
+
+    Each side is ordered by the average of its own heuristic and the
+    negated heuristic of the other side, doubled to stay in integers:
+    2g + h(to end) - h(to start) forward, the reverse backward. The
+    heuristic is AStarGraph.manhattan, which is exact across open
+    ground for 4-way moves. Euclidean distance is too weak there, and
+    then meeting in the middle costs more than searching one way.
+    Manhattan distance ties across whole rectangles, so ties go to the
+    cell with the larger g, the one furthest along. Both
+    sides then search the same reduced-cost graph, and the usual
+    bidirectional stopping rule holds. Each time a cell has been
+    reached from both sides, the route through it is a candidate. Once
+    the two lowest open keys add up to at least twice the best
+    candidate, nothing left can beat it, so it is a shortest route.
+    The side with the smaller open list is expanded next. If counts
+    is given, counts["expand"] is incremented for each expansion.
+
+    Unlike AStarSearch, a cell's cost can still be lowered until it is
+    expanded, so routes are shortest even where AStarSearch's are not.
+    """
+    if backgraph is None :
+        backgraph = AStarGraph(graph.xsize, graph.ysize)
+    if start == end :
+        return [start]
+    def key(g, h, otherh) :
+        return (2*g + h - otherh)*TIEBREAK - g                      # doubled average potential, deepest first on ties
+    def keyof(fscore) :
+        return -(-fscore // TIEBREAK)                               # the potential part of a key
+    #   Per side: graph, open list, target, other end, cells reached
+    sides = [(graph, [(start, key(0, graph.manhattan(start, end), 0))], end, start, set([start])),
+        (backgraph, [(end, key(0, backgraph.manhattan(end, start), 0))], start, end, set([end]))]
+    best = None                                                     # cost of best route found
+    meet = None                                                     # where its two halves join
+    while len(sides[0][1]) > 0 and len(sides[1][1]) > 0 :
+        if best is not None and keyof(min(k for (_, k) in sides[0][1])) + keyof(min(k for (_, k) in sides[1][1])) >= 2*best :
+            break                                                   # nothing left can beat best
+        side = 0 if len(sides[0][1]) <= len(sides[1][1]) else 1
+        (g, openVertices, target, origin, reached) = sides[side]
+        (otherg, _, _, _, otherreached) = sides[1-side]
+        current = findlowestfscore(openVertices)
+        if counts is not None :
+            counts["expand"] += 1
+        del(openVertices[findinpairlist(openVertices, current)])
+        g.closedverticesarray[current[0]][current[1]] = 1
+        g.set(current[0], current[1], 1<<g.SHIFTCLOSED, g.MASKCLOSED)
+        for neighbor in g.get_vertex_neighbours(current):
+            if g.get(neighbor[0], neighbor[1]) & g.MASKCLOSED :
+                continue
+            candidateG = (g.get(current[0], current[1]) & g.MASKCOST) + graph.move_cost(current, neighbor, checkbarrier)   # barriers from graph
+            if candidateG >= g.MAXCOST :
+                continue                                            # hit barrier, skip
+            ix = findinpairlist(openVertices, neighbor)
+            if ix < 0 :
+                openVertices.append((neighbor, 0))
+                ix = len(openVertices) - 1
+            elif candidateG >= g.get(neighbor[0], neighbor[1]) & g.MASKCOST :
+                continue                                            # no better
+            neighbordiff = (neighbor[0] - current[0], neighbor[1] - current[1])
+            g.update(neighbor[0], neighbor[1], g.ALLOWEDMOVES.index(neighbordiff), candidateG, True, False, False)
+            openVertices[ix] = (neighbor, key(candidateG, g.manhattan(neighbor, target), g.manhattan(neighbor, origin)))
+            reached.add(neighbor)
+            if neighbor in otherreached :                           # reached from both ends
+                total = candidateG + (otherg.get(neighbor[0], neighbor[1]) & otherg.MASKCOST)
+                if best is None or total < best :
+                    best = total
+                    meet = neighbor
+    if meet is None :
+        raise RuntimeError("A* failed to find a solution")
+    #   Splice the halves at the meeting point
+    path = retrace(graph, start, meet)
+    backpath = retrace(backgraph, end, meet)
+    backpath.reverse()
+    return path + backpath[1:]
+    
+def findlowestfscore(openVertices) :
+    """
+    Position in open list with the lowest F score
+    
+    Linear search, as LSL would do it
+    """
+    current = None
+    currentFscore = None
+    for (pos, fscore) in openVertices:
+        if current is None or fscore < currentFscore :
+            currentFscore = fscore
+            current = pos
+    return current
+    
 def findinpairlist(lst, key) :
     """
     Find index of value in list of k,v
@@ -353,9 +460,60 @@ def runtest(xsize, ysize, barrierfn) :
     print ("cost", len(result))
     graph.dump(result)
 
-    
- 
+def bfsdistance(xsize, ysize, start, end, barriers) :
+    """
+    Shortest route length in steps, for checking, or None
+    """
+    dist = { start : 0 }
+    todo = collections.deque([start])
+    while todo :
+        (x, y) = todo.popleft()
+        if (x, y) == end :
+            return dist[end]
+        for (dx, dy) in AStarGraph.ALLOWEDMOVES :
+            n = (x + dx, y + dy)
+            if 0 <= n[0] < xsize and 0 <= n[1] < ysize and n not in barriers and n not in dist :
+                dist[n] = dist[(x, y)] + 1
+                todo.append(n)
+    return None
+
+def runbidirectional(xsize, ysize, density, trials, msg) :
+    """
+    One-way and bidirectional search on random maps. Expansions are
+    open list selections, probes are checkbarrier calls.
+    """
+    counts = { "expand" : 0, "probe" : 0 }
+    totals = { "one" : [0, 0], "bi" : [0, 0] }
+    solved = 0
+    while solved < trials :
+        (start, end) = ((random.randrange(4), random.randrange(ysize)), (xsize - 1 - random.randrange(4), random.randrange(ysize)))
+        barriers = set((random.randrange(xsize), random.randrange(ysize)) for _ in range(int(xsize*ysize*density))) - set([start, end])
+        shortest = bfsdistance(xsize, ysize, start, end, barriers)
+        if shortest is None or 4*shortest >= AStarGraph.MAXCOST :
+            continue                                            # unreachable, or too long for 8-bit costs
+        def checkbarrier(ix, iy) :
+            counts["probe"] += 1
+            return (ix, iy) in barriers
+        results = {}
+        for (mode, search) in (("one", AStarSearch), ("bi", AStarBidirectionalSearch)) :
+            counts["expand"] = counts["probe"] = 0
+            path = search(start, end, AStarGraph(xsize, ysize), checkbarrier, counts=counts)
+            assert(path[0] == start and path[-1] == end and not any(p in barriers for p in path))
+            assert(all(abs(a[0]-b[0]) + abs(a[1]-b[1]) == 1 for (a, b) in zip(path, path[1:])))
+            results[mode] = len(path) - 1
+            totals[mode][0] += counts["expand"]
+            totals[mode][1] += counts["probe"]
+        assert(results["bi"] == shortest)                       # bidirectional is always shortest
+        assert(results["one"] >= shortest)
+        solved += 1
+    print("%s, %d searches. One-way: %d expansions, %d probes. Bidirectional: %d expansions, %d probes." %
+        (msg, trials, totals["one"][0], totals["one"][1], totals["bi"][0], totals["bi"][1]))
+
 if __name__=="__main__":
     runtest(8,8,checkbarriercell1)
     runtest(32,32,checkbarriercell2)
+    random.seed(48)
+    runbidirectional(40, 40, 0.0, 5, "Open 40x40")
+    runbidirectional(64, 64, 0.1, 10, "64x64, 10% blocked")
+    runbidirectional(64, 64, 0.2, 10, "64x64, 20% blocked")
 
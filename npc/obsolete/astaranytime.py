@@ -0,0 +1,275 @@
+#
+#   astaranytime.py -- weighted and anytime A* under a budget
+#
+#   LSL scripts get small time slices. An NPC would rather have a decent
+#   path now than the best path later. AStarSearch runs until it finds
+#   the optimal path or fails.
+#
+#   weightedastar inflates the heuristic by a weight w. It expands far
+#   fewer cells, and its path costs at most w times the optimum.
+#
+#   anytimeastar runs weighted A* with a large weight first, to get some
+#   path fast. Then it searches again with smaller weights while budget
+#   remains. Barrier probes are kept between passes, so each cell is only
+#   probed once. Cells that cannot beat the current path are skipped.
+#
+#   The budget is any combination of wall time, expansions and probes.
+#
+#   Each result carries a proven suboptimality bound. The path cost is at
+#   most bound times the optimal cost. This is the smaller of the weight
+#   used, and the path cost divided by the lowest g+h on the open list,
+#   which never exceeds the optimal cost.
+#
+#   Moves are 4-way, as in astar.py, each step costing 1. The heuristic
+#   is Manhattan distance, which is admissible and consistent for these
+#   moves. Paths are lists of (x,y), start first, like AStarSearch returns.
+#
+import heapq
+import random
+import time
+
+import astar
+import mazesolver
+import flowfield
+
+class Budget(object) :
+    """
+    Limits on a search. None means no limit.
+    """
+    def __init__(self, maxtime=None, maxexpansions=None, maxprobes=None) :
+        self.maxtime = maxtime                  # seconds of wall time
+        self.maxexpansions = maxexpansions      # cells expanded
+        self.maxprobes = maxprobes              # barrier probes
+        self.starttime = None
+
+    def start(self) :
+        self.starttime = time.perf_counter()
+
+    def exhausted(self, expansions, probes) :
+        if self.maxexpansions is not None and expansions >= self.maxexpansions :
+            return True
+        if self.maxprobes is not None and probes >= self.maxprobes :
+            return True
+        if self.maxtime is not None and time.perf_counter() - self.starttime >= self.maxtime :
+            return True
+        return False
+
+class AStarResult(object) :
+    def __init__(self, path, cost, bound, weight, expansions, probes, elapsed, passes, complete) :
+        self.path = path                        # list of (x,y), start first
+        self.cost = cost                        # steps
+        self.bound = bound                      # cost <= bound * optimal cost
+        self.weight = weight                    # weight of the pass that found path
+        self.expansions = expansions            # total, all passes
+        self.probes = probes                    # total barrier probes
+        self.elapsed = elapsed                  # seconds
+        self.passes = passes                    # weighted A* passes run
+        self.complete = complete                # True if all passes ran within budget
+
+    def __repr__(self) :
+        return "AStarResult(cost=%d, bound=%1.3f, weight=%1.2f, expansions=%d, probes=%d, passes=%d, complete=%s)" % (
+            self.cost, self.bound, self.weight, self.expansions, self.probes, self.passes, self.complete)
+
+def manhattan(a, b) :
+    return abs(a[0] - b[0]) + abs(a[1] - b[1])
+
+#
+#   class BarrierCache -- probed cells, kept between passes
+#
+class BarrierCache(object) :
+
+    def __init__(self, checkbarrier) :
+        self.checkbarrier = checkbarrier
+        self.cells = {}                         # (x,y) -> barrier
+        self.probes = 0
+
+    def isbarrier(self, pos) :
+        barrier = self.cells.get(pos)
+        if barrier is None :
+            self.probes += 1
+            barrier = bool(self.checkbarrier(pos[0], pos[1]))
+            self.cells[pos] = barrier
+        return barrier
+
+class SearchState(object) :
+    """
+    Counters shared by the passes of one search
+    """
+    def __init__(self, budget) :
+        self.budget = budget
+        self.expansions = 0
+        self.outofbudget = False
+
+def weightedpass(start, end, xsize, ysize, cells, weight, state, incumbent=None) :
+    """
+    One weighted A* pass. Returns (path, lowerbound).
+
+    path is None if no path cheaper than incumbent was found. lowerbound
+    is the lowest g+h on the open list when the pass stopped, a lower
+    bound on the optimal cost. None if the open list emptied.
+    """
+    g = { start : 0 }
+    camefrom = {}
+    closed = set()
+    incons = set()                              # closed cells whose g improved later
+    tiebreak = 0
+    openlist = [(weight*manhattan(start, end), 0, tiebreak, start)]    # (f, -g, tiebreak, pos)
+    while openlist :
+        (f, negg, _, current) = heapq.heappop(openlist)
+        gcurrent = -negg
+        if gcurrent != g[current] or current in closed :
+            continue                            # stale entry
+        if current == end :
+            path = [current]
+            while current != start :
+                current = camefrom[current]
+                path.append(current)
+            path.reverse()
+            heapq.heappush(openlist, (f, negg, tiebreak, end))  # goal stays open for the bound
+            return (path, openlowerbound(openlist, incons, g, end))
+        if state.budget is not None and state.budget.exhausted(state.expansions, cells.probes) :
+            state.outofbudget = True
+            heapq.heappush(openlist, (f, negg, tiebreak, current))
+            return (None, openlowerbound(openlist, incons, g, end))
+        closed.add(current)
+        state.expansions += 1
+        for (dx, dy) in astar.AStarGraph.ALLOWEDMOVES :
+            neighbor = (current[0] + dx, current[1] + dy)
+            if neighbor[0] < 0 or neighbor[0] >= xsize or neighbor[1] < 0 or neighbor[1] >= ysize :
+                continue
+            candidateg = gcurrent + 1
+            if candidateg >= g.get(neighbor, candidateg + 1) :
+                continue                        # no better than before
+            h = manhattan(neighbor, end)
+            if incumbent is not None and candidateg + h >= incumbent :
+                continue                        # cannot beat the path we have
+            if cells.isbarrier(neighbor) :
+                continue
+            g[neighbor] = candidateg
+            camefrom[neighbor] = current
+            if neighbor in closed :             # not reopened, as in ARA*. Path stays within weight.
+                incons.add(neighbor)
+                continue
+            tiebreak += 1
+            heapq.heappush(openlist, (candidateg + weight*h, -candidateg, tiebreak, neighbor))
+    return (None, None)
+
+def openlowerbound(openlist, incons, g, end) :
+    """
+    Lowest g+h over live open list entries and inconsistent cells
+    """
+    lb = None
+    for pos in [pos for (_, negg, _, pos) in openlist if -negg == g[pos]] + list(incons) :
+        v = g[pos] + manhattan(pos, end)
+        if lb is None or v < lb :
+            lb = v
+    return lb
+
+def tightenbound(cost, weight, lowerbound) :
+    bound = weight
+    if lowerbound is not None and lowerbound > 0 :
+        bound = min(bound, cost / min(lowerbound, cost))
+    return max(bound, 1.0)
+
+def weightedastar(start, end, xsize, ysize, checkbarrier, weight=2.0, budget=None) :
+    """
+    Weighted A*. Path cost is at most weight times optimal.
+    Raises RuntimeError if no path, or budget ran out first.
+    """
+    return anytimeastar(start, end, xsize, ysize, checkbarrier, budget, weights=[weight])
+
+def anytimeastar(start, end, xsize, ysize, checkbarrier, budget=None, weights=(3.0, 2.0, 1.5, 1.2, 1.0)) :
+    """
+    Anytime A*. Best path found within the budget, with its bound.
+    Raises RuntimeError if no path, or budget ran out before any path.
+    """
+    t0 = time.perf_counter()
+    if budget is not None :
+        budget.start()
+    cells = BarrierCache(checkbarrier)
+    state = SearchState(budget)
+    best = None
+    bestcost = None
+    bestweight = None
+    bound = None
+    passes = 0
+    if start == end :
+        return AStarResult([start], 0, 1.0, 1.0, 0, 0, 0.0, 0, True)
+    for weight in weights :
+        if bound is not None and bound <= weight :
+            continue                            # already at least this good
+        passes += 1
+        (path, lowerbound) = weightedpass(start, end, xsize, ysize, cells, weight, state, bestcost)
+        if path is not None :
+            best = path
+            bestcost = len(path) - 1
+            bestweight = weight
+            bound = tightenbound(bestcost, weight, lowerbound)
+        elif best is not None :
+            if lowerbound is None :
+                bound = 1.0                     # nothing cheaper exists
+            else :
+                bound = min(bound, tightenbound(bestcost, bound, lowerbound))
+        elif not state.outofbudget :
+            raise RuntimeError("A* failed to find a solution")
+        if state.outofbudget or bound <= 1.0 :
+            break
+    if best is None :
+        raise RuntimeError("A* ran out of budget before finding a solution")
+    return AStarResult(best, bestcost, bound, bestweight, state.expansions, cells.probes,
+        time.perf_counter() - t0, passes, not state.outofbudget)
+
+#
+#   Test-only code
+#
+def runtest(xsize, ysize, barrierpairs, msg) :
+    barriers = set(barrierpairs)
+    def checkbarrier(ix, iy) :
+        return (ix, iy) in barriers
+    start = (0, 0)
+    end = (xsize-1, ysize-1)
+    field = flowfield.DistanceField(xsize, ysize, end, checkbarrier)  # AStarSearch costs overflow on big grids
+    optimal = int(field.dist[start[0]][start[1]]) if field.reachable(start) else None
+    print("%s: %dx%d, optimal cost %s" % (msg, xsize, ysize, optimal))
+    for weight in (1.0, 1.5, 3.0) :
+        try :
+            result = weightedastar(start, end, xsize, ysize, checkbarrier, weight)
+        except RuntimeError :
+            assert(optimal is None)
+            continue
+        assert(optimal is not None and result.cost <= result.bound * optimal + 1e-9)
+        assert(result.bound <= weight)
+        if weight == 1.0 :
+            assert(result.cost == optimal)
+        print("    Weight %1.1f: %s" % (weight, result))
+    if optimal is None :
+        return
+    for budget in (Budget(maxexpansions=optimal*4), Budget(maxprobes=optimal*8), Budget(maxtime=0.01), None) :
+        try :
+            result = anytimeastar(start, end, xsize, ysize, checkbarrier, budget)
+        except RuntimeError :
+            print("    Anytime: no path within budget")
+            continue
+        assert(result.cost <= result.bound * optimal + 1e-9)
+        for ((x0, y0), (x1, y1)) in zip(result.path, result.path[1:]) :
+            assert(abs(x1 - x0) + abs(y1 - y0) == 1 and (x1, y1) not in barriers)
+        print("    Anytime: %s" % (result,))
+
+def test() :
+    runtest(12, 12, mazesolver.BARRIERDEF1 + mazesolver.BARRIERCENTER, "Barrier in center")
+    runtest(12, 12, mazesolver.BARRIERFAIL1, "Fail 1")
+    runtest(12, 12, mazesolver.BARRIERBLOCKER, "Blocked")
+    random.seed(41)
+    runtest(41, 41, randombarrier(41, 41, 0.2), "Random 41x41")
+    runtest(120, 120, randombarrier(120, 120, 0.1), "Open field 120x120")
+
+def randombarrier(xsize, ysize, density) :
+    """
+    Random dots, with the cells next to the corners left clear
+    """
+    corners = [(0,0), (0,1), (1,0), (xsize-1, ysize-1), (xsize-2, ysize-1), (xsize-1, ysize-2)]
+    pairs = set((random.randrange(xsize), random.randrange(ysize)) for _ in range(int(xsize*ysize*density)))
+    return [p for p in pairs if p not in corners]
+
+if __name__=="__main__":
+    test()
@@ -0,0 +1,154 @@
+#
+#   astarbatch.py -- batched A* with a shared barrier layer
+#
+#   The maze queue gets many requests over the same area. Run separately,
+#   each AStarSearch gets a fresh AStarGraph and probes the same cells
+#   again. Here, one barrier/examined layer is kept for the whole batch.
+#   Each query still gets its own AStarGraph for costs and came-from
+#   directions, but a cell probed by any earlier query is not probed again.
+#
+#   The total number of probes for a batch does not depend on query
+#   order. A search's moves depend only on the barriers it finds, so the
+#   union of cells probed is the same in any order. What order changes is
+#   how long each query waits, since probes are slow ray casts in-world.
+#   Queries are run shortest first, by Manhattan distance, so short
+#   queries are not stuck behind long ones. Keeping queries to the same
+#   goal together was tried, and waits were longer than plain shortest
+#   first, sometimes longer than arrival order.
+#
+import random
+import contextlib
+import io
+import time
+import numpy
+
+import astar
+import mazesolver
+
+UNKNOWN = 0                                     # same encoding as AStarGraph.barrierarray
+BLOCKED = 1
+CLEAR = -1
+
+#
+#   class SharedBarrierLayer -- barrier cells probed so far, for all queries
+#
+class SharedBarrierLayer(object) :
+
+    def __init__(self, xsize, ysize, checkbarrier) :
+        self.xsize = xsize
+        self.ysize = ysize
+        self.checkbarrier = checkbarrier        # the real, expensive probe
+        self.cells = numpy.full((xsize, ysize), UNKNOWN, dtype=numpy.int8)
+        self.probes = 0                         # real probes made
+        self.lookups = 0                        # probes answered from the layer
+
+    def check(self, x, y) :
+        """
+        checkbarrier replacement for AStarSearch
+        """
+        v = self.cells[x][y]
+        if v != UNKNOWN :
+            self.lookups += 1
+            return v == BLOCKED
+        self.probes += 1
+        barrier = bool(self.checkbarrier(x, y))
+        self.cells[x][y] = BLOCKED if barrier else CLEAR
+        return barrier
+
+def orderqueries(queries) :
+    """
+    Shortest job first, by Manhattan distance. Ties stay in arrival order.
+
+    Returns a list of indices into queries.
+    """
+    def querylen(ix) :
+        (start, goal) = queries[ix]
+        return mazesolver.mazemd(start[0], start[1], goal[0], goal[1])
+    return sorted(range(len(queries)), key=querylen)
+
+class BatchResult(object) :
+    def __init__(self, paths, probes, lookups, order, completions) :
+        self.paths = paths                      # per query, in input order. None if no path.
+        self.probes = probes                    # real barrier probes for whole batch
+        self.lookups = lookups                  # probes answered by the shared layer
+        self.order = order                      # order queries were run
+        self.completions = completions          # per query, batch probes made when it finished
+
+    def meancompletion(self) :
+        """
+        Mean wait per query, in probes
+        """
+        return sum(self.completions) / len(self.completions) if self.completions else 0.0
+
+def AStarBatchSearch(queries, xsize, ysize, checkbarrier, reorder=True) :
+    """
+    Run many (start, goal) queries over one grid, sharing probed barriers.
+    """
+    layer = SharedBarrierLayer(xsize, ysize, checkbarrier)
+    order = orderqueries(queries) if reorder else list(range(len(queries)))
+    paths = [None] * len(queries)
+    completions = [0] * len(queries)
+    for ix in order :
+        (start, goal) = queries[ix]
+        graph = astar.AStarGraph(xsize, ysize)
+        try :
+            paths[ix] = astar.AStarSearch(start, goal, graph, layer.check)
+        except RuntimeError :
+            paths[ix] = None                    # no path
+        completions[ix] = layer.probes
+    return BatchResult(paths, layer.probes, layer.lookups, order, completions)
+
+def independentprobes(queries, xsize, ysize, checkbarrier) :
+    """
+    Baseline. Each query with its own graph, as today. Returns (paths, probes)
+    """
+    probes = [0]
+    def counting(x, y) :
+        probes[0] += 1
+        return checkbarrier(x, y)
+    paths = []
+    for (start, goal) in queries :
+        try :
+            paths.append(astar.AStarSearch(start, goal, astar.AStarGraph(xsize, ysize), counting))
+        except RuntimeError :
+            paths.append(None)
+    return (paths, probes[0])
+
+#
+#   Test-only code
+#
+def runtest(xsize, ysize, barrierpairs, nqueries, msg) :
+    barriers = set(barrierpairs)
+    def checkbarrier(ix, iy) :
+        return (ix, iy) in barriers
+    free = [(x, y) for x in range(xsize) for y in range(ysize) if (x, y) not in barriers]
+    #   Queries cluster around a doorway, as in the maze queue
+    goals = random.sample(free, 3)
+    queries = [(random.choice(free), random.choice(goals)) for _ in range(nqueries)]
+    t0 = time.perf_counter()
+    (basepaths, baseprobes) = independentprobes(queries, xsize, ysize, checkbarrier)
+    basetime = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    unordered = AStarBatchSearch(queries, xsize, ysize, checkbarrier, reorder=False)
+    result = AStarBatchSearch(queries, xsize, ysize, checkbarrier)
+    batchtime = time.perf_counter() - t0
+    for (a, b) in zip(basepaths, result.paths) :
+        assert((a is None) == (b is None))
+        assert(a is None or len(a) == len(b))   # same optimal lengths
+    assert(result.probes == unordered.probes)   # order independent
+    assert(result.meancompletion() <= unordered.meancompletion())
+    print("%s: %d queries. Independent: %d probes, %1.3fs. Batch: %d probes, %d reused, %1.3fs for two batches." %
+        (msg, nqueries, baseprobes, basetime, result.probes, result.lookups, batchtime))
+    print("    Mean probes waited per query: %1.1f in arrival order, %1.1f reordered." %
+        (unordered.meancompletion(), result.meancompletion()))
+
+def test() :
+    random.seed(32)
+    runtest(12, 12, mazesolver.BARRIERDEF1 + mazesolver.BARRIERCENTER, 20, "Barrier in center")
+    runtest(12, 12, mazesolver.BARRIERFAIL1, 20, "Fail 1")
+    with contextlib.redirect_stdout(io.StringIO()) :
+        barrierpairs = mazesolver.generaterandombarrier(24, 24, -1, -1, -1, -1, 100)
+    runtest(24, 24, barrierpairs, 50, "Random 24x24")
+
+if __name__=="__main__":
+    test()
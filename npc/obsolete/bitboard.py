@@ -0,0 +1,368 @@
+#
+#   bitboard.py -- maze grid as bit masks, one Python integer per row
+#
+#   mazesolver.py keeps 2 bits per cell packed into a list, and every
+#   operation unpacks one cell at a time with mazecellget. Here the
+#   barrier and examined layers are each a list of row integers, bit x
+#   of row y being cell (x,y). Python integers are any length, so a row
+#   is one integer at any grid width.
+#
+#   Whole rows are handled per operation:
+#   - Span tests are one mask and one AND.
+#   - Breadth-first search advances the whole frontier of a row at once.
+#   - Reachability fills along each row with a Kogge-Stone fill, which
+#     takes log2(width) shifts no matter how many seeds a row has.
+#
+#   No dependencies beyond the Python standard library.
+#
+import time
+import random
+
+import mazesolver
+
+#
+#   Kogge-Stone fills. "seeds" spread through runs of 1 bits in "free",
+#   in one direction. log2(width) steps.
+#
+def fillup(seeds, free, width) :
+    """
+    Spread seeds toward higher bit numbers through free cells
+    """
+    prop = free
+    shift = 1
+    while shift < width :
+        seeds |= prop & (seeds << shift)
+        prop &= prop << shift
+        shift <<= 1
+    return seeds
+
+def filldown(seeds, free, width) :
+    """
+    Spread seeds toward lower bit numbers through free cells
+    """
+    prop = free
+    shift = 1
+    while shift < width :
+        seeds |= prop & (seeds >> shift)
+        prop &= prop >> shift
+        shift <<= 1
+    return seeds
+
+def fillrow(seeds, free, width) :
+    """
+    All free cells in a row connected along the row to a seed
+    """
+    seeds &= free
+    return fillup(seeds, free, width) | filldown(seeds, free, width)
+
+def bitcount(n) :
+    return bin(n).count("1")                    # int.bit_count is 3.10 or later
+
+#
+#   class BitGrid -- barrier and examined layers as row masks
+#
+class BitGrid(object) :
+
+    def __init__(self, xsize, ysize) :
+        self.xsize = xsize
+        self.ysize = ysize
+        self.rowmask = (1 << xsize) - 1         # all cells in a row
+        self.barrier = [0] * ysize              # 1 = occupied
+        self.examined = [0] * ysize             # 1 = barrier bit is valid
+        self.probes = 0                         # barrier tests made through this grid
+
+    @classmethod
+    def frombarriers(cls, xsize, ysize, barrierpairs) :
+        """
+        Grid with everything examined, barriers as given
+        """
+        grid = cls(xsize, ysize)
+        for (x, y) in barrierpairs :
+            grid.barrier[y] |= 1 << x
+        grid.examined = [grid.rowmask] * ysize
+        return grid
+
+    @classmethod
+    def frommaze(cls) :
+        """
+        Copy of the current mazesolver cell state
+        """
+        grid = cls(mazesolver.gMazeXsize, mazesolver.gMazeYsize)
+        for y in range(grid.ysize) :
+            for x in range(grid.xsize) :
+                grid.setcell(x, y, mazesolver.mazecellget(x, y))
+        return grid
+
+    #   Cell access, same 2-bit values as mazecellget/mazecellset
+    def getcell(self, x, y) :
+        bit = 1 << x
+        return ((mazesolver.MAZEBARRIER if self.barrier[y] & bit else 0) |
+            (mazesolver.MAZEEXAMINED if self.examined[y] & bit else 0))
+
+    def setcell(self, x, y, v) :
+        bit = 1 << x
+        if v & mazesolver.MAZEBARRIER :
+            self.barrier[y] |= bit
+        else :
+            self.barrier[y] &= ~bit
+        if v & mazesolver.MAZEEXAMINED :
+            self.examined[y] |= bit
+        else :
+            self.examined[y] &= ~bit
+
+    def testcell(self, fromx, fromy, x, y, barrierfn) :
+        """
+        Same as mazetestcell. 1 if occupied, probing if not yet examined.
+        """
+        if x < 0 or x >= self.xsize or y < 0 or y >= self.ysize :
+            return 1                            # off grid is occupied
+        bit = 1 << x
+        if self.examined[y] & bit :
+            return 1 if self.barrier[y] & bit else 0
+        self.probes += 1
+        barrier = 1 if barrierfn(fromx, fromy, x, y) else 0
+        self.examined[y] |= bit
+        if barrier :
+            self.barrier[y] |= bit
+        return barrier
+
+    #
+    #   Span tests
+    #
+    def spanmask(self, x0, x1) :
+        """
+        Bits x0..x1 inclusive
+        """
+        return ((1 << (x1 - x0 + 1)) - 1) << x0
+
+    def rowspanclear(self, y, x0, x1) :
+        """
+        True if every cell x0..x1 in row y is known clear. One AND.
+        """
+        mask = self.spanmask(min(x0,x1), max(x0,x1))
+        return (self.examined[y] & mask) == mask and (self.barrier[y] & mask) == 0
+
+    def rowspanblocked(self, y, x0, x1) :
+        """
+        True if any cell x0..x1 in row y is a known barrier. One AND.
+        """
+        return (self.barrier[y] & self.spanmask(min(x0,x1), max(x0,x1))) != 0
+
+    def colspanblocked(self, x, y0, y1) :
+        """
+        True if any cell y0..y1 in column x is a known barrier
+        """
+        bit = 1 << x
+        barrier = self.barrier
+        return any(barrier[y] & bit for y in range(min(y0,y1), max(y0,y1)+1))
+
+    def linebarrier(self, x0, y0, x1, y1, barrierfn) :
+        """
+        Same answer as mazelinebarrier. The line's cells, less the first
+        endpoint, are checked against known barriers with one mask
+        first. Only cells not yet examined are probed, in line order,
+        stopping at the first barrier found.
+        """
+        if x0 == x1 :                           # vertical
+            assert(y0 != y1)
+            (lo, hi) = (min(y0,y1), max(y0,y1))
+            if self.colspanblocked(x0, lo+1, hi) :
+                return True
+            bit = 1 << x0
+            for y in range(lo+1, hi+1) :
+                if not self.examined[y] & bit :
+                    if self.testcell(x0, y-1, x0, y, barrierfn) :
+                        return True
+            return False
+        assert(y0 == y1)
+        (lo, hi) = (min(x0,x1), max(x0,x1))
+        mask = self.spanmask(lo+1, hi)
+        row = y0
+        if self.barrier[row] & mask :
+            return True
+        unexamined = mask & ~self.examined[row]
+        while unexamined :                      # probe unknown cells, lowest x first
+            low = unexamined & -unexamined
+            x = low.bit_length() - 1
+            if self.testcell(x-1, row, x, row, barrierfn) :
+                return True
+            unexamined &= ~low
+        return False
+
+    #
+    #   Search
+    #
+    def freerows(self) :
+        """
+        Cells not known to be barriers
+        """
+        return [~b & self.rowmask for b in self.barrier]
+
+    def reachable(self, startx, starty) :
+        """
+        Flood fill from start over cells not known to be barriers.
+        Returns row masks of the cells reached.
+
+        Each pass fills along every row, then up and down into the
+        next row. Passes repeat until nothing changes, so the pass count
+        grows with the number of turns in the maze, not with its area.
+        """
+        free = self.freerows()
+        width = self.xsize
+        ysize = self.ysize
+        reached = [0] * ysize
+        reached[starty] = fillrow(1 << startx, free[starty], width)
+        changed = True
+        while changed :
+            changed = False
+            for rows in (range(1, ysize), range(ysize-2, -1, -1)) :     # sweep up, then down
+                step = 1 if rows.step > 0 else -1
+                for y in rows :
+                    seeds = reached[y - step] & free[y] & ~reached[y]
+                    if seeds :
+                        reached[y] |= fillrow(seeds | reached[y], free[y], width)
+                        changed = True
+        return reached
+
+    def isreachable(self, startx, starty, endx, endy) :
+        return (self.reachable(startx, starty)[endy] >> endx) & 1 == 1
+
+    def bfs(self, startx, starty, endx=None, endy=None) :
+        """
+        Breadth-first search by frontier rows. Returns the list of
+        frontiers, one list of row masks per distance from start. Frontier
+        n is all cells exactly n 4-way moves from start.
+
+        Stops early when the end cell is reached, if given.
+        """
+        free = self.freerows()
+        ysize = self.ysize
+        rowmask = self.rowmask
+        visited = [0] * ysize
+        frontier = [0] * ysize
+        frontier[starty] = 1 << startx
+        visited[starty] = 1 << startx
+        layers = [frontier]
+        while True :
+            new = [0] * ysize
+            anynew = False
+            for y in range(ysize) :
+                f = frontier[y]
+                grow = ((f << 1) | (f >> 1)) & rowmask
+                if y > 0 :
+                    grow |= frontier[y-1]
+                if y < ysize - 1 :
+                    grow |= frontier[y+1]
+                grow &= free[y] & ~visited[y]
+                if grow :
+                    new[y] = grow
+                    visited[y] |= grow
+                    anynew = True
+            if not anynew :
+                return layers
+            layers.append(new)
+            frontier = new
+            if endx is not None and (new[endy] >> endx) & 1 :
+                return layers
+
+    def distance(self, startx, starty, endx, endy) :
+        """
+        Shortest 4-way path length, or -1 if unreachable
+        """
+        layers = self.bfs(startx, starty, endx, endy)
+        if (layers[-1][endy] >> endx) & 1 :
+            return len(layers) - 1
+        return -1
+
+    def route(self, startx, starty, endx, endy) :
+        """
+        A shortest route as packed mazepathvals, start first. Empty if none.
+
+        Walks back from the end through the BFS layers.
+        """
+        layers = self.bfs(startx, starty, endx, endy)
+        if not (layers[-1][endy] >> endx) & 1 :
+            return []
+        (x, y) = (endx, endy)
+        route = [mazesolver.mazepathval(x, y)]
+        for n in range(len(layers)-2, -1, -1) :
+            layer = layers[n]
+            for (dx, dy) in mazesolver.EDGEFOLLOWDIRS :
+                x2 = x + dx
+                y2 = y + dy
+                if 0 <= x2 < self.xsize and 0 <= y2 < self.ysize and (layer[y2] >> x2) & 1 :
+                    break
+            (x, y) = (x2, y2)
+            route.append(mazesolver.mazepathval(x, y))
+        route.reverse()
+        return route
+
+    def countexamined(self) :
+        return sum(bitcount(r) for r in self.examined)
+
+def checkreachability(xsize, ysize, xstart, ystart, xend, yend, barrierpairs) :
+    """
+    Drop-in for mazesolver.checkreachability
+    """
+    return BitGrid.frombarriers(xsize, ysize, barrierpairs).isreachable(xstart, ystart, xend, yend)
+
+#
+#   Test-only code
+#
+def timeit(fn, n) :
+    t0 = time.perf_counter()
+    for _ in range(n) :
+        result = fn()
+    return (result, (time.perf_counter() - t0) / n)
+
+def runtest(xsize, ysize, barrierpairs, msg) :
+    barriers = set(barrierpairs)
+    grid = BitGrid.frombarriers(xsize, ysize, barrierpairs)
+    (slow, slowtime) = timeit(lambda : mazesolver.checkreachability(xsize, ysize, 0, 0, xsize-1, ysize-1, barrierpairs), 1)
+    (fast, fasttime) = timeit(lambda : grid.isreachable(0, 0, xsize-1, ysize-1), 20)
+    assert(bool(slow) == fast)
+    #   BFS distance must agree with flood fill
+    d = grid.distance(0, 0, xsize-1, ysize-1)
+    assert((d >= 0) == fast)
+    if d >= 0 :
+        route = grid.route(0, 0, xsize-1, ysize-1)
+        assert(len(route) == d + 1)
+        for val in route :
+            assert((mazesolver.mazepathx(val), mazesolver.mazepathy(val)) not in barriers)
+    #   Span tests against the cell-at-a-time version
+    mazesolver.mazeinit(xsize, ysize)
+    for (x, y) in barrierpairs :
+        mazesolver.mazecellset(x, y, mazesolver.MAZEEXAMINED | mazesolver.MAZEBARRIER)
+        mazesolver.testdata[x][y] = mazesolver.MAZEEXAMINED | mazesolver.MAZEBARRIER
+    for x in range(xsize) :
+        for y in range(ysize) :
+            if (x, y) not in barriers :
+                mazesolver.mazecellset(x, y, mazesolver.MAZEEXAMINED)
+                mazesolver.testdata[x][y] = mazesolver.MAZEEXAMINED
+    def nobarrierfn(prevx, prevy, x, y) :
+        return (x, y) in barriers
+    spans = [(random.randrange(xsize), y, random.randrange(xsize), y) for y in range(ysize)]
+    spans = [s for s in spans if s[0] != s[2]]
+    (cellwise, celltime) = timeit(lambda : [mazesolver.mazelinebarrier(*s) for s in spans], 5)
+    (maskwise, masktime) = timeit(lambda : [grid.linebarrier(s[0], s[1], s[2], s[3], nobarrierfn) for s in spans], 5)
+    assert(cellwise == maskwise)
+    print("%s: reachable %r distance %d. Reachability %1.5fs vs %1.5fs (%1.0fx). Span tests %1.6fs vs %1.6fs (%1.0fx)" %
+        (msg, fast, d, slowtime, fasttime, slowtime/fasttime, celltime, masktime, celltime/max(masktime,1e-9)))
+
+def test() :
+    import contextlib, io
+    tests = [(12, 12, mazesolver.BARRIERDEF1+mazesolver.BARRIERCENTER, "Barrier in center"),
+        (12, 12, mazesolver.BARRIERDEF1+mazesolver.BARRIERBLOCKER, "Blocked"),
+        (12, 12, mazesolver.BARRIERFAIL1, "Fail 1"),
+        (12, 12, mazesolver.BARRIERFAIL5, "Fail 5")]
+    for n in range(5) :
+        tests.append((41, 41, None, "Random 41x41 #%d" % (n,)))
+    for (xsize, ysize, barrierpairs, msg) in tests :
+        with contextlib.redirect_stdout(io.StringIO()) as out :   # mazesolver prints a lot
+            if barrierpairs is None :
+                barrierpairs = mazesolver.generaterandombarrier(xsize, ysize, 0, 0, xsize-1, ysize-1, int(xsize*ysize*0.3))
+            runtest(xsize, ysize, barrierpairs, msg)
+        print(out.getvalue().splitlines()[-1])
+
+if __name__=="__main__":
+    test()
@@ -0,0 +1,241 @@
+#
+#   clearance.py -- obstacle distance map, so one probed grid serves every NPC width
+#
+#   pathbuildutils.lsl checks paths and cells against the character's
+#   width. The Python solvers only know one barrier bit per cell, so
+#   each NPC size needs its own probing pass over the same ground.
+#
+#   ClearanceMap keeps one grid of probe results for all widths, and
+#   beside it the distance from each cell center to the nearest cell
+#   known to be blocked. Each newly found barrier lowers the distances
+#   around it, one whole-array operation over a window. rebuild does
+#   the full transform from the barrier grid, row pass then column pass.
+#
+#   A cell is usable with a minimum clearance r, in cells, if no blocked
+#   cell's edge is within r of its center. r = 0 is a plain barrier
+#   test. Before answering, the cells that could be too close are
+#   probed, nearest first, stopping at the first barrier. Those probes
+#   are kept, so a wide NPC mostly runs on what narrow ones probed.
+#
+#   mazesolveclearance and AStarClearanceSearch are mazesolve and
+#   AStarSearch with a minimum clearance, on a shared ClearanceMap.
+#
+import math
+import random
+import time
+import contextlib
+import io
+import numpy
+
+import astar
+import mazesolver
+
+UNKNOWN = 0                                     # same encoding as AStarGraph.barrierarray
+BLOCKED = 1
+CLEAR = -1
+
+def clearancefor(width, cellsize) :
+    """
+    Minimum clearance, in cells, for a character of this width.
+    Cell size is normally the narrowest character's width, which needs none.
+    """
+    return max(0.0, (width / cellsize - 1.0) * 0.5)
+
+#
+#   class ClearanceMap -- shared probe results and obstacle distances
+#
+class ClearanceMap(object) :
+
+    def __init__(self, xsize, ysize, checkbarrier, maxclearance=4.0) :
+        self.xsize = xsize
+        self.ysize = ysize
+        self.checkbarrier = checkbarrier        # the real, expensive probe
+        self.maxclearance = maxclearance        # distances are exact up to this, beyond it "far"
+        self.radius = int(math.ceil(maxclearance + 0.5))    # window each barrier updates
+        self.cells = numpy.full((xsize, ysize), UNKNOWN, dtype=numpy.int8)
+        self.dist = numpy.full((xsize, ysize), numpy.inf)   # to nearest known barrier center, cells
+        self.probes = 0                         # real probes made
+        self.lookups = 0                        # probes answered from the map
+        self.footprints = {}                    # minclearance -> [(dx, dy)], nearest first
+
+    def probe(self, x, y) :
+        """
+        Barrier test, probing only the first time
+        """
+        v = self.cells[x][y]
+        if v != UNKNOWN :
+            self.lookups += 1
+            return v == BLOCKED
+        self.probes += 1
+        barrier = bool(self.checkbarrier(x, y))
+        self.cells[x][y] = BLOCKED if barrier else CLEAR
+        if barrier :
+            self.addbarrier(x, y)
+        return barrier
+
+    def addbarrier(self, x, y) :
+        """
+        Lower distances within the window around a new barrier
+        """
+        r = self.radius
+        (x0, x1) = (max(x - r, 0), min(x + r + 1, self.xsize))
+        (y0, y1) = (max(y - r, 0), min(y + r + 1, self.ysize))
+        dx = numpy.arange(x0, x1) - x
+        dy = numpy.arange(y0, y1) - y
+        d = numpy.hypot(dx[:,None], dy[None,:])
+        d[d > self.maxclearance + 0.5] = numpy.inf
+        numpy.minimum(self.dist[x0:x1, y0:y1], d, out=self.dist[x0:x1, y0:y1])
+
+    def rebuild(self) :
+        """
+        Whole distance transform from the barrier grid. Exact Euclidean,
+        separable: distance along each column, then combined across columns.
+        """
+        blocked = self.cells == BLOCKED
+        big = self.xsize + self.ysize
+        iy = numpy.arange(self.ysize)[None,:]
+        last = numpy.maximum.accumulate(numpy.where(blocked, iy, -big), axis=1)     # nearest barrier at or below y
+        nxt = numpy.minimum.accumulate(numpy.where(blocked, iy, 2*big)[:,::-1], axis=1)[:,::-1]    # at or above
+        g2 = numpy.minimum(iy - last, nxt - iy).astype(numpy.float64) ** 2
+        d2 = g2.copy()
+        for dx in range(1, self.radius + 1) :   # only columns near enough can matter
+            numpy.minimum(d2[dx:], g2[:-dx] + dx*dx, out=d2[dx:])
+            numpy.minimum(d2[:-dx], g2[dx:] + dx*dx, out=d2[:-dx])
+        dist = numpy.sqrt(d2)
+        dist[dist > self.maxclearance + 0.5] = numpy.inf
+        self.dist = dist
+
+    def footprint(self, minclearance) :
+        """
+        Offsets of cells whose barrier would be too close, nearest first
+        """
+        offsets = self.footprints.get(minclearance)
+        if offsets is None :
+            r = int(math.ceil(minclearance + 0.5))
+            offsets = [(dx, dy) for dx in range(-r, r+1) for dy in range(-r, r+1) if math.hypot(dx, dy) < minclearance + 0.5]
+            offsets.sort(key=lambda d : d[0]*d[0] + d[1]*d[1])
+            self.footprints[minclearance] = offsets
+        return offsets
+
+    def isclear(self, x, y, minclearance) :
+        """
+        Is (x,y) usable with this clearance? Probes what it must.
+        """
+        if minclearance > self.maxclearance :
+            raise ValueError("Clearance %1.2f beyond map's maximum %1.2f" % (minclearance, self.maxclearance))
+        if self.dist[x][y] < minclearance + 0.5 :
+            self.lookups += 1
+            return False                        # known too close
+        for (dx, dy) in self.footprint(minclearance) :
+            (x2, y2) = (x + dx, y + dy)
+            if 0 <= x2 < self.xsize and 0 <= y2 < self.ysize and self.probe(x2, y2) :
+                return False
+        return True
+
+    def clearance(self, x, y) :
+        """
+        Clearance of (x,y) from barriers found so far, cells. inf if none near.
+        """
+        return self.dist[x][y] - 0.5
+
+    def astarbarrierfn(self, minclearance) :
+        """
+        checkbarrier(x, y) for AStarSearch
+        """
+        return lambda x, y : not self.isclear(x, y, minclearance)
+
+    def mazebarrierfn(self, minclearance) :
+        """
+        barrierfn(prevx, prevy, x, y) for mazesolve
+        """
+        return lambda prevx, prevy, x, y : not self.isclear(x, y, minclearance)
+
+def mazesolveclearance(startx, starty, endx, endy, cmap, minclearance) :
+    """
+    mazesolve, keeping minclearance cells from barriers. Call mazeinit first, as for mazesolve.
+    """
+    return mazesolver.mazesolve(startx, starty, endx, endy, cmap.mazebarrierfn(minclearance))
+
+def AStarClearanceSearch(start, end, graph, cmap, minclearance) :
+    """
+    AStarSearch, keeping minclearance cells from barriers
+    """
+    return astar.AStarSearch(start, end, graph, cmap.astarbarrierfn(minclearance))
+
+#
+#   Test-only code
+#
+def bruteclearance(barriers, x, y) :
+    return min((math.hypot(x - bx, y - by) for (bx, by) in barriers), default=numpy.inf) - 0.5
+
+def checkroute(points, barriers, minclearance) :
+    for (x, y) in points :
+        assert(bruteclearance(barriers, x, y) >= minclearance)
+
+def runtest(xsize, ysize, barrierpairs, start, end, clearances, msg) :
+    barriers = set(barrierpairs)
+    probes = [0]
+    def checkbarrier(ix, iy) :
+        probes[0] += 1
+        return (ix, iy) in barriers
+    #   Zero clearance is the plain solver, same route
+    with contextlib.redirect_stdout(io.StringIO()) :
+        mazesolver.mazeinit(xsize, ysize)
+        plain = mazesolver.mazesolve(start[0], start[1], end[0], end[1], lambda px, py, x, y : (x, y) in barriers)
+        mazesolver.mazeinit(xsize, ysize)
+        same = mazesolveclearance(start[0], start[1], end[0], end[1], ClearanceMap(xsize, ysize, checkbarrier), 0)
+    assert(plain == same)
+    #   Each width on its own map, then all widths on one shared map
+    separate = 0
+    results = {}
+    for minclearance in clearances :
+        probes[0] = 0
+        cmap = ClearanceMap(xsize, ysize, checkbarrier)
+        try :
+            results[minclearance] = AStarClearanceSearch(start, end, astar.AStarGraph(xsize, ysize), cmap, minclearance)
+        except RuntimeError :
+            results[minclearance] = None
+        separate += probes[0]
+    probes[0] = 0
+    shared = ClearanceMap(xsize, ysize, checkbarrier)
+    for minclearance in clearances :
+        try :
+            path = AStarClearanceSearch(start, end, astar.AStarGraph(xsize, ysize), shared, minclearance)
+        except RuntimeError :
+            path = None
+        assert(path == results[minclearance])
+        if path :
+            checkroute(path, barriers, minclearance)
+        with contextlib.redirect_stdout(io.StringIO()) :
+            mazesolver.mazeinit(xsize, ysize)
+            route = mazesolveclearance(start[0], start[1], end[0], end[1], shared, minclearance)
+        checkroute([(mazesolver.mazepathx(v), mazesolver.mazepathy(v)) for v in route], barriers, minclearance)
+        assert(bool(route) == bool(path))
+    #   Incremental distances match the whole transform, and brute force
+    incremental = shared.dist.copy()
+    shared.rebuild()
+    assert(numpy.allclose(incremental, shared.dist))
+    known = [(x, y) for x in range(xsize) for y in range(ysize) if shared.cells[x][y] == BLOCKED]
+    for (x, y) in random.sample([(x, y) for x in range(xsize) for y in range(ysize)], 200) :
+        expected = bruteclearance(known, x, y)
+        assert(shared.clearance(x, y) == expected or (expected > shared.maxclearance and shared.clearance(x, y) == numpy.inf))
+    print("%s: clearances %s, path lengths %s. Probes, separate maps per width: %d, one shared map: %d." % (msg, clearances,
+        [len(results[c]) if results[c] else None for c in clearances], separate, probes[0]))
+
+def test() :
+    random.seed(46)
+    #   Wall across the middle with doors 1, 3 and 5 cells wide
+    wall = [(x, 15) for x in range(30) if not (3 <= x < 4 or 12 <= x < 15 or 22 <= x < 27)]
+    runtest(30, 30, wall, (8, 5), (8, 25), [0, 1, 1.5, 2, 3], "Doors of three widths")     # A* costs are 8 bits, so short routes
+    with contextlib.redirect_stdout(io.StringIO()) :
+        clutter = mazesolver.generaterandombarrier(24, 24, 2, 2, 21, 21, 50)
+    runtest(24, 24, clutter, (2, 2), (21, 21), [0, 0.5, 1, 1.5], "Random clutter")
+    #   Transform speed, whole grid
+    cmap = ClearanceMap(1024, 1024, lambda x, y : False)
+    cmap.cells[numpy.random.default_rng(46).random((1024, 1024)) < 0.02] = BLOCKED
+    t0 = time.perf_counter()
+    cmap.rebuild()
+    print("Distance transform, 1024x1024, %d barriers: %1.3fs." % (numpy.count_nonzero(cmap.cells == BLOCKED), time.perf_counter() - t0))
+
+if __name__=="__main__":
+    test()
@@ -0,0 +1,232 @@
+#
+#   corridor.py -- repair search restricted to a corridor around a prior path
+#
+#   pathbuildutils.lsl gets a route from llGetStaticPath, and only calls
+#   the maze solver for segments that turn out to be blocked. Most of
+#   those repairs are local, something parked across the path. But the
+#   solvers search the whole rectangle.
+#
+#   Here the caller gives the prior path, as a polyline of cells, and a
+#   corridor width. Cells outside the corridor are not probed. Storage
+#   is sparse.
+#
+#   The search is A*, keeping its state in dicts, with no route length
+#   limit. A move that would leave the corridor is deferred, not probed.
+#   The search stays in the corridor until a deferred move is the best
+#   thing on its open list, which happens when the corridor is blocked.
+#   Then the corridor is widened, the deferred moves now inside it are
+#   let in, and the search carries on with its open list, g costs and
+#   closed set as they were, so no cell is expanded twice and each
+#   widening only costs its new cells. The search order is A*'s, with
+#   ties going to corridor cells, so routes are shortest, and the
+#   neighbors along the sides of the corridor which plain A* would
+#   probe never are.
+#
+#   There is no maze solver mode. The maze solver follows walls, and
+#   stopping it at the corridor edge only ever gave the whole grid's
+#   search, so a corridor bounded nothing for it.
+#
+import math
+import heapq
+import random
+import contextlib
+import io
+
+import astar
+import mazesolver
+import astaranytime
+
+def segmentdistance(px, py, x0, y0, x1, y1) :
+    """
+    Distance from point to line segment
+    """
+    dx = x1 - x0
+    dy = y1 - y0
+    lensq = dx*dx + dy*dy
+    if lensq == 0 :
+        return math.sqrt((px-x0)**2 + (py-y0)**2)
+    t = max(0.0, min(1.0, ((px-x0)*dx + (py-y0)*dy) / lensq))
+    return math.sqrt((px - (x0 + t*dx))**2 + (py - (y0 + t*dy))**2)
+
+#
+#   class Corridor -- cells within width of a polyline
+#
+class Corridor(object) :
+
+    def __init__(self, polyline, width, xsize, ysize) :
+        self.polyline = polyline                # [(x,y), ...] cells
+        self.width = width                      # cells either side of the line
+        self.xsize = xsize
+        self.ysize = ysize
+        self.cells = set()
+        if len(polyline) == 1 :
+            polyline = polyline + polyline
+        for ((x0, y0), (x1, y1)) in zip(polyline, polyline[1:]) :
+            w = int(math.ceil(width))
+            for x in range(max(min(x0, x1) - w, 0), min(max(x0, x1) + w + 1, xsize)) :
+                for y in range(max(min(y0, y1) - w, 0), min(max(y0, y1) + w + 1, ysize)) :
+                    if segmentdistance(x, y, x0, y0, x1, y1) <= width :
+                        self.cells.add((x, y))
+
+    def contains(self, x, y) :
+        return (x, y) in self.cells
+
+    def area(self) :
+        return len(self.cells)
+
+    def coversgrid(self) :
+        return len(self.cells) >= self.xsize * self.ysize
+
+class RepairResult(object) :
+    def __init__(self, route, width, attempts, probes, expansions, area) :
+        self.route = route                      # [(x,y), ...] start first, [] if none
+        self.width = width                      # corridor width that worked, or the last tried
+        self.attempts = attempts                # corridors searched
+        self.probes = probes                    # real barrier probes, all attempts
+        self.expansions = expansions            # cells expanded, all attempts
+        self.area = area                        # cells in final corridor
+
+    def __repr__(self) :
+        return "RepairResult(%d points, width %s, %d attempts, %d probes, %d expansions, corridor %d cells)" % (
+            len(self.route), self.width, self.attempts, self.probes, self.expansions, self.area)
+
+#
+#   class CorridorSearch -- A* which can be resumed in a wider corridor
+#
+class CorridorSearch(object) :
+
+    def __init__(self, start, end, xsize, ysize, barrierfn) :
+        self.start = start
+        self.end = end
+        self.xsize = xsize
+        self.ysize = ysize
+        self.barrierfn = barrierfn              # (prevx, prevy, x, y), as for mazesolve
+        self.probed = {}                        # (x,y) -> barrier
+        self.g = { start : 0 }
+        self.camefrom = {}
+        self.closed = set()
+        self.deferred = {}                      # (x,y) -> (g, from), moves out of the corridor so far
+        self.deferredlist = []                  # (f, -g, tiebreak, pos), heap of deferred moves
+        self.tiebreak = 0
+        self.openlist = [(astaranytime.manhattan(start, end), 0, 0, start)]   # (f, -g, tiebreak, pos)
+        self.expansions = 0
+
+    def probes(self) :
+        return len(self.probed)
+
+    def relax(self, prev, pos, candidateg) :
+        """
+        Offer a cost for pos, reached from prev. Probes pos if new.
+        """
+        if candidateg >= self.g.get(pos, candidateg + 1) :
+            return                              # no better than before
+        barrier = self.probed.get(pos)
+        if barrier is None :
+            barrier = bool(self.barrierfn(prev[0], prev[1], pos[0], pos[1]))
+            self.probed[pos] = barrier
+        if barrier :
+            return
+        self.g[pos] = candidateg
+        self.camefrom[pos] = prev
+        self.closed.discard(pos)                # reopened if it was done, the wider corridor gave a shortcut
+        self.tiebreak += 1
+        heapq.heappush(self.openlist, (candidateg + astaranytime.manhattan(pos, self.end), -candidateg, self.tiebreak, pos))
+
+    def search(self, corridor) :
+        """
+        Carry on the search within corridor. Returns the route, None if the
+        search needs to leave the corridor, or [] if there is no route. After
+        None, resume it in a wider corridor.
+        """
+        for pos in [pos for pos in self.deferred if corridor.contains(pos[0], pos[1])] :
+            (candidateg, prev) = self.deferred.pop(pos)
+            self.relax(prev, pos, candidateg)
+        while self.openlist :
+            while self.deferredlist and self.deferred.get(self.deferredlist[0][3], (None,))[0] != -self.deferredlist[0][1] :
+                heapq.heappop(self.deferredlist)    # stale
+            if self.deferredlist and self.deferredlist[0][:2] < self.openlist[0][:2] :
+                return None                     # A* would step outside now
+            (_, negg, _, current) = heapq.heappop(self.openlist)
+            if -negg != self.g[current] or current in self.closed :
+                continue                        # stale entry
+            if current == self.end :
+                path = [current]
+                while current != self.start :
+                    current = self.camefrom[current]
+                    path.append(current)
+                path.reverse()
+                return path
+            self.closed.add(current)
+            self.expansions += 1
+            for (dx, dy) in astar.AStarGraph.ALLOWEDMOVES :
+                neighbor = (current[0] + dx, current[1] + dy)
+                if neighbor[0] < 0 or neighbor[0] >= self.xsize or neighbor[1] < 0 or neighbor[1] >= self.ysize :
+                    continue
+                candidateg = -negg + 1
+                if not corridor.contains(neighbor[0], neighbor[1]) :
+                    if candidateg < self.deferred.get(neighbor, (candidateg + 1,))[0] and candidateg < self.g.get(neighbor, candidateg + 1) :
+                        self.deferred[neighbor] = (candidateg, current)     # let in if the corridor widens
+                        self.tiebreak += 1
+                        heapq.heappush(self.deferredlist, (candidateg + astaranytime.manhattan(neighbor, self.end),
+                            -candidateg, self.tiebreak, neighbor))
+                    continue
+                self.relax(current, neighbor, candidateg)
+        return None if self.deferred else []
+
+def repairsearch(start, end, polyline, width, xsize, ysize, barrierfn, widen=2.0) :
+    """
+    Search within width of polyline, widening by the widen factor when blocked.
+    barrierfn is (prevx, prevy, x, y), as for mazesolve.
+    """
+    corridor = Corridor(polyline, width, xsize, ysize)
+    if not corridor.contains(start[0], start[1]) or not corridor.contains(end[0], end[1]) :
+        raise ValueError("Start and end must be inside the corridor")
+    search = CorridorSearch(start, end, xsize, ysize, barrierfn)
+    attempts = 0
+    while True :
+        attempts += 1
+        route = search.search(corridor)
+        if route is not None :
+            return RepairResult(route, width, attempts, search.probes(), search.expansions, corridor.area())
+        width = width * widen
+        corridor = Corridor(polyline, width, xsize, ysize)
+
+#
+#   Test-only code
+#
+def runtest(xsize, ysize, polyline, barrierpairs, width, msg) :
+    """
+    Corridor repair against a whole grid search. Returns both results.
+    """
+    barriers = set(barrierpairs)
+    def barrierfn(prevx, prevy, ix, iy) :
+        return (ix, iy) in barriers
+    (start, end) = (polyline[0], polyline[-1])
+    result = repairsearch(start, end, polyline, width, xsize, ysize, barrierfn)
+    for ((x0, y0), (x1, y1)) in zip(result.route, result.route[1:]) :
+        assert(abs(x1 - x0) + abs(y1 - y0) == 1 and (x1, y1) not in barriers)
+    whole = repairsearch(start, end, [start, end], xsize + ysize, xsize, ysize, barrierfn)
+    assert(bool(whole.route) == bool(result.route))
+    assert(len(whole.route) == len(result.route))  # both shortest
+    print("%s: corridor %s. Whole grid: %d probes, %d expansions, %d points." %
+        (msg, result, whole.probes, whole.expansions, len(whole.route)))
+    return (result, whole)
+
+def test() :
+    random.seed(40)
+    polyline = [(5, 5), (150, 20), (180, 190)]
+    runtest(200, 200, polyline, [], 2, "Clear path")
+    parked = [(x, y) for x in range(70, 76) for y in range(8, 16)]       # across the first leg
+    (result, whole) = runtest(200, 200, polyline, parked, 2, "Parked across path")
+    assert(result.probes <= whole.probes and result.expansions <= whole.expansions)     # local repair stays local
+    wall = [(x, 120) for x in range(100, 200)]                          # needs a long detour
+    runtest(200, 200, polyline, parked + wall, 2, "Wall across path")
+    boxed = [(x, y) for x in range(176, 185) for y in range(186, 195) if max(abs(x - 180), abs(y - 190)) == 4]
+    (result, _) = runtest(200, 200, polyline, boxed, 2, "End boxed in")
+    assert(result.route == [])
+    with contextlib.redirect_stdout(io.StringIO()) :
+        clutter = mazesolver.generaterandombarrier(200, 200, 5, 5, 180, 190, 4000)
+    runtest(200, 200, polyline, [p for p in clutter if p not in polyline], 3, "Clutter")
+
+if __name__=="__main__":
+    test()
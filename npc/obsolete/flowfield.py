@@ -0,0 +1,194 @@
+#
+#   flowfield.py -- shared distance fields for NPCs with common goals
+#
+#   Patrol NPCs keep walking to the same few waypoints. Rather than run
+#   a separate search from each start, compute one breadth-first distance
+#   field outward from the goal, and keep it. Any start cell then gets
+#   its route by walking downhill, one step closer each move, in time
+#   proportional to the path length.
+#
+#   Fields are kept in an LRU cache keyed by goal and grid version.
+#   Bump the grid version when the barrier map changes.
+#
+#   Moves and barrier probes are as in astar.py: 4-way moves, and
+#   checkbarrier(x, y) returns True for an occupied cell.
+#
+import collections
+import random
+import time
+import numpy
+
+import astar
+import mazesolver
+
+UNREACHED = -1                                  # distance for cells not reached from goal
+
+#
+#   class DistanceField -- steps to goal for every reachable cell
+#
+class DistanceField(object) :
+
+    def __init__(self, xsize, ysize, goal, checkbarrier) :
+        self.xsize = xsize
+        self.ysize = ysize
+        self.goal = goal
+        self.dist = numpy.full((xsize, ysize), UNREACHED, dtype=numpy.int32)
+        self.probes = 0                         # barrier tests made building this
+        self.build(checkbarrier)
+
+    def build(self, checkbarrier) :
+        """
+        Breadth-first search outward from the goal. Each cell is probed once.
+        """
+        (gx, gy) = self.goal
+        dist = self.dist
+        examined = numpy.zeros((self.xsize, self.ysize), dtype=numpy.bool_)
+        dist[gx][gy] = 0
+        examined[gx][gy] = True                 # goal assumed clear, as in mazesolve
+        todo = collections.deque([self.goal])
+        while todo :
+            (x, y) = todo.popleft()
+            d = dist[x][y] + 1
+            for (dx, dy) in astar.AStarGraph.ALLOWEDMOVES :
+                x2 = x + dx
+                y2 = y + dy
+                if x2 < 0 or x2 >= self.xsize or y2 < 0 or y2 >= self.ysize :
+                    continue
+                if examined[x2][y2] :
+                    continue
+                examined[x2][y2] = True
+                self.probes += 1
+                if checkbarrier(x2, y2) :
+                    continue                    # blocked, stays unreached
+                dist[x2][y2] = d
+                todo.append((x2, y2))
+
+    def reachable(self, start) :
+        return self.dist[start[0]][start[1]] != UNREACHED
+
+    def route(self, start) :
+        """
+        Route from start to goal, start first, like AStarSearch returns.
+
+        Each step moves to a neighbor one closer to the goal, so this is a shortest path.
+        """
+        (x, y) = start
+        d = self.dist[x][y]
+        if d == UNREACHED :
+            raise RuntimeError("Goal not reachable from " + str(start))
+        path = [start]
+        while d > 0 :
+            for (dx, dy) in astar.AStarGraph.ALLOWEDMOVES :
+                x2 = x + dx
+                y2 = y + dy
+                if 0 <= x2 < self.xsize and 0 <= y2 < self.ysize and self.dist[x2][y2] == d - 1 :
+                    break
+            else :
+                raise RuntimeError("Distance field damaged at " + str((x, y)))     # unlikely
+            (x, y) = (x2, y2)
+            d = d - 1
+            path.append((x, y))
+        return path
+
+    def mazeroute(self, start) :
+        """
+        Route in the packed form mazesolve returns
+        """
+        return [mazesolver.mazepathval(x, y) for (x, y) in self.route(start)]
+
+#
+#   class FlowFieldCache -- LRU cache of distance fields
+#
+class FlowFieldCache(object) :
+
+    def __init__(self, maxfields=16) :
+        self.maxfields = maxfields              # fields kept
+        self.fields = collections.OrderedDict() # (goal, gridversion) -> DistanceField
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def getfield(self, goal, gridversion, xsize, ysize, checkbarrier) :
+        """
+        Get the field for this goal, building it if needed
+        """
+        key = (goal, gridversion)
+        field = self.fields.get(key)
+        if field is not None :
+            self.fields.move_to_end(key)        # most recently used
+            self.hits += 1
+            return field
+        self.misses += 1
+        field = DistanceField(xsize, ysize, goal, checkbarrier)
+        self.fields[key] = field
+        while len(self.fields) > self.maxfields :
+            self.fields.popitem(last=False)     # least recently used
+            self.evictions += 1
+        return field
+
+    def route(self, start, goal, gridversion, xsize, ysize, checkbarrier) :
+        """
+        Drop-in for AStarSearch(start, goal, AStarGraph(xsize, ysize), checkbarrier)
+        """
+        return self.getfield(goal, gridversion, xsize, ysize, checkbarrier).route(start)
+
+    def invalidate(self, gridversion=None) :
+        """
+        Drop fields for one grid version, or all of them
+        """
+        for key in list(self.fields.keys()) :
+            if gridversion is None or key[1] == gridversion :
+                del self.fields[key]
+
+    def hitrate(self) :
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+#
+#   Test-only code
+#
+def runtest(xsize, ysize, barrierpairs, goals, nstarts, msg) :
+    """
+    Many NPCs, few goals. Compare one A* per request against one field per goal.
+    """
+    barriers = set(barrierpairs)
+    probes = [0]
+    def checkbarrier(ix, iy) :
+        probes[0] += 1
+        return (ix, iy) in barriers
+    free = [(x, y) for x in range(xsize) for y in range(ysize) if (x, y) not in barriers]
+    requests = [(random.choice(free), random.choice(goals)) for _ in range(nstarts)]
+    t0 = time.perf_counter()
+    astarresults = []
+    for (start, goal) in requests :
+        try :
+            astarresults.append(len(astar.AStarSearch(start, goal, astar.AStarGraph(xsize, ysize), checkbarrier)))
+        except RuntimeError :
+            astarresults.append(0)
+    astartime = time.perf_counter() - t0
+    astarprobes = probes[0]
+    probes[0] = 0
+    cache = FlowFieldCache()
+    t0 = time.perf_counter()
+    fieldresults = []
+    for (start, goal) in requests :
+        try :
+            fieldresults.append(len(cache.route(start, goal, 0, xsize, ysize, checkbarrier)))
+        except RuntimeError :
+            fieldresults.append(0)
+    fieldtime = time.perf_counter() - t0
+    print("%s: %d requests, %d goals. A*: %1.3fs, %d probes. Fields: %1.3fs, %d probes, hit rate %1.2f" %
+        (msg, nstarts, len(goals), astartime, astarprobes, fieldtime, probes[0], cache.hitrate()))
+    for ((start, goal), astarlen, fieldlen) in zip(requests, astarresults, fieldresults) :
+        steps = astar.bfsdistance(xsize, ysize, start, goal, barriers)
+        assert(fieldlen == (steps + 1 if steps is not None else 0))   # fields give shortest paths
+        assert(astarlen == 0 or fieldlen <= astarlen)   # A* fails routes too long for its costs
+
+def test() :
+    runtest(12, 12, mazesolver.BARRIERDEF1 + mazesolver.BARRIERCENTER, [(11,11), (0,11)], 50, "Barrier in center")
+    runtest(12, 12, mazesolver.BARRIERFAIL1, [(11,11)], 50, "Fail 1")
+    barriers = [(x, 15) for x in range(2, 30)] + [(15, y) for y in range(3, 28)]
+    runtest(32, 32, barriers, [(31,31), (0,31), (31,0)], 200, "Cross 32x32")
+
+if __name__=="__main__":
+    test()
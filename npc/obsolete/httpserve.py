@@ -0,0 +1,138 @@
+#
+#   httpserve.py -- minimal asyncio HTTP/1.1 request handling
+#
+#   Just enough HTTP for the local test services. llHTTPRequest sends
+#   simple POSTs with a Content-Length, so no chunking, no TLS.
+#   simheightrecorder/terrainserver.py uses this too.
+#
+import asyncio
+import json
+import time
+import traceback
+
+MAXBODY = 1000000                               # largest request body accepted
+MAXHEADERS = 100                                # max header lines
+
+HTTPREASONS = { 200 : "OK", 400 : "Bad Request", 403 : "Forbidden", 404 : "Not Found",
+    405 : "Method Not Allowed", 413 : "Payload Too Large", 500 : "Internal Server Error",
+    503 : "Service Unavailable" }
+
+class HTTPError(Exception) :
+    """
+    Becomes an HTTP error status in the reply.
+    """
+    def __init__(self, status, msg, headers=None) :
+        Exception.__init__(self, msg)
+        self.status = status
+        self.headers = headers                  # extra reply headers, if any
+        self.starttime = None                   # set if raised reading the request
+
+class HTTPRequest(object) :
+    def __init__(self, method, target, version, headers, body, starttime) :
+        self.method = method
+        self.target = target
+        self.version = version
+        self.headers = headers                  # lower case names
+        self.body = body                        # bytes
+        self.starttime = starttime              # time.perf_counter() when the request line came in
+        self.keepalive = version == "HTTP/1.1" and headers.get("connection","").lower() != "close"
+
+async def readrequest(reader) :
+    """
+    Read one request. Returns None at clean end of connection.
+    """
+    requestline = await reader.readline()
+    if not requestline :
+        return None
+    t0 = time.perf_counter()
+    headers = {}
+    for _ in range(MAXHEADERS) :
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b"") :
+            break
+        (k, _, v) = line.decode("latin-1").partition(":")
+        headers[k.strip().lower()] = v.strip()
+    err = None
+    try :
+        (method, target, version) = requestline.decode("latin-1").split()
+    except ValueError :
+        err = HTTPError(400, "Bad request line")
+    if err is None :
+        try :
+            length = int(headers.get("content-length", "0") or 0)
+        except ValueError :
+            length = -1
+        if length < 0 :
+            err = HTTPError(400, "Bad Content-Length")
+        elif length > MAXBODY :
+            err = HTTPError(413, "Request too large")
+    if err is not None :
+        err.starttime = t0
+        raise err
+    body = await reader.readexactly(length) if length > 0 else b""
+    return HTTPRequest(method, target, version, headers, body, t0)
+
+async def writereply(writer, status, msg, keepalive, contenttype="text/plain; charset=utf-8", extraheaders=None) :
+    """
+    Send one reply. "msg" is a str or bytes.
+    """
+    data = msg.encode("utf-8") if isinstance(msg, str) else msg
+    hdr = "HTTP/1.1 %d %s\r\nContent-Type: %s\r\nContent-Length: %d\r\n" % (
+        status, HTTPREASONS.get(status, ""), contenttype, len(data))
+    for (k, v) in (extraheaders or {}).items() :
+        hdr += "%s: %s\r\n" % (k, v)
+    hdr += "Connection: %s\r\n\r\n" % ("keep-alive" if keepalive else "close",)
+    writer.write(hdr.encode("latin-1") + data)
+    await writer.drain()
+
+async def serveconnection(reader, writer, handler, onreply=None) :
+    """
+    Serve requests on one connection until it closes.
+
+    "handler" is an async fn taking an HTTPRequest and returning (status, body),
+    (status, body, contenttype) or (status, body, contenttype, extraheaders).
+    It may raise HTTPError. Any other exception is a 500 reply.
+
+    "onreply", if given, is called with (status, secs) after each reply,
+    secs being from the request line to the reply.
+    """
+    try :
+        while True :
+            try :
+                req = await readrequest(reader)
+            except HTTPError as err :
+                await writereply(writer, err.status, str(err), False, extraheaders=err.headers)
+                if onreply :
+                    onreply(err.status, time.perf_counter() - err.starttime)
+                break
+            if req is None :
+                break
+            try :
+                result = await handler(req)
+            except HTTPError as err :
+                result = (err.status, str(err), None, err.headers)
+            except Exception as err :
+                traceback.print_exc()
+                result = (500, "Internal error: %s" % (err,))
+            (status, body) = result[:2]
+            contenttype = result[2] if len(result) > 2 else None
+            extraheaders = result[3] if len(result) > 3 else None
+            if contenttype is None :
+                contenttype = "application/json" if isinstance(body, (dict, list)) else "text/plain; charset=utf-8"
+            if isinstance(body, (dict, list)) :
+                body = json.dumps(body)
+            await writereply(writer, status, body, req.keepalive, contenttype, extraheaders)
+            if onreply :
+                onreply(status, time.perf_counter() - req.starttime)
+            if not req.keepalive :
+                break
+    except (asyncio.IncompleteReadError, ConnectionError) :
+        pass                                    # client went away
+    finally :
+        writer.close()
+
+async def startserver(handler, host, port, onreply=None) :
+    """
+    Start an asyncio server calling "handler" for each request.
+    """
+    return await asyncio.start_server(lambda r, w : serveconnection(r, w, handler, onreply), host, port)
@@ -2,53 +2,618 @@
 #   Log checker for path planner logs.
 #
 import sys
+import os
 import re
+import glob
+import time
+import argparse
+import collections
+import json
+import tempfile
 
 #   Match these patterns in logs
+MAZETASK = "Path Maze solver task"              # cheap substring test before the regexps
 REMAZESTART = re.compile(r".*Path Maze solver task: Request to maze solver:.*\"pathid\":(\d+),.*\"segmentid\":(\d+)")
 ####REMAZEEND = re.compile(r".*Path Maze solver task: Maze solver finished task\, pathid (\d+)\, segment (\d+)")
-REMAZEEND = re.compile(r".*Path Maze solver task: Maze solver finished task\, pathid (\d+)\, segment (\d+)")
+REMAZEEND = re.compile(r".*Path Maze solver task: Maze solver finished(?: task)?\, pathid (\d+)\, seg(?:ment)? (\d+)")
+#   Log line prefix from debugrelay.lsl: "[HH:MM:SS] (object name) ". logcollector.py adds the date.
+RELINEPREFIX = re.compile(r"\[(?:(\d\d\d\d)-(\d\d)-(\d\d) )?(\d\d):(\d\d):(\d\d(?:\.\d*)?)\]\s*(?:\(([^)]*)\))?")
+
+#   Wall following debug lines. These come from DEBUGPRINT1 as well as pathMsg, so may lack the task prefix.
+REMAZEREQUEST = re.compile(r"Request to maze solver: (\{.*\})")
+REFOLLOWSTART = re.compile(r"Starting wall follow at (\d+),(\d+),\s+direction (\d+), mdist = (-?\d+)")
+REFOLLOWSTEP = re.compile(r"Path ([AB]): (?:[-\d.e]+,)*?(-?\d+),(-?\d+),[-\d.e]+,(\d+)\s*$")
+REFOLLOWSTUCK = re.compile(r"Path ([AB]) stuck")
+REFOLLOWUSEFUL = re.compile(r"Path ([AB]) (?:useful|reached goal)")
+REFOLLOWFINISHED = re.compile(r"Finished wall following at \((\d+),(\d+)\)")
+RECHATPREFIX = re.compile(r"\[[^\]]*\]\s*([^:(]+?):")   # "[HH:MM:SS] Object name: msg", as llOwnerSay logs
+WALLFOLLOWMARKERS = ("wall follow", "Path A", "Path B", "Tested cell", "Collinear pt", "Dup pt.")
+
+SECSPERDAY = 24*60*60
+
+def linetime(line) :
+    """
+    Time of day in seconds from the log line prefix, or None
+    """
+    match = RELINEPREFIX.match(line)
+    if not match :
+        return None
+    return int(match.group(4))*3600 + int(match.group(5))*60 + float(match.group(6))
+
+def timeofday(t) :
+    """
+    Local time of day in seconds for a time.time() value, as linetime gives
+    """
+    lt = time.localtime(t)
+    return lt.tm_hour*3600 + lt.tm_min*60 + lt.tm_sec + (t % 1.0)
+
+def lineobject(line) :
+    """
+    Object name from the log line prefix, or None
+    """
+    match = RELINEPREFIX.match(line)
+    if not match :
+        return None
+    return match.group(7)
+
+def linespeaker(line) :
+    """
+    Object name from the debugrelay prefix, or else from the chat prefix
+    llOwnerSay output has, as DEBUGPRINT1 lines do. None if neither.
+    """
+    obj = lineobject(line)
+    if obj is None :
+        match = RECHATPREFIX.match(line)
+        obj = match.group(1).strip() if match else None
+    return obj
 
 #
-#   class logdata -- analyze log 
+#   class logdata -- analyze log
+#
+#   Pairs up maze solver starts and ends as lines come in, so this
+#   can be fed a file or a live stream.
 #
 class logdata :
-    
-    def __init__(self) :
+
+    def __init__(self, verbose=True, maxdurations=None) :
         self.pathid = None                      # current path ID
         self.segid = None                       # current segid
-        
+        self.verbose = verbose                  # print each start and end
+        self.openrequests = {}                  # (object, pathid, segid) -> start time
+        self.durations = collections.deque(maxlen=maxdurations)    # solve times, secs, the most recent maxdurations if set
+        self.matched = 0                        # starts and ends paired, all time
+        self.unmatched = 0                      # ends with no start
+
     def readlog(self, fname) :
         with open(fname,"r") as infile :
             for line in infile :
                 self.doline(line)
-                
-    def doline(self, line) :
-        match1 = REMAZESTART.match(line)        # check for request start 
+
+    def doline(self, line, now=None) :
+        """
+        Process one line. Solves are timed by the time in the line. "now" is
+        the time.time() the line arrived, used only if the line has no time.
+        """
+        if MAZETASK not in line :               # fast reject of most lines
+            return
+        match1 = REMAZESTART.match(line)        # check for request start
         if match1 :
-            print("Start: %s %s" % (match1.group(1), match1.group(2)))
+            self.pathid = int(match1.group(1))
+            self.segid = int(match1.group(2))
+            if self.verbose :
+                print("Start: %s %s" % (match1.group(1), match1.group(2)))
+            self.requeststart((lineobject(line), self.pathid, self.segid), self.linetimeor(line, now))
+            return
         match2 = REMAZEEND.match(line)          # check for request end
         if match2 :
-            print("End:   %s %s" % (match2.group(1), match2.group(2)))
-            
+            if self.verbose :
+                print("End:   %s %s" % (match2.group(1), match2.group(2)))
+            self.requestend((lineobject(line), int(match2.group(1)), int(match2.group(2))), self.linetimeor(line, now))
+
+    def linetimeor(self, line, now) :
+        t = linetime(line)
+        if t is None and now is not None :
+            t = timeofday(now)
+        return t
+
+    def requeststart(self, key, t) :
+        self.openrequests[key] = t
+
+    def requestend(self, key, t) :
+        starttime = self.openrequests.pop(key, None)
+        if starttime is None or t is None :
+            self.unmatched += 1
+            return
+        duration = t - starttime
+        if duration < 0 :                       # log times are time of day, so wrap at midnight
+            duration += SECSPERDAY
+        self.durations.append(duration)
+        self.matched += 1
+        self.requestfinished(key, duration)
+
+    def requestfinished(self, key, duration) :
+        """
+        Called for each matched start and end. Override to collect more.
+        """
+        pass
+
+    def percentile(self, pct) :
+        return self.percentiles([pct])[0]
+
+    def percentiles(self, pcts) :
+        """
+        Several percentiles of solve time, sorting once
+        """
+        if len(self.durations) == 0 :
+            return [0.0 for pct in pcts]
+        vals = sorted(self.durations)
+        return [vals[min(len(vals)-1, int(len(vals)*pct/100.0))] for pct in pcts]
+
+    def summary(self) :
+        """
+        Solve time statistics
+        """
+        n = len(self.durations)
+        if n == 0 :
+            return "No completed maze solves. %d in progress, %d unmatched." % (len(self.openrequests), self.unmatched)
+        (p50, p95, p99) = self.percentiles([50, 95, 99])
+        window = "" if n == self.matched else " (times over last %d)" % (n,)
+        return ("%d maze solves%s, mean %1.2fs, p50 %1.2fs, p95 %1.2fs, p99 %1.2fs, max %1.2fs. %d in progress, %d unmatched." %
+            (self.matched, window, sum(self.durations)/n, p50, p95, p99, max(self.durations),
+            len(self.openrequests), self.unmatched))
+
+#
+#   class rollinglogdata -- logdata with statistics over a recent time window
+#
+class rollinglogdata(logdata) :
+
+    def __init__(self, window=60.0) :
+        logdata.__init__(self, verbose=False, maxdurations=100000)     # long-running follow, don't grow forever
+        self.window = window                    # (s) stats cover this much recent time
+        self.recent = collections.deque()       # (arrival of finish, duration)
+        self.arrived = {}                       # (object, pathid, segid) -> arrival of start, open requests
+        self.expired = 0                        # open requests dropped, no finish within the window
+        self.now = 0.0                          # arrival time of most recent line
+
+    def doline(self, line, now=None) :
+        self.now = now if now is not None else time.time()
+        logdata.doline(self, line, now)
+
+    def requeststart(self, key, t) :
+        logdata.requeststart(self, key, t)
+        self.arrived[key] = self.now
+
+    def requestend(self, key, t) :
+        self.arrived.pop(key, None)
+        logdata.requestend(self, key, t)
+
+    def requestfinished(self, key, duration) :
+        self.recent.append((self.now, duration))
+
+    def windowstats(self, now) :
+        """
+        Solve time percentiles over the window, and requests in flight.
+        Requests started before the window with no finish yet are dropped.
+        """
+        while self.recent and self.recent[0][0] < now - self.window :
+            self.recent.popleft()
+        for (key, t) in list(self.arrived.items()) :
+            if t < now - self.window :          # finish line lost, or solver died
+                del self.arrived[key]
+                self.openrequests.pop(key, None)
+                self.expired += 1
+        vals = sorted(d for (_, d) in self.recent)
+        n = len(vals)
+        def pct(p) :
+            return vals[min(n-1, int(n*p/100.0))] if n else 0.0
+        oldest = min(self.arrived.values(), default=now)
+        return { "solves" : n, "p50" : pct(50), "p95" : pct(95), "p99" : pct(99),
+            "inflight" : len(self.openrequests), "oldestinflight" : now - oldest, "expired" : self.expired }
+
+#
+#   class wallfollowdata -- wall following trouble spots
+#
+#   Rebuilds each solve's wall follows from the debug lines. Each
+#   follower, A and B, is a sequence of (x, y, direction) steps. A
+#   reversal of direction is a dead end. Coming back to a step already
+#   taken is a loop. "Path A stuck" and "Path A hit path B" end a follow
+#   without progress. Once A is stuck, the solver prints "Path A stuck"
+#   again on every B step, so stuck, hit and useful are flags per
+#   follower per follow, not line counts.
+#
+#   Follows are counted per NPC and per map spot. The spot is the cell
+#   where following started, in world coordinates from the request's
+#   pos, rot and cellsize, to the nearest meter. Spots are ranked by
+#   wall following steps plus cells tested, the cost of a solve.
+#
+#   Wall following lines are written by DEBUGPRINT1 as well as pathMsg.
+#   They go to the most recent solve started by the same object, or the
+#   most recent solve of all if no object matches.
+#
+class followrecord :
+    def __init__(self, npc, spot, x, y, direction) :
+        self.npc = npc
+        self.spot = spot                        # (x, y) world meters, or None
+        self.start = (x, y, direction)
+        self.steps = { "A" : [], "B" : [] }     # follower -> [(x, y, dir)]
+        self.deadends = 0
+        self.loops = 0
+        self.stuck = set()                      # followers, "A" or "B", that got stuck
+        self.hit = False                        # followers met head on, ending both
+        self.useful = None                      # follower that found a way on, or None
+        self.finish = None                      # (x, y) where following finished
+        self.tested = 0                         # cells tested during this follow
+
+    def cost(self) :
+        return len(self.steps["A"]) + len(self.steps["B"]) + self.tested
+
+class solverecord :
+    def __init__(self, npc, request) :
+        self.npc = npc
+        self.request = request                  # request JSON, or {}
+        self.follows = []
+        self.collinear = 0
+        self.dups = 0
+        self.tested = 0
+
+    def spot(self, x, y) :
+        """
+        World position of cell (x,y), to the meter, as mazecellto3d does
+        """
+        try :
+            pos = [float(v) for v in self.request["pos"].strip("<>").split(",")]
+            (qx, qy, qz, qs) = [float(v) for v in self.request["rot"].strip("<>").split(",")]
+            cellsize = float(self.request["cellsize"])
+        except (KeyError, ValueError, AttributeError) :
+            return None
+        (vx, vy) = (x*cellsize, y*cellsize)
+        wx = (1 - 2*(qy*qy + qz*qz))*vx + 2*(qx*qy - qs*qz)*vy + pos[0]
+        wy = 2*(qx*qy + qs*qz)*vx + (1 - 2*(qx*qx + qz*qz))*vy + pos[1]
+        return (int(round(wx)), int(round(wy)))
+
+class wallfollowdata(logdata) :
+
+    def __init__(self) :
+        logdata.__init__(self, verbose=False)
+        self.solves = {}                        # (object, pathid, segid) -> solverecord, open
+        self.finished = []                      # solverecords, done
+        self.lastrequest = {}                   # JSON of request line being processed
+        self.current = None                     # solve most recently started
+
+    def doline(self, line, now=None) :
+        if MAZETASK in line :
+            match = REMAZEREQUEST.search(line)
+            if match :
+                try :
+                    self.lastrequest = json.loads(match.group(1))
+                except ValueError :
+                    self.lastrequest = {}
+        logdata.doline(self, line, now)
+        if any(marker in line for marker in WALLFOLLOWMARKERS) :
+            self.dofollowline(line)
+
+    def requeststart(self, key, t) :
+        logdata.requeststart(self, key, t)
+        record = solverecord(key[0], self.lastrequest)
+        self.solves[key] = record
+        self.current = record
+
+    def requestend(self, key, t) :
+        record = self.solves.pop(key, None)
+        if record is not None :
+            self.finished.append(record)
+            if record is self.current :
+                self.current = None
+        logdata.requestend(self, key, t)
+
+    def solvefor(self, line) :
+        """
+        Open solve this line belongs to
+        """
+        obj = linespeaker(line)
+        if obj is not None :
+            for record in reversed(list(self.solves.values())) :
+                if record.npc is not None and (record.npc == obj or record.npc.split(",")[0] == obj) :
+                    return record
+        return self.current
+
+    def dofollowline(self, line) :
+        record = self.solvefor(line)
+        if record is None :
+            return
+        follow = record.follows[-1] if record.follows else None
+        if "Tested cell" in line :
+            record.tested += 1
+            if follow is not None and follow.finish is None :
+                follow.tested += 1
+            return
+        if "Collinear pt" in line :
+            record.collinear += 1
+            return
+        if "Dup pt." in line :
+            record.dups += 1
+            return
+        match = REFOLLOWSTART.search(line)
+        if match :
+            (x, y) = (int(match.group(1)), int(match.group(2)))
+            record.follows.append(followrecord(record.npc, record.spot(x, y), x, y, int(match.group(3))))
+            return
+        if follow is None :
+            return
+        match = REFOLLOWSTEP.search(line)
+        if match :
+            step = (int(match.group(2)), int(match.group(3)), int(match.group(4)))
+            steps = follow.steps[match.group(1)]
+            if steps and step[2] == (steps[-1][2] + 2) % 4 :
+                follow.deadends += 1            # turned right around
+            if step in steps :
+                follow.loops += 1               # been here, going this way, before
+            steps.append(step)
+            return
+        match = REFOLLOWSTUCK.search(line)
+        if match :
+            follow.stuck.add(match.group(1))
+            return
+        if "Path A hit path B" in line :
+            follow.hit = True
+            return
+        match = REFOLLOWUSEFUL.search(line)
+        if match :
+            follow.useful = match.group(1)
+        else :
+            match = REFOLLOWFINISHED.search(line)
+            if match :
+                follow.finish = (int(match.group(1)), int(match.group(2)))
+
+    def allfollows(self) :
+        return [f for r in self.finished + list(self.solves.values()) for f in r.follows]
+
+    def bynpc(self) :
+        """
+        npc -> totals
+        """
+        totals = {}
+        for f in self.allfollows() :
+            t = totals.setdefault(f.npc, collections.Counter())
+            t["follows"] += 1
+            t["steps"] += len(f.steps["A"]) + len(f.steps["B"])
+            t["deadends"] += f.deadends
+            t["loops"] += f.loops
+            t["stuck"] += len(f.stuck)
+            t["hits"] += 1 if f.hit else 0
+            t["failed"] += 0 if f.useful else 1
+        return totals
+
+    def rankspots(self, n=10) :
+        """
+        Spots with the most expensive wall following, worst first
+        """
+        spots = {}
+        for f in self.allfollows() :
+            key = f.spot if f.spot is not None else (f.npc, f.start[0], f.start[1])
+            t = spots.setdefault(key, collections.Counter())
+            t["follows"] += 1
+            t["cost"] += f.cost()
+            t["stuck"] += len(f.stuck)
+            t["loops"] += f.loops
+            t["deadends"] += f.deadends
+        return sorted(spots.items(), key=lambda item : -item[1]["cost"])[:n]
+
+    def followsummary(self, n=10) :
+        lines = []
+        collinear = sum(r.collinear for r in self.finished + list(self.solves.values()))
+        dups = sum(r.dups for r in self.finished + list(self.solves.values()))
+        lines.append("Wall following, %d follows. %d collinear, %d duplicate points dropped." %
+            (len(self.allfollows()), collinear, dups))
+        for (npc, t) in sorted(self.bynpc().items(), key=lambda item : str(item[0])) :
+            lines.append("  %-30s follows %4d  steps %6d  dead ends %4d  loops %4d  stuck %4d  hits %4d  no way on %4d" %
+                (npc, t["follows"], t["steps"], t["deadends"], t["loops"], t["stuck"], t["hits"], t["failed"]))
+        lines.append("Worst spots:")
+        for (spot, t) in self.rankspots(n) :
+            lines.append("  %-30s cost %6d  follows %4d  stuck %4d  loops %4d  dead ends %4d" %
+                (spot, t["cost"], t["follows"], t["stuck"], t["loops"], t["deadends"]))
+        return "\n".join(lines)
+
+#
+#   class logfollower -- tail growing and rotating log files
+#
+#   Files matching the patterns are rechecked on each poll, so new
+#   segment files from logcollector.py are picked up. A file which is
+#   replaced or truncated is read again from the start.
+#
+class logfollower :
+
+    READSIZE = 1024*1024                        # read in big chunks
+
+    def __init__(self, patterns, analyzer, fromstart=False) :
+        self.patterns = patterns
+        self.analyzer = analyzer
+        self.files = {}                         # name -> [file, inode, partial line]
+        self.done = {}                          # inode -> position, for files renamed away
+        self.fromstart = fromstart              # files present at start: read all, or only new lines
+        self.scan(first=True)
+
+    def scan(self, first=False) :
+        for pattern in self.patterns :
+            for fname in glob.glob(pattern) :
+                if fname not in self.files :
+                    self.openfile(fname, atend=first and not self.fromstart)
+
+    def openfile(self, fname, atend) :
+        try :
+            infile = open(fname, "rb")
+        except OSError :
+            return
+        inode = os.fstat(infile.fileno()).st_ino
+        if inode in self.done :                 # renamed file we already read, e.g. "x.log" to "x.log.1"
+            infile.seek(self.done.pop(inode))
+        elif atend :
+            infile.seek(0, os.SEEK_END)
+        self.files[fname] = [infile, inode, b""]
+
+    def poll(self) :
+        """
+        Read everything new. Returns number of lines processed.
+        """
+        self.scan()
+        now = time.time()
+        nlines = 0
+        for fname in list(self.files.keys()) :
+            entry = self.files[fname]
+            nlines += self.readnew(entry, now)
+            try :
+                st = os.stat(fname)
+            except OSError :                    # gone, rotated away
+                self.done[entry[1]] = entry[0].tell()
+                entry[0].close()
+                del self.files[fname]
+                continue
+            if st.st_ino != entry[1] or st.st_size < entry[0].tell() :    # replaced or truncated
+                if st.st_ino != entry[1] :
+                    self.done[entry[1]] = entry[0].tell()
+                entry[0].close()
+                del self.files[fname]
+                self.openfile(fname, atend=False)
+                if fname in self.files :
+                    nlines += self.readnew(self.files[fname], now)
+        return nlines
+
+    def readnew(self, entry, now) :
+        nlines = 0
+        doline = self.analyzer.doline
+        while True :
+            data = entry[0].read(self.READSIZE)
+            if not data :
+                return nlines
+            lines = (entry[2] + data).split(b"\n")
+            entry[2] = lines.pop()              # incomplete last line, keep for later
+            for line in lines :
+                doline(line.decode("utf-8", "replace"), now)
+            nlines += len(lines)
+
+def follow(patterns, interval, window, fromstart) :
+    """
+    Follow mode. Print rolling solve time stats every interval.
+    """
+    analyzer = rollinglogdata(window)
+    follower = logfollower(patterns, analyzer, fromstart)
+    print("Following %d files, %1.0fs window" % (len(follower.files), window))
+    while True :
+        nextreport = time.time() + interval
+        nlines = 0
+        while time.time() < nextreport :
+            n = follower.poll()
+            nlines += n
+            if n == 0 :
+                time.sleep(min(0.25, max(0.0, nextreport - time.time())))
+        st = analyzer.windowstats(time.time())
+        print("%s lines %6d  solves %4d  p50 %6.2fs  p95 %6.2fs  p99 %6.2fs  in flight %3d  oldest %6.1fs" %
+            (time.strftime("%H:%M:%S"), nlines, st["solves"], st["p50"], st["p95"], st["p99"],
+            st["inflight"], st["oldestinflight"]))
+        sys.stdout.flush()
+
+#
+#   Test-only code
+#
+def test() :
+    """
+    Wall following analysis and follow mode, from lines as debugrelay and llOwnerSay log them
+    """
+    request = ('{"request":"mazesolve","pathid":%d,"segmentid":0,"sizex":12,"sizey":12,"startx":0,"starty":0,'
+        '"endx":11,"endy":11,"cellsize":0.5,"pos":"<100.0, 50.0, 20.0>","rot":"<0.0, 0.0, 0.0, 1.0>"}')
+    lines = [
+        "[12:00:00] (Sam) Path Maze solver task: Request to maze solver: " + request % (1,),
+        "[12:00:00] Sam: Tested cell (1,0) : 21.5",
+        "[12:00:00] (Sam) Path Maze solver task: Starting wall follow at 4,2,  direction 0, mdist = 16",
+        "[12:00:01] Sam: Tested cell (5,2) : -1.000000",
+        "[12:00:01] Sam: Path A: 4,2,21.500000,1",
+        "[12:00:01] Sam: Path A in: (4,2)",
+        "[12:00:01] Sam: Path B: 4,2,21.500000,2",
+        "[12:00:01] Sam: Path A: 4,3,21.500000,3",     # reversed, dead end
+        "[12:00:01] Sam: Path A: 4,2,21.500000,0",
+        "[12:00:01] Sam: Path A stuck.",
+        "[12:00:01] Sam: Path B: 3,2,21.500000,2",
+        "[12:00:01] Sam: Path A stuck.",                # repeated with every B step
+        "[12:00:02] Sam: Path B: 3,3,21.500000,1",
+        "[12:00:02] Sam: Path A stuck.",
+        "[12:00:02] Sam: Path B: 3,2,21.500000,2",
+        "[12:00:02] Sam: Path A stuck.",
+        "[12:00:02] Sam: Path B: 3,2,21.500000,2",     # same place and way as before, loop
+        "[12:00:02] Sam: Path B useful: (3,2)",
+        "[12:00:02] Sam: Finished wall following at (3,2)",
+        "[12:00:03] (Sam) Path Maze solver task: Maze solver finished, pathid 1, seg 0. Free mem: 20000",
+        "[12:00:04] (Sam) Path Maze solver task: Request to maze solver: " + request % (2,),
+        "[12:00:04] (Sam) Path Maze solver task: Starting wall follow at 4,2,  direction 0, mdist = 16",
+        "[12:00:04] Sam: Path A: 5,2,21.500000,0",
+        "[12:00:04] Sam: Path B: 5,2,21.500000,2",
+        "[12:00:04] Sam: Path A hit path B",
+        "[12:00:05] (Sam) Path Maze solver task: Maze solver finished, pathid 2, seg 0. Free mem: 20000",
+        ]
+    data = wallfollowdata()
+    for line in lines :
+        data.doline(line)
+    assert(len(data.finished) == 2 and list(data.durations) == [3.0, 1.0])
+    (first, second) = data.allfollows()
+    assert(first.stuck == {"A"} and not first.hit and first.useful == "B")
+    assert(len(first.steps["A"]) == 3 and len(first.steps["B"]) == 5)
+    assert(first.deadends == 1 and first.loops == 2 and first.tested == 1 and first.finish == (3, 2))
+    assert(first.spot == (102, 51))             # cell (4,2) at 0.5m from <100,50>
+    assert(second.stuck == set() and second.hit and second.useful is None)
+    totals = data.bynpc()["Sam"]
+    assert(totals["follows"] == 2 and totals["stuck"] == 1 and totals["hits"] == 1 and totals["failed"] == 1)
+    assert(data.rankspots()[0][0] == (102, 51) and data.rankspots()[0][1]["stuck"] == 1)
+    print(data.followsummary())
+    #   Follow mode. Start and end in one read are timed by their lines, not the poll.
+    with tempfile.TemporaryDirectory() as dirname :
+        fname = os.path.join(dirname, "relay-0001.log")
+        with open(fname, "w") as outfile :
+            outfile.write("[2024-01-02 12:00:00.000] (Sam) Path Maze solver task: Request to maze solver: " + request % (1,) + "\n")
+            outfile.write("[2024-01-02 12:00:02.500] (Sam) Path Maze solver task: Maze solver finished, pathid 1, seg 0. Free mem: 1\n")
+            outfile.write("[2024-01-02 12:00:03.000] (Sam) Path Maze solver task: Request to maze solver: " + request % (2,) + "\n")
+        analyzer = rollinglogdata(window=60.0)
+        follower = logfollower([os.path.join(dirname, "*.log")], analyzer, fromstart=True)
+        assert(follower.poll() == 3)
+        now = time.time()
+        st = analyzer.windowstats(now)
+        assert(st["solves"] == 1 and st["p50"] == 2.5 and st["inflight"] == 1 and st["expired"] == 0)
+        follower.poll()
+        st = analyzer.windowstats(now + 61.0)   # finish of pathid 2 never came
+        assert(st["inflight"] == 0 and st["oldestinflight"] == 0.0 and st["expired"] == 1)
+        for entry in follower.files.values() :
+            entry[0].close()
+    print("Self test passed.")
 
-        
-        
-                
-                
 #
 #   Main program
 #
 def main() :
-    for fname in sys.argv[1:] :
+    parser = argparse.ArgumentParser(description="Check path planner logs")
+    parser.add_argument("files", nargs="*", help="log files, or glob patterns with --follow")
+    parser.add_argument("--follow", action="store_true", help="tail the files and report as solves happen")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between follow reports")
+    parser.add_argument("--window", type=float, default=60.0, help="seconds of history in follow stats")
+    parser.add_argument("--fromstart", action="store_true", help="in follow mode, read existing files from start")
+    parser.add_argument("--wallfollow", action="store_true", help="report wall following trouble spots")
+    parser.add_argument("--selftest", action="store_true", help="check the log analysis on built-in lines")
+    args = parser.parse_args()
+    if args.selftest :
+        test()
+        return
+    if not args.files :
+        parser.error("no log files")
+    if args.follow :
+        try :
+            follow(args.files, args.interval, args.window, args.fromstart)
+        except KeyboardInterrupt :
+            pass
+        return
+    for fname in args.files :
         print("Processing file \"%s\"" % (fname,))
-        logitem = logdata()
+        logitem = wallfollowdata() if args.wallfollow else logdata()
         logitem.readlog(fname)                  # do file
-        
+        print(logitem.summary())
+        if args.wallfollow :
+            print(logitem.followsummary())
+
 if __name__ == "__main__" :
     main()
-        
-        
-
-    
-    
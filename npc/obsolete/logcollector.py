@@ -0,0 +1,201 @@
+#
+#   logcollector.py -- collect relayed NPC debug messages
+#
+#   Local receiver for log messages sent out of the world by logger.lsl
+#   (one message per HTTP POST) or dumped by debugrelay.lsl (many lines
+#   per POST). Many objects can send at once.
+#
+#   Messages are appended to rotating segment files in the same
+#   "[time] (object) message" form debugrelay.lsl uses, with the date added,
+#   so logchecker.py can read the segments directly.
+#
+#   Each line is also fed to logchecker's maze start/end pairing as it
+#   arrives, so solve time statistics are current without re-reading files.
+#   Solves are timed from each line's own timestamp, not its arrival, since
+#   a debugrelay dump brings a solve's start and end in one POST. Solve
+#   time statistics cover the most recent MAXDURATIONS solves.
+#
+#       GET /stats                                      solve time stats, as JSON
+#
+import os
+import asyncio
+import argparse
+import hashlib
+import time
+
+import httpserve
+import logchecker
+
+MAXDURATIONS = 10000                            # solve times kept for stats
+
+#
+#   class SegmentWriter -- rotating log segment files
+#
+#   Writes go into a large buffer. The buffer is flushed by size, by
+#   timer, and on rotation, so the file system sees few large writes.
+#
+class SegmentWriter(object) :
+
+    def __init__(self, dirname, prefix="relay", maxbytes=64*1024*1024, bufsize=1024*1024) :
+        self.dirname = dirname
+        self.prefix = prefix
+        self.maxbytes = maxbytes                # rotate when segment reaches this size
+        self.bufsize = bufsize                  # write buffer size
+        self.outfile = None
+        self.segbytes = 0                       # bytes in current segment
+        self.segcount = 0                       # segments opened
+        self.fname = None
+
+    def open(self) :
+        os.makedirs(self.dirname, exist_ok=True)
+        self.segcount += 1
+        self.fname = os.path.join(self.dirname, "%s-%s-%04d.log" %
+            (self.prefix, time.strftime("%Y%m%d-%H%M%S"), self.segcount))
+        self.outfile = open(self.fname, "a", buffering=self.bufsize, encoding="utf-8")
+        self.segbytes = 0
+
+    def write(self, lines) :
+        """
+        Append lines. Each must end with a newline.
+        """
+        if self.outfile is None :
+            self.open()
+        s = "".join(lines)
+        self.outfile.write(s)
+        self.segbytes += len(s)
+        if self.segbytes >= self.maxbytes :
+            self.rotate()
+
+    def rotate(self) :
+        self.close()
+        self.open()
+
+    def flush(self) :
+        if self.outfile :
+            self.outfile.flush()
+
+    def close(self) :
+        if self.outfile :
+            self.outfile.close()
+            self.outfile = None
+
+#
+#   class LogCollector -- the HTTP receiver
+#
+class LogCollector(object) :
+
+    def __init__(self, segwriter, authtokens=None) :
+        self.segwriter = segwriter
+        self.authtokens = authtokens or {}      # token name -> value, as in logger.lsl loginit
+        self.analyzer = logchecker.logdata(verbose=False, maxdurations=MAXDURATIONS)
+        self.messages = 0
+        self.posts = 0
+        self.rejected = 0
+        self.starttime = time.time()
+
+    def checkauth(self, req) :
+        """
+        Same check the real server makes on logger.lsl messages:
+        X-AUTHTOKEN-HASH is SHA1 of the token value followed by the message.
+        """
+        if not self.authtokens :
+            return True
+        tokenvalue = self.authtokens.get(req.headers.get("x-authtoken-name",""))
+        if tokenvalue is None :
+            return False
+        msg = req.body.decode("utf-8", "replace")
+        return hashlib.sha1((tokenvalue + msg).encode("utf-8")).hexdigest() == req.headers.get("x-authtoken-hash","").lower()
+
+    def formatlines(self, req, now) :
+        """
+        Turn a POST body into log lines with a full timestamp and object name.
+        """
+        objname = req.headers.get("x-secondlife-object-name", "unknown").replace("(","[").replace(")","]")
+        date = time.strftime("%Y-%m-%d", time.localtime(now))
+        stamp = "[%s %s%s]" % (date, time.strftime("%H:%M:%S", time.localtime(now)), ("%.3f" % (now % 1.0,))[1:])
+        lines = []
+        for line in req.body.decode("utf-8", "replace").splitlines() :
+            line = line.strip()
+            if not line :
+                continue
+            if line.startswith("[") and logchecker.RELINEPREFIX.match(line) :
+                if not logchecker.RELINEPREFIX.match(line).group(1) :   # debugrelay dump line, add date
+                    line = "[" + date + " " + line[1:]
+                lines.append(line + "\n")
+            else :
+                lines.append("%s (%s) %s\n" % (stamp, objname, line))
+        return lines
+
+    async def handle(self, req) :
+        if req.method == "GET" and req.target == "/stats" :
+            return (200, self.stats())
+        if req.method != "POST" :
+            raise httpserve.HTTPError(405, "POST only")
+        if not self.checkauth(req) :
+            self.rejected += 1
+            raise httpserve.HTTPError(403, "Bad auth token")
+        now = time.time()
+        lines = self.formatlines(req, now)
+        self.segwriter.write(lines)
+        for line in lines :
+            self.analyzer.doline(line)          # incremental start/end pairing, by the line's own time
+        self.posts += 1
+        self.messages += len(lines)
+        return (200, "OK")
+
+    def stats(self) :
+        a = self.analyzer
+        (p50, p95, p99) = a.percentiles([50, 95, 99])
+        return { "uptime" : time.time() - self.starttime, "posts" : self.posts, "messages" : self.messages,
+            "rejected" : self.rejected, "segment" : self.segwriter.fname,
+            "maze_solves" : a.matched, "in_progress" : len(a.openrequests), "unmatched" : a.unmatched,
+            "solve_p50" : p50, "solve_p95" : p95, "solve_p99" : p99 }
+
+    async def flusher(self, interval) :
+        """
+        Flush the segment buffer now and then, so readers of the file see recent messages.
+        """
+        while True :
+            await asyncio.sleep(interval)
+            self.segwriter.flush()
+
+#
+#   Main program
+#
+async def serve(args) :
+    tokens = {}
+    for tok in args.token :
+        (name, _, value) = tok.partition("=")
+        tokens[name] = value
+    collector = LogCollector(SegmentWriter(args.dir, args.prefix, args.maxbytes, args.bufsize), tokens)
+    srv = await httpserve.startserver(collector.handle, args.host, args.port)
+    print("Log collector listening on %s:%d, writing to \"%s\"" % (args.host, args.port, args.dir))
+    flushtask = asyncio.create_task(collector.flusher(args.flushinterval))
+    try :
+        async with srv :
+            while True :
+                await asyncio.sleep(args.statsinterval)
+                print(collector.analyzer.summary())
+    finally :
+        flushtask.cancel()
+        collector.segwriter.close()
+
+def main() :
+    parser = argparse.ArgumentParser(description="Collect relayed NPC debug messages")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--dir", default="logs", help="directory for segment files")
+    parser.add_argument("--prefix", default="relay", help="segment file name prefix")
+    parser.add_argument("--maxbytes", type=int, default=64*1024*1024, help="segment size before rotation")
+    parser.add_argument("--bufsize", type=int, default=1024*1024, help="write buffer size")
+    parser.add_argument("--flushinterval", type=float, default=1.0, help="seconds between buffer flushes")
+    parser.add_argument("--statsinterval", type=float, default=10.0, help="seconds between stats printouts")
+    parser.add_argument("--token", action="append", default=[], help="NAME=VALUE auth token, as in loginit")
+    args = parser.parse_args()
+    try :
+        asyncio.run(serve(args))
+    except KeyboardInterrupt :
+        pass
+
+if __name__ == "__main__" :
+    main()
@@ -0,0 +1,356 @@
+#
+#   logindex.py -- persistent index of path planner log events
+#
+#   Parses maze solver start and finish events, the JSON request
+#   payloads, and path planner warnings and errors into a SQLite file,
+#   so questions about old logs don't need a rescan of every file.
+#   The grid size, start, end and cell size of each request get their
+#   own columns. The raw payload is kept for display.
+#
+#   Indexing is incremental. Files are known by device and inode, as
+#   logchecker.logfollower does, so a rotated or renamed file picks up
+#   where the last run stopped instead of being read again as new. A
+#   file smaller than the offset already read is reindexed from the start.
+#
+#   Usage:
+#       logindex.py index DB FILE...
+#       logindex.py query DB [--object NAME] [--pathid N] [--segmentid N]
+#                            [--since DAYS] [--mindur SECS] [--open] [--minsize N]
+#       logindex.py messages DB [--object NAME] [--since DAYS] [--match TEXT]
+#       logindex.py test
+#
+import os
+import re
+import argparse
+import datetime
+import json
+import sqlite3
+import tempfile
+import time
+
+import logchecker
+
+REQUESTJSON = "Request to maze solver: "        # JSON payload follows this
+#   pathMsg lines relayed with their level prefix, "1|Script name: text"
+RELEVEL = re.compile(r"\s*(\d)\|")
+#   debugrelay.lsl dumps strip the level, "(Object) Script name: text". Only warnings and
+#   errors reach the relay at the default message level, and errors say they are in trouble.
+#   Lines said directly by a script, such as the maze solver's "Path A stuck.", never count.
+RETROUBLE = re.compile(r" in trouble at ")
+REPROBLEM = re.compile(r"(?i)\b(fail\w*|error|stuck|abort\w*|not enough|wrong|occupied|collision)\b")
+LEVELNAMES = ["error","warn","note","info"]     # as DEBUG_MSG_NAME_LIST
+MAXMSGLEVEL = 1                                 # index warnings and errors only
+REQUESTFIELDS = ("sizex", "sizey", "startx", "starty", "endx", "endy", "cellsize")     # payload columns
+SCHEMAVERSION = 3                               # older index files are rebuilt
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS files (
+        id INTEGER PRIMARY KEY, dev INTEGER, inode INTEGER, path TEXT, offset INTEGER,
+        basetime REAL, lasttod REAL, UNIQUE(dev, inode));
+    CREATE TABLE IF NOT EXISTS requests (
+        id INTEGER PRIMARY KEY, object TEXT, pathid INTEGER, segmentid INTEGER,
+        start REAL, end REAL, duration REAL, params TEXT, fileid INTEGER, offset INTEGER,
+        sizex INTEGER, sizey INTEGER, startx INTEGER, starty INTEGER, endx INTEGER, endy INTEGER, cellsize REAL);
+    CREATE INDEX IF NOT EXISTS requests_object ON requests(object, start);
+    CREATE INDEX IF NOT EXISTS requests_pathseg ON requests(pathid, segmentid);
+    CREATE INDEX IF NOT EXISTS requests_start ON requests(start);
+    CREATE INDEX IF NOT EXISTS requests_open ON requests(object, pathid, segmentid) WHERE end IS NULL;
+    CREATE INDEX IF NOT EXISTS requests_size ON requests(sizex, sizey);
+    CREATE TABLE IF NOT EXISTS messages (
+        id INTEGER PRIMARY KEY, object TEXT, time REAL, level TEXT, text TEXT, fileid INTEGER, offset INTEGER);
+    CREATE INDEX IF NOT EXISTS messages_object ON messages(object, time);
+    CREATE INDEX IF NOT EXISTS messages_time ON messages(time);
+    """
+
+def midnight(t) :
+    """
+    Local midnight before time t
+    """
+    d = datetime.date.fromtimestamp(t)
+    return time.mktime(d.timetuple())
+
+def requestfields(params) :
+    """
+    Values for REQUESTFIELDS from a request's JSON payload. None where missing or unreadable.
+    """
+    try :
+        jsn = json.loads(params) if params else {}
+    except ValueError :
+        jsn = {}
+    if not isinstance(jsn, dict) :
+        jsn = {}
+    values = []
+    for field in REQUESTFIELDS :
+        try :
+            values.append((float if field == "cellsize" else int)(jsn[field]))
+        except (KeyError, TypeError, ValueError) :
+            values.append(None)
+    return tuple(values)
+
+#
+#   class LogIndex -- the SQLite index
+#
+class LogIndex(object) :
+
+    def __init__(self, fname) :
+        self.conn = sqlite3.connect(fname)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMAVERSION :
+            self.conn.executescript("DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS requests; "
+                "DROP TABLE IF EXISTS messages; PRAGMA user_version=%d;" % (SCHEMAVERSION,))     # just an index, rebuild it
+        self.conn.executescript(SCHEMA)
+
+    def close(self) :
+        self.conn.close()
+
+    def linetime(self, line, fileinfo) :
+        """
+        Absolute time for a line.
+
+        Lines from logcollector.py carry the date. Lines from a
+        debugrelay.lsl dump only have the time of day. The first such
+        line is dated to fall in the day before the file's ctime, and
+        the date is advanced when the time of day wraps.
+        """
+        match = logchecker.RELINEPREFIX.match(line)
+        if not match :
+            return None
+        tod = int(match.group(4))*3600 + int(match.group(5))*60 + float(match.group(6))
+        if match.group(1) :
+            return time.mktime((int(match.group(1)), int(match.group(2)), int(match.group(3)), 0, 0, 0, 0, 0, -1)) + tod
+        if fileinfo["basetime"] is None :                       # first undated line
+            fileinfo["basetime"] = midnight(fileinfo["reftime"])
+            if fileinfo["basetime"] + tod > fileinfo["reftime"] :
+                fileinfo["basetime"] = midnight(fileinfo["basetime"] - 1)  # logged before midnight
+        if fileinfo["lasttod"] is not None and tod < fileinfo["lasttod"] - logchecker.SECSPERDAY/2 :
+            fileinfo["basetime"] += logchecker.SECSPERDAY       # passed midnight
+        fileinfo["lasttod"] = tod
+        return fileinfo["basetime"] + tod
+
+    def indexfile(self, path) :
+        """
+        Index new lines in one file. Returns number of lines read.
+        """
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        row = self.conn.execute("SELECT id, offset, basetime, lasttod FROM files WHERE dev=? AND inode=?",
+            (st.st_dev, st.st_ino)).fetchone()
+        if row is None :                                # new file
+            fileid = self.conn.execute("INSERT INTO files (dev, inode, path, offset) VALUES (?,?,?,0)",
+                (st.st_dev, st.st_ino, path)).lastrowid
+            fileinfo = { "offset" : 0, "basetime" : None, "lasttod" : None }
+        elif row[1] > st.st_size :                      # truncated, or inode reused
+            fileid = row[0]
+            fileinfo = { "offset" : 0, "basetime" : None, "lasttod" : None }
+            self.conn.execute("DELETE FROM requests WHERE fileid=?", (fileid,))
+            self.conn.execute("DELETE FROM messages WHERE fileid=?", (fileid,))
+        else :                                          # maybe renamed, e.g. "x.log" to "x.log.1"
+            fileid = row[0]
+            fileinfo = { "offset" : row[1], "basetime" : row[2], "lasttod" : row[3] }
+        fileinfo["reftime"] = st.st_ctime               # no later than the last line
+        newmessages = []
+        nlines = 0
+        offset = fileinfo["offset"]
+        with self.conn, open(path, "rb") as infile :
+            infile.seek(offset)
+            for rawline in infile :
+                if not rawline.endswith(b"\n") :        # partial line still being written, get it next time
+                    break
+                lineoffset = offset
+                offset += len(rawline)
+                nlines += 1
+                line = rawline.decode("utf-8", "replace")
+                if logchecker.MAZETASK in line :
+                    match = logchecker.REMAZESTART.match(line)
+                    if match :
+                        params = line.split(REQUESTJSON, 1)[1].strip() if REQUESTJSON in line else None
+                        self.conn.execute("INSERT INTO requests (object, pathid, segmentid, start, params, fileid, offset, %s) "
+                            "VALUES (?,?,?,?,?,?,?%s)" % (", ".join(REQUESTFIELDS), ",?"*len(REQUESTFIELDS)),
+                            (logchecker.lineobject(line), int(match.group(1)), int(match.group(2)),
+                            self.linetime(line, fileinfo), params, fileid, lineoffset) + requestfields(params))
+                        continue
+                    match = logchecker.REMAZEEND.match(line)
+                    if match :                          # pair now, before a later start reuses the ID
+                        self.finishrequest(logchecker.lineobject(line), int(match.group(1)), int(match.group(2)),
+                            self.linetime(line, fileinfo))
+                        continue
+                msg = self.problemmessage(line)
+                if msg :
+                    newmessages.append((logchecker.lineobject(line), self.linetime(line, fileinfo), msg[0], msg[1],
+                        fileid, lineoffset))
+            self.conn.executemany("INSERT INTO messages (object, time, level, text, fileid, offset) VALUES (?,?,?,?,?,?)",
+                newmessages)
+            self.conn.execute("UPDATE files SET path=?, offset=?, basetime=?, lasttod=? WHERE id=?",
+                (path, offset, fileinfo["basetime"], fileinfo["lasttod"], fileid))
+        return nlines
+
+    def finishrequest(self, obj, pathid, segid, t) :
+        """
+        Close the most recent open request with this ID, which may be from an earlier run.
+        """
+        row = self.conn.execute("SELECT id, start FROM requests WHERE object IS ? AND pathid=? AND segmentid=? "
+            "AND end IS NULL ORDER BY start DESC, id DESC LIMIT 1", (obj, pathid, segid)).fetchone()
+        if row is None or t is None or row[1] is None :
+            return
+        self.conn.execute("UPDATE requests SET end=?, duration=? WHERE id=?", (t, t - row[1], row[0]))
+
+    def problemmessage(self, line) :
+        """
+        (level, text) if this is a warning or error line worth indexing, else None
+        """
+        match = logchecker.RELINEPREFIX.match(line)
+        text = line[match.end():].strip() if match else line.strip()
+        lev = RELEVEL.match(text)
+        if lev :
+            level = int(lev.group(1))
+            if level > MAXMSGLEVEL :
+                return None
+            return (LEVELNAMES[level] if level < len(LEVELNAMES) else str(level), text[lev.end():])
+        if not match or not match.group(7) :           # not relayed by debugrelay.lsl, so not a pathMsg
+            return None
+        if RETROUBLE.search(text) :
+            return ("error", text)
+        if REPROBLEM.search(text) :
+            return ("unknown", text)
+        return None
+
+    def queryrequests(self, obj=None, pathid=None, segid=None, since=None, mindur=None, openonly=False, minsize=None) :
+        sql = "SELECT object, pathid, segmentid, start, duration, params, sizex, sizey FROM requests WHERE 1"
+        args = []
+        if obj is not None :
+            sql += " AND object=?"
+            args.append(obj)
+        if pathid is not None :
+            sql += " AND pathid=?"
+            args.append(pathid)
+        if segid is not None :
+            sql += " AND segmentid=?"
+            args.append(segid)
+        if since is not None :
+            sql += " AND start>=?"
+            args.append(since)
+        if mindur is not None :
+            sql += " AND duration>=?"
+            args.append(mindur)
+        if openonly :
+            sql += " AND end IS NULL"
+        if minsize is not None :
+            sql += " AND (sizex>=? OR sizey>=?)"
+            args.extend((minsize, minsize))
+        return self.conn.execute(sql + " ORDER BY start", args).fetchall()
+
+    def querymessages(self, obj=None, since=None, match=None) :
+        sql = "SELECT object, time, level, text FROM messages WHERE 1"
+        args = []
+        if obj is not None :
+            sql += " AND object=?"
+            args.append(obj)
+        if since is not None :
+            sql += " AND time>=?"
+            args.append(since)
+        if match is not None :
+            sql += " AND text LIKE ?"
+            args.append("%" + match + "%")
+        return self.conn.execute(sql + " ORDER BY time", args).fetchall()
+
+def fmttime(t) :
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t)) if t is not None else "?"
+
+#
+#   Test-only code
+#
+def test() :
+    """
+    Index a debugrelay style dump which crosses midnight, reuses a path ID, and is rotated
+    """
+    request = ('{"request":"mazesolve","pathid":%d,"segmentid":0,"sizex":%d,"sizey":12,"startx":0,"starty":0,'
+        '"endx":11,"endy":11,"cellsize":0.5}')
+    lines = [
+        "[23:59:50] (Sam) Path Maze solver task: Request to maze solver: " + request % (1, 12),
+        "[23:59:52] (Sam) Path Maze solver task: Maze solver finished, pathid 1, seg 0. Free mem: 20000",
+        "[23:59:58] (Sam) Path Maze solver task: Request to maze solver: " + request % (1, 40),
+        "[00:00:03] (Sam) Path Maze solver task: Maze solver finished, pathid 1, seg 0. Free mem: 20000",
+        "[00:00:04] (Sam) Path Maze solver task: Request to maze solver: {\"pathid\":2,\"segmentid\":0,\"sizex\":",     # cut off
+        "[00:00:05] (Sam) 0|Path planner: Maze solver stuck",
+        "[00:00:06] Sam: Path A stuck.",                # maze solver debug output, not a problem
+        "[00:00:07] (Sam) Path Maze solver task: Maze solve failed, status 3",
+        ]
+    with tempfile.TemporaryDirectory() as tmpdir :
+        logname = os.path.join(tmpdir, "sam.log")
+        with open(logname, "w") as f :
+            f.write("\n".join(lines) + "\n")
+        ctime = os.stat(logname).st_ctime
+        index = LogIndex(os.path.join(tmpdir, "index.db"))
+        assert(index.indexfile(logname) == len(lines))
+        rows = index.queryrequests(obj="Sam")
+        assert([(duration, sizex) for (_, _, _, _, duration, _, sizex, _) in rows] == [(2.0, 12), (5.0, 40), (None, None)])
+        assert([row[:2] for row in index.queryrequests(minsize=20)] == [("Sam", 1)])
+        start = rows[0][3]
+        assert(start <= ctime and time.localtime(start).tm_hour == 23)      # the day before ctime's midnight
+        assert(time.localtime(rows[1][3] + 5.0).tm_mday != time.localtime(start).tm_mday)
+        assert([(level, text) for (_, _, level, text) in index.querymessages()] ==
+            [("error", "Path planner: Maze solver stuck"), ("unknown", "Path Maze solver task: Maze solve failed, status 3")])
+        assert(index.indexfile(logname) == 0)  # nothing new
+        #   Rotate. The old file is known by its inode, and the new one is new.
+        os.rename(logname, logname + ".1")
+        with open(logname + ".1", "a") as f :
+            f.write(lines[0] + "\n")
+        with open(logname, "w") as f :
+            f.write(lines[2] + "\n")
+        assert(index.indexfile(logname + ".1") == 1 and index.indexfile(logname) == 1)
+        assert(len(index.queryrequests()) == 5)
+        index.close()
+    print("Self test passed.")
+
+#
+#   Main program
+#
+def main() :
+    parser = argparse.ArgumentParser(description="Index path planner logs")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("index", help="index new lines in log files")
+    p.add_argument("db")
+    p.add_argument("files", nargs="+")
+    p = sub.add_parser("query", help="find maze requests")
+    p.add_argument("db")
+    p.add_argument("--object")
+    p.add_argument("--pathid", type=int)
+    p.add_argument("--segmentid", type=int)
+    p.add_argument("--since", type=float, help="days back")
+    p.add_argument("--mindur", type=float, help="minimum solve time, secs")
+    p.add_argument("--open", action="store_true", help="only requests with no finish")
+    p.add_argument("--minsize", type=int, help="minimum grid size, cells")
+    p.add_argument("--params", action="store_true", help="show request JSON")
+    p = sub.add_parser("messages", help="find warnings and errors")
+    p.add_argument("db")
+    p.add_argument("--object")
+    p.add_argument("--since", type=float, help="days back")
+    p.add_argument("--match", help="text to look for")
+    sub.add_parser("test", help="run self test")
+    args = parser.parse_args()
+    if args.cmd == "test" :
+        test()
+        return
+    index = LogIndex(args.db)
+    since = time.time() - args.since*logchecker.SECSPERDAY if getattr(args, "since", None) is not None else None
+    if args.cmd == "index" :
+        for fname in args.files :
+            t0 = time.perf_counter()
+            n = index.indexfile(fname)
+            print("Indexed %d new lines from \"%s\" in %1.3fs" % (n, fname, time.perf_counter() - t0))
+    elif args.cmd == "query" :
+        t0 = time.perf_counter()
+        rows = index.queryrequests(args.object, args.pathid, args.segmentid, since, args.mindur, args.open, args.minsize)
+        for (obj, pathid, segid, start, duration, params, sizex, sizey) in rows :
+            dur = "%7.2fs" % (duration,) if duration is not None else "   open "
+            size = "%dx%d" % (sizex, sizey) if sizex is not None and sizey is not None else "?"
+            print("%s %s pathid %d seg %d %s (%s)%s" % (fmttime(start), dur, pathid, segid, size, obj,
+                (" " + params) if args.params and params else ""))
+        print("%d requests, query %1.4fs" % (len(rows), time.perf_counter() - t0))
+    elif args.cmd == "messages" :
+        for (obj, t, level, text) in index.querymessages(args.object, since, args.match) :
+            print("%s %-7s (%s) %s" % (fmttime(t), level, obj, text))
+    index.close()
+
+if __name__ == "__main__" :
+    main()
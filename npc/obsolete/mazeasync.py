@@ -0,0 +1,215 @@
+#
+#   mazeasync.py -- asyncio solvers, with a simulated ray cast service
+#
+#   In-world, each barrier probe is a ray cast with real latency. The
+#   solvers call their barrier functions synchronously, so one NPC's
+#   solve waits out every probe. Here the solvers await their probes,
+#   so many solves can share one event loop and overlap their waits.
+#
+#   mazesolveasync drives a mazestep.MazeSolver, answering its probes
+#   from the service. A coalesced solver's neighborhood batches are
+#   probed concurrently, one round trip each. astarsearchasync is AStarSearch, on the same
+#   AStarGraph, but probing a cell's unexamined neighbors concurrently
+#   before expanding it. The result is the same, since AStarSearch
+#   probes all those neighbors anyway.
+#
+#   ProbeService stands in for the in-world ray casts. It has a fixed
+#   latency, random jitter, and a limit on probes in progress at once.
+#
+#   Run this file to measure solve throughput against the number of
+#   NPCs solving at once.
+#
+import argparse
+import asyncio
+import contextlib
+import io
+import random
+import time
+
+import astar
+import mazesolver
+import mazestep
+
+#
+#   class ProbeService -- simulated ray cast probes
+#
+class ProbeService(object) :
+
+    def __init__(self, latency=0.005, jitter=0.002, concurrency=16) :
+        self.latency = latency                  # seconds per probe
+        self.jitter = jitter                    # plus up to this much, uniform
+        self.semaphore = asyncio.Semaphore(concurrency) # probes in progress at once
+        self.calls = 0
+        self.active = 0
+        self.maxactive = 0                      # most probes in progress at once
+        self.waittime = 0.0                     # total time waiting for a probe slot
+
+    async def probe(self, barrierfn, fromx, fromy, x, y) :
+        """
+        Probe one cell. barrierfn(prevx, prevy, x, y) holds the answer.
+        """
+        t0 = time.perf_counter()
+        async with self.semaphore :
+            self.waittime += time.perf_counter() - t0
+            self.calls += 1
+            self.active += 1
+            self.maxactive = max(self.maxactive, self.active)
+            try :
+                await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+                return barrierfn(fromx, fromy, x, y)
+            finally :
+                self.active -= 1
+
+async def mazesolveasync(solver, barrierfn, service) :
+    """
+    Run a MazeSolver to completion, awaiting each probe. Returns the route.
+    """
+    reply = None
+    while True :
+        event = solver.nextevent(reply)
+        reply = None
+        if event is None :
+            return solver.route
+        if event[0] == mazestep.MAZEPROBE :
+            (_, fromx, fromy, x, y) = event
+            reply = await service.probe(barrierfn, fromx, fromy, x, y)
+        elif event[0] == mazestep.MAZEPROBEBATCH :
+            reply = await asyncio.gather(*[service.probe(barrierfn, fromx, fromy, x, y) for (fromx, fromy, x, y) in event[1]])
+
+async def astarsearchasync(start, end, graph, checkbarrier, service) :
+    """
+    AStarSearch, awaiting probes
+    """
+    def barrierfn(prevx, prevy, x, y) :
+        return checkbarrier(x, y)
+    openVertices = [(start, graph.heuristic(start, end))]
+    while len(openVertices) > 0 :
+        current = astar.findlowestfscore(openVertices)
+        if current == end :
+            path = [current]
+            while current != start :
+                currentdir = graph.ALLOWEDMOVES[graph.camefromarray[current[0]][current[1]]]
+                current = (current[0] - currentdir[0], current[1] - currentdir[1])
+                path.append(current)
+            path.reverse()
+            return path
+        ix = astar.findinpairlist(openVertices, current)
+        del(openVertices[ix])
+        graph.closedverticesarray[current[0]][current[1]] = 1
+        graph.set(current[0], current[1], 1<<graph.SHIFTCLOSED, graph.MASKCLOSED)
+        #   Probe all the unexamined neighbors at once
+        neighbors = [n for n in graph.get_vertex_neighbours(current) if not graph.get(n[0], n[1]) & graph.MASKCLOSED]
+        unexamined = [n for n in neighbors if not graph.get(n[0], n[1]) & graph.MASKEXAMINED]
+        found = await asyncio.gather(*[service.probe(barrierfn, current[0], current[1], n[0], n[1]) for n in unexamined])
+        probed = dict(zip(unexamined, found))
+        def answered(x, y) :
+            return probed[(x, y)]
+        for neighbor in neighbors :
+            candidateG = (graph.get(current[0], current[1]) & graph.MASKCOST) + graph.move_cost(current, neighbor, answered)
+            if candidateG >= graph.MAXCOST :
+                continue                        # hit barrier, skip
+            ix = astar.findinpairlist(openVertices, neighbor)
+            if ix < 0 :
+                openVertices.append((neighbor, 0))
+            elif candidateG >= graph.get(neighbor[0], neighbor[1]) & graph.MASKCOST :
+                continue
+            neighbordiff = (neighbor[0] - current[0], neighbor[1] - current[1])
+            graph.update(neighbor[0], neighbor[1], graph.ALLOWEDMOVES.index(neighbordiff), candidateG, True, False, True)
+            fscore = (graph.get(neighbor[0], neighbor[1]) & graph.MASKCOST) + graph.heuristic(neighbor, end)
+            ix = astar.findinpairlist(openVertices, neighbor)
+            openVertices[ix] = (neighbor, fscore)
+    raise RuntimeError("A* failed to find a solution")
+
+#
+#   Benchmark
+#
+def makeproblem(xsize, ysize, density) :
+    """
+    Random barrier, start and end. Returns (start, end, barrier set).
+    """
+    while True :
+        start = (random.randrange(xsize), random.randrange(ysize))
+        end = (random.randrange(xsize), random.randrange(ysize))
+        if start != end :
+            break
+    with contextlib.redirect_stdout(io.StringIO()) :
+        barrierpairs = mazesolver.generaterandombarrier(xsize, ysize, start[0], start[1], end[0], end[1], int(xsize*ysize*density))
+    return (start, end, set(barrierpairs))
+
+async def solveone(solver, xsize, ysize, problem, service) :
+    (start, end, barriers) = problem
+    def barrierfn(prevx, prevy, x, y) :
+        return (x, y) in barriers
+    def checkbarrier(x, y) :
+        return (x, y) in barriers
+    t0 = time.perf_counter()
+    if solver in ("maze", "mazebatch") :
+        route = await mazesolveasync(mazestep.MazeSolver(xsize, ysize, start[0], start[1], end[0], end[1],
+            coalesce=(solver == "mazebatch")), barrierfn, service)
+    else :
+        try :
+            route = await astarsearchasync(start, end, astar.AStarGraph(xsize, ysize), checkbarrier, service)
+        except RuntimeError :
+            route = []
+    return (route, time.perf_counter() - t0)
+
+async def runbenchmark(solver, npcs, problems, xsize, ysize, latency, jitter, concurrency) :
+    """
+    npcs solves in progress at once, until all problems are done
+    """
+    service = ProbeService(latency, jitter, concurrency)
+    queue = list(problems)
+    latencies = []
+    async def npc() :
+        while queue :
+            problem = queue.pop()
+            (route, elapsed) = await solveone(solver, xsize, ysize, problem, service)
+            latencies.append(elapsed)
+    t0 = time.perf_counter()
+    await asyncio.gather(*[npc() for _ in range(npcs)])
+    elapsed = time.perf_counter() - t0
+    return (len(problems) / elapsed, sum(latencies) / len(latencies), service)
+
+def checkresults(xsize, ysize, problems) :
+    """
+    Async solvers must get the same routes as the sync ones
+    """
+    for problem in problems :
+        (start, end, barriers) = problem
+        (route, _) = asyncio.run(solveone("maze", xsize, ysize, problem, ProbeService(0.0, 0.0)))
+        with contextlib.redirect_stdout(io.StringIO()) :
+            mazesolver.mazeinit(xsize, ysize)
+            expected = mazesolver.mazesolve(start[0], start[1], end[0], end[1], lambda px, py, x, y : (x, y) in barriers)
+        assert(route == expected)
+        (route, _) = asyncio.run(solveone("mazebatch", xsize, ysize, problem, ProbeService(0.0, 0.0)))
+        assert(route == expected)
+        (path, _) = asyncio.run(solveone("astar", xsize, ysize, problem, ProbeService(0.0, 0.0)))
+        try :
+            expected = astar.AStarSearch(start, end, astar.AStarGraph(xsize, ysize), lambda x, y : (x, y) in barriers)
+        except RuntimeError :
+            expected = []
+        assert(path == expected)
+
+def main() :
+    parser = argparse.ArgumentParser(description="Async solver throughput against concurrent NPCs")
+    parser.add_argument("--solver", choices=["maze", "mazebatch", "astar"], default="maze")
+    parser.add_argument("--latency", type=float, default=0.005, help="probe latency, seconds")
+    parser.add_argument("--jitter", type=float, default=0.002, help="extra random latency, seconds")
+    parser.add_argument("--concurrency", type=int, default=16, help="probes in progress at once")
+    parser.add_argument("--problems", type=int, default=64, help="solves per run")
+    parser.add_argument("--size", type=int, default=16, help="grid size")
+    parser.add_argument("--npcs", type=str, default="1,2,4,8,16,32", help="NPCs solving at once, comma separated")
+    args = parser.parse_args()
+    random.seed(38)
+    problems = [makeproblem(args.size, args.size, 0.2) for _ in range(args.problems)]
+    checkresults(args.size, args.size, problems[:16])
+    print("%s solver, %d problems, %dx%d, latency %1.1fms + %1.1fms jitter, %d probes at once" % (args.solver,
+        args.problems, args.size, args.size, args.latency*1000, args.jitter*1000, args.concurrency))
+    print("  NPCs   solves/s   mean solve   probes   max in progress")
+    for npcs in [int(s) for s in args.npcs.split(",")] :
+        (throughput, meanlatency, service) = asyncio.run(runbenchmark(args.solver, npcs, problems,
+            args.size, args.size, args.latency, args.jitter, args.concurrency))
+        print("  %4d   %8.1f   %9.3fs   %6d   %6d" % (npcs, throughput, meanlatency, service.calls, service.maxactive))
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,276 @@
+#
+#   mazereplay.py -- replay maze requests from production logs
+#
+#   Pulls "Request to maze solver" JSON out of logs, rebuilds each
+#   maze (size, start, end, cell size), and runs it through the Python
+#   solvers in parallel. Reports solve time, barrier probe counts, and
+#   requests where the solvers disagree.
+#
+#   Barrier observations come from the solver's debug lines for the same
+#   object between the request and the finish. These are DEBUGPRINT1
+#   output, so the object name is the llOwnerSay chat prefix, not the
+#   debugrelay one. A line whose object matches no open request goes to
+#   the most recent one.
+#
+#       Tested cell (x,y) : z           z < 0 means occupied
+#       Checked cell (x,y) : b          b is the barrier bit
+#       Maze cell (x,y) was empty, now occupied
+#
+#   Cells never observed are taken as clear. With verbose logging off,
+#   that's all of them, and the replay only measures open-field cost.
+#
+#   Usage:
+#       mazereplay.py [--workers N] [--limit N] LOGFILE...
+#       mazereplay.py --selftest
+#
+import re
+import os
+import json
+import time
+import argparse
+import contextlib
+import concurrent.futures
+import tempfile
+
+import logchecker
+import mazesolver
+import astaranytime
+
+RETESTEDCELL = re.compile(r".*Tested cell \((\d+),(\d+)\) : (-?[\d.]+)")
+RECHECKEDCELL = re.compile(r".*Checked cell \((\d+),(\d+)\) : (\d)")
+RECELLCHANGED = re.compile(r".*Maze cell \((\d+),(\d+)\) was empty, now occupied")
+
+#
+#   class MazeRequest -- one maze solve, as logged
+#
+class MazeRequest(object) :
+
+    def __init__(self, obj, jsn, fname, lineno) :
+        self.object = obj
+        self.pathid = int(jsn["pathid"])
+        self.segmentid = int(jsn["segmentid"])
+        self.sizex = int(jsn["sizex"])
+        self.sizey = int(jsn["sizey"])
+        self.startx = int(jsn["startx"])
+        self.starty = int(jsn["starty"])
+        self.endx = int(jsn["endx"])
+        self.endy = int(jsn["endy"])
+        self.cellsize = float(jsn.get("cellsize", 0.0))
+        self.barriers = set()                   # cells seen to be occupied
+        self.clear = set()                      # cells seen to be clear
+        self.where = "%s:%d" % (fname, lineno)
+
+    def observe(self, x, y, barrier) :
+        if barrier :
+            self.barriers.add((x,y))
+            self.clear.discard((x,y))
+        elif (x,y) not in self.barriers :
+            self.clear.add((x,y))
+
+def requestfor(inprogress, line) :
+    """
+    Open request a debug line belongs to, or None
+    """
+    obj = logchecker.linespeaker(line)
+    if obj is not None :
+        for (reqobj, req) in reversed(list(inprogress.items())) :
+            if reqobj is not None and (reqobj == obj or reqobj.split(",")[0] == obj) :
+                return req
+    return next(reversed(inprogress.values()), None)     # most recent
+
+def extractrequests(fnames) :
+    """
+    Find maze requests and the barrier observations that go with them.
+    """
+    requests = []
+    for fname in fnames :
+        inprogress = {}                         # object -> MazeRequest, in order started
+        with open(fname, "r", errors="replace") as infile :
+            for lineno, line in enumerate(infile, 1) :
+                if "cell (" in line :           # cheap test first
+                    req = requestfor(inprogress, line)
+                    if req is None :
+                        continue
+                    match = RETESTEDCELL.match(line)
+                    if match :
+                        req.observe(int(match.group(1)), int(match.group(2)), float(match.group(3)) < 0)
+                        continue
+                    match = RECHECKEDCELL.match(line)
+                    if match :
+                        req.observe(int(match.group(1)), int(match.group(2)), int(match.group(3)) != 0)
+                        continue
+                    match = RECELLCHANGED.match(line)
+                    if match :
+                        req.observe(int(match.group(1)), int(match.group(2)), True)
+                    continue
+                if logchecker.MAZETASK not in line :
+                    continue
+                if logchecker.REMAZESTART.match(line) :
+                    try :
+                        jsn = json.loads(line.split("Request to maze solver: ", 1)[1])
+                        req = MazeRequest(logchecker.lineobject(line), jsn, fname, lineno)
+                    except (IndexError, ValueError, KeyError) :
+                        print("Unparseable maze request at %s:%d" % (fname, lineno))
+                        continue
+                    inprogress.pop(req.object, None)    # newest last
+                    inprogress[req.object] = req
+                    requests.append(req)
+                elif logchecker.REMAZEEND.match(line) :
+                    inprogress.pop(logchecker.lineobject(line), None)
+    return requests
+
+class nullwriter :
+    """
+    Discards the solvers' debug printing
+    """
+    def write(self, s) :
+        pass
+    def flush(self) :
+        pass
+
+def replayone(req) :
+    """
+    Run one request through both solvers. Runs in a worker process.
+    """
+    barriers = req.barriers
+    probes = [0]
+    def barrierfn(prevx, prevy, ix, iy) :       # mazesolver form
+        probes[0] += 1
+        return (ix, iy) in barriers
+    def checkbarrier(ix, iy) :                  # astar form
+        probes[0] += 1
+        return (ix, iy) in barriers
+    result = { "where" : req.where, "object" : req.object, "pathid" : req.pathid, "segmentid" : req.segmentid }
+    if (req.startx, req.starty) in barriers or (req.endx, req.endy) in barriers :
+        result["skipped"] = "start or end blocked"
+        return result
+    with contextlib.redirect_stdout(nullwriter()) :
+        #   Maze solver, as the LSL code does it
+        t0 = time.perf_counter()
+        mazesolver.mazeinit(req.sizex, req.sizey)
+        route = mazesolver.mazesolve(req.startx, req.starty, req.endx, req.endy, barrierfn)
+        route = mazesolver.mazeoptimizeroute(mazesolver.mazeroutecornersonly(route))
+        result["maze_time"] = time.perf_counter() - t0
+        result["maze_probes"] = probes[0]
+        result["maze_found"] = len(route) > 0
+        result["maze_len"] = routelength(route)
+        #   A*. Not AStarSearch, whose 8-bit costs fail routes over about 63 steps.
+        probes[0] = 0
+        t0 = time.perf_counter()
+        try :
+            path = astaranytime.weightedastar((req.startx, req.starty), (req.endx, req.endy), req.sizex, req.sizey,
+                checkbarrier, weight=1.0).path
+            result["astar_found"] = True
+            result["astar_len"] = len(path) - 1
+        except RuntimeError :                   # no budget, so this is really no path
+            result["astar_found"] = False
+            result["astar_len"] = 0
+        result["astar_time"] = time.perf_counter() - t0
+        result["astar_probes"] = probes[0]
+        if result["maze_found"] != result["astar_found"] :   # somebody is wrong, find out who
+            result["reachable"] = bool(mazesolver.checkreachability(req.sizex, req.sizey, req.startx, req.starty,
+                req.endx, req.endy, list(barriers)))
+    return result
+
+def routelength(route) :
+    """
+    Manhattan length of a corners-only route
+    """
+    total = 0
+    for n in range(1, len(route)) :
+        total += mazesolver.mazemd(mazesolver.mazepathx(route[n-1]), mazesolver.mazepathy(route[n-1]),
+            mazesolver.mazepathx(route[n]), mazesolver.mazepathy(route[n]))
+    return total
+
+def pct(vals, p) :
+    if not vals :
+        return 0.0
+    vals = sorted(vals)
+    return vals[min(len(vals)-1, int(len(vals)*p/100.0))]
+
+def report(results) :
+    done = [r for r in results if "skipped" not in r]
+    print("%d requests replayed, %d skipped." % (len(done), len(results) - len(done)))
+    for solver in ("maze", "astar") :
+        times = [r[solver + "_time"] for r in done]
+        probes = [r[solver + "_probes"] for r in done]
+        found = sum(1 for r in done if r[solver + "_found"])
+        if done :
+            print("%-6s found %4d  time p50 %8.4fs p95 %8.4fs max %8.4fs  probes mean %7.1f max %5d" % (solver, found,
+                pct(times, 50), pct(times, 95), max(times), sum(probes)/len(probes), max(probes)))
+    disagree = [r for r in done if r["maze_found"] != r["astar_found"]]
+    longer = [r for r in done if r["maze_found"] and r["astar_found"] and r["maze_len"] > r["astar_len"]]
+    print("Found/not found disagreements: %d" % (len(disagree),))
+    for r in disagree :
+        print("  %s (%s) pathid %d seg %d: maze %r, A* %r, reachable %r" % (r["where"], r["object"], r["pathid"],
+            r["segmentid"], r["maze_found"], r["astar_found"], r["reachable"]))
+    print("Maze route longer than A* route: %d" % (len(longer),))
+
+#
+#   Self test
+#
+def selftest() :
+    #   Requests as debugrelay logs them, cell tests as llOwnerSay does
+    request = ('{"request":"mazesolve","pathid":%d,"segmentid":1,"sizex":%d,"sizey":%d,"startx":0,"starty":0,'
+        '"endx":%d,"endy":%d,"cellsize":0.25}')
+    lines = [
+        "[12:00:00] (Sam) Path Maze solver task: Request to maze solver: " + request % (7, 12, 12, 11, 11),
+        "[12:00:00] Sam: Tested cell (1,0) : 21.5",
+        "[12:00:01] Sam: Tested cell (2,0) : -1.000000",
+        "[12:00:01] Sam: Tested cell (1,1) : -1.000000",
+        "[12:00:01] (Other) Path Maze solver task: Request to maze solver: " + request % (3, 41, 41, 40, 40),
+        "[12:00:02] Sam: Tested cell (0,1) : -1.000000",
+        "[12:00:02] Other: Tested cell (5,5) : 21.0",
+        "[12:00:03] (Sam) Path Maze solver task: Maze solver finished, pathid 7, seg 1. Free mem: 20000",
+        "[12:00:04] (Other) Path Maze solver task: Maze solver finished, pathid 3, seg 1. Free mem: 20000",
+        "[12:00:05] Sam: Tested cell (9,9) : -1.000000",    # after finish, belongs to nobody
+        ]
+    with tempfile.NamedTemporaryFile("w", suffix=".log", delete=False) as outfile :
+        outfile.write("\n".join(lines) + "\n")
+    try :
+        requests = extractrequests([outfile.name])
+    finally :
+        os.unlink(outfile.name)
+    assert([(r.object, r.pathid) for r in requests] == [("Sam", 7), ("Other", 3)])
+    (sam, other) = requests
+    assert(sam.barriers == {(2,0), (1,1), (0,1)} and sam.clear == {(1,0)})
+    assert(other.barriers == set() and other.clear == {(5,5)})
+    #   Boxed in start, both solvers fail. Open 41x41, both succeed, the longest route the LSL solver takes.
+    for (req, found) in ((sam, False), (other, True)) :
+        result = replayone(req)
+        assert(result["maze_found"] == found and result["astar_found"] == found)
+    assert(replayone(other)["astar_len"] == 80)
+    print("Self test passed.")
+
+#
+#   Main program
+#
+def main() :
+    parser = argparse.ArgumentParser(description="Replay logged maze requests through the Python solvers")
+    parser.add_argument("files", nargs="*")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--limit", type=int, default=0, help="replay at most this many requests")
+    parser.add_argument("--json", default=None, help="write per-request results to this file")
+    parser.add_argument("--selftest", action="store_true", help="check log parsing and replay")
+    args = parser.parse_args()
+    if args.selftest :
+        selftest()
+        return
+    if not args.files :
+        parser.error("no log files")
+    requests = extractrequests(args.files)
+    if args.limit > 0 :
+        requests = requests[:args.limit]
+    print("%d maze requests found, %d with barrier observations." % (len(requests),
+        sum(1 for r in requests if r.barriers)))
+    t0 = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as pool :
+        results = list(pool.map(replayone, requests, chunksize=max(1, len(requests) // (4*args.workers))))
+    print("Replay took %1.2fs with %d workers." % (time.perf_counter() - t0, args.workers))
+    report(results)
+    if args.json :
+        with open(args.json, "w") as outfile :
+            json.dump(results, outfile, indent=1)
+
+if __name__ == "__main__" :
+    main()
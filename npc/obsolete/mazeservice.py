@@ -0,0 +1,378 @@
+#
+#   mazeservice.py -- local maze solving service, pathmazesolver JSON protocol
+#
+#   Takes the same "mazesolve" JSON requests pathmazesolvercall.lsl
+#   sends to pathmazesolver.lsl, as HTTP POSTs, and replies in the same
+#   shape: reply, pathid, segmentid, status, hitobj, pos, rot, cellsize,
+#   p0, p1, refpt, prim, points. "points" is the corners-only route as
+#   mazepathval values.
+#
+#   This service cannot cast rays into the world, so the caller sends
+#   the barrier cells it knows about as "barriers": [[x,y], ...]. Cells
+#   not listed are clear. Recorded traffic gets its barriers from the
+#   solver's debug lines, as mazereplay.py does.
+#
+#   Solves run on a process pool. Requests arriving within a few
+#   milliseconds of each other go to a worker together as one batch,
+#   to cut the per-request process overhead. A request identical to
+#   one already in flight, same maze, start, end and barriers, waits
+#   for that solve instead of starting another. Each waiting request
+#   still gets its own reply, with its own pathid and segmentid.
+#
+#       POST /                                      solve, JSON in, JSON out
+#       GET /stats                                  counters, as JSON
+#
+#   Usage:
+#       mazeservice.py [--port N] [--workers N]             serve
+#       mazeservice.py --loadtest [--clients N] LOGFILE...  replay recorded requests against a local server
+#       mazeservice.py --selftest                           check replies against direct solves
+#
+import os
+import asyncio
+import argparse
+import concurrent.futures
+import contextlib
+import io
+import json
+import multiprocessing
+import random
+import time
+
+import httpserve
+import mazesolver
+import mazestep
+
+#   As in pathmazedefs.lsl and patherrors.lsl
+MAZEMAXSIZE = 41                                # largest maze the LSL solver takes
+PATHERRMAZENOFIND = -104                        # no solution found, normal
+PATHERRMAZEBADSIZE = -204                       # maze is too big
+
+#
+#   Worker side. These run in the pool processes.
+#
+def solveproblem(problem) :
+    """
+    Solve one (sizex, sizey, startx, starty, endx, endy, barriers). Returns (status, points).
+    """
+    (sizex, sizey, startx, starty, endx, endy, barriers) = problem
+    barriers = set(barriers)
+    def barrierfn(prevx, prevy, x, y) :
+        return (x, y) in barriers
+    route = mazestep.MazeSolver(sizex, sizey, startx, starty, endx, endy).run(barrierfn)
+    if not route :
+        return (PATHERRMAZENOFIND, [])
+    with contextlib.redirect_stdout(io.StringIO()) :
+        return (0, mazesolver.mazeroutecornersonly(route))
+
+def solvebatch(problems) :
+    """
+    Solve each problem. A problem that fails gets its exception, not the whole batch.
+    """
+    results = []
+    for problem in problems :
+        try :
+            results.append(solveproblem(problem))
+        except Exception as err :
+            results.append(err)
+    return results
+
+#
+#   Request handling
+#
+def problemfor(jsn, maxsize) :
+    """
+    The part of a request that determines the answer, as a hashable tuple,
+    or None if the size is bad or start or end is off the grid
+    """
+    sizex = int(jsn["sizex"])
+    sizey = int(jsn["sizey"])
+    if sizex < 3 or sizex > maxsize or sizey < 3 or sizey > maxsize :
+        return None
+    (startx, starty, endx, endy) = (int(jsn["startx"]), int(jsn["starty"]), int(jsn["endx"]), int(jsn["endy"]))
+    if not (0 <= startx < sizex and 0 <= endx < sizex and 0 <= starty < sizey and 0 <= endy < sizey) :
+        return None
+    barriers = tuple(sorted(set((int(x), int(y)) for (x, y) in jsn.get("barriers", []))))
+    return (sizex, sizey, startx, starty, endx, endy, barriers)
+
+def replyfor(jsn, status, points, prim) :
+    """
+    Reply JSON, as pathmazesolver.lsl builds it. "prim" is the solver's own link number, not the caller's.
+    """
+    return { "reply" : "mazesolve", "pathid" : int(jsn["pathid"]), "segmentid" : int(jsn["segmentid"]),
+        "status" : status, "hitobj" : jsn.get("hitobj", ""),
+        "pos" : jsn.get("pos", ""), "rot" : jsn.get("rot", ""), "cellsize" : jsn.get("cellsize", 0.0),
+        "p0" : jsn.get("p0", ""), "p1" : jsn.get("p1", ""),
+        "refpt" : jsn.get("refpt", ""), "prim" : prim,
+        "points" : points }
+
+#
+#   class MazeService -- the HTTP front end, batching and dedup
+#
+class MazeService(object) :
+
+    def __init__(self, workers=None, maxsize=MAZEMAXSIZE, batchsize=16, batchdelay=0.002, prim=0) :
+        #   Workers start as load rises. Forked ones would inherit, and hold open, client sockets.
+        self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        self.maxsize = maxsize                  # largest maze accepted
+        self.batchsize = batchsize              # problems per worker call
+        self.batchdelay = batchdelay            # (s) wait this long for a batch to fill
+        self.prim = prim                        # link number replies report, as llGetLinkNumber in the solver prim
+        self.inflight = {}                      # problem -> future for its (status, points)
+        self.pending = []                       # (problem, future), not yet sent to a worker
+        self.flushtimer = None
+        self.requests = 0
+        self.solves = 0
+        self.deduped = 0
+        self.batches = 0
+        self.badrequests = 0
+        self.starttime = time.time()
+
+    async def solve(self, jsn) :
+        """
+        Reply for one request
+        """
+        if jsn.get("request") != "mazesolve" :
+            raise ValueError("Not a mazesolve request")
+        self.requests += 1
+        problem = problemfor(jsn, self.maxsize)
+        if problem is None :
+            return replyfor(jsn, PATHERRMAZEBADSIZE, [], self.prim)
+        future = self.inflight.get(problem)
+        if future is not None :
+            self.deduped += 1                   # same solve already running, share it
+        else :
+            future = asyncio.get_running_loop().create_future()
+            self.inflight[problem] = future
+            self.pending.append((problem, future))
+            self.solves += 1
+            if len(self.pending) >= self.batchsize :
+                self.flush()
+            elif self.flushtimer is None :
+                self.flushtimer = asyncio.get_running_loop().call_later(self.batchdelay, self.flush)
+        (status, points) = await asyncio.shield(future)
+        return replyfor(jsn, status, points, self.prim)
+
+    def flush(self) :
+        """
+        Send pending problems to a worker as one batch
+        """
+        if self.flushtimer is not None :
+            self.flushtimer.cancel()
+            self.flushtimer = None
+        if not self.pending :
+            return
+        batch = self.pending
+        self.pending = []
+        self.batches += 1
+        asyncio.get_running_loop().create_task(self.runbatch(batch))
+
+    async def runbatch(self, batch) :
+        try :
+            results = await asyncio.get_running_loop().run_in_executor(self.pool, solvebatch, [p for (p, _) in batch])
+        except Exception as err :               # worker died, fail everybody in the batch
+            results = [err] * len(batch)
+        for ((problem, future), result) in zip(batch, results) :
+            del self.inflight[problem]
+            if isinstance(result, Exception) :
+                future.set_exception(result)
+            else :
+                future.set_result(result)
+
+    async def handle(self, req) :
+        if req.method == "GET" and req.target == "/stats" :
+            return (200, self.stats())
+        if req.method != "POST" :
+            raise httpserve.HTTPError(405, "POST only")
+        try :
+            jsn = json.loads(req.body.decode("utf-8"))
+            return (200, await self.solve(jsn))
+        except (ValueError, KeyError, TypeError) as err :
+            self.badrequests += 1
+            raise httpserve.HTTPError(400, "Bad maze request: %s" % (err,))
+
+    def stats(self) :
+        return { "uptime" : time.time() - self.starttime, "requests" : self.requests, "solves" : self.solves,
+            "deduped" : self.deduped, "batches" : self.batches, "badrequests" : self.badrequests,
+            "inflight" : len(self.inflight) }
+
+    def close(self) :
+        self.pool.shutdown()
+
+#
+#   Main program
+#
+async def serve(args) :
+    service = MazeService(args.workers, args.maxsize, args.batchsize, args.batchdelay)
+    srv = await httpserve.startserver(service.handle, args.host, args.port)
+    print("Maze service listening on %s:%d" % (args.host, args.port))
+    try :
+        async with srv :
+            while True :
+                await asyncio.sleep(args.statsinterval)
+                print(service.stats())
+    finally :
+        service.close()
+
+#
+#   Load test and self test
+#
+async def postjson(reader, writer, host, body) :
+    """
+    One POST on a kept-alive connection. Returns (status, reply JSON or text).
+    """
+    data = json.dumps(body).encode("utf-8")
+    writer.write(("POST / HTTP/1.1\r\nHost: %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n" %
+        (host, len(data))).encode("latin-1") + data)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True :
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b"") :
+            break
+        (k, _, v) = line.decode("latin-1").partition(":")
+        if k.strip().lower() == "content-length" :
+            length = int(v.strip())
+    reply = await reader.readexactly(length)
+    return (status, json.loads(reply) if status == 200 else reply.decode("utf-8"))
+
+async def runclients(host, port, requests, clients) :
+    """
+    Post requests from several clients at once. Returns [(request, reply, latency)].
+    """
+    queue = list(requests)
+    queue.reverse()
+    results = []
+    async def client() :
+        (reader, writer) = await asyncio.open_connection(host, port)
+        try :
+            while queue :
+                jsn = queue.pop()
+                t0 = time.perf_counter()
+                (status, reply) = await postjson(reader, writer, host, jsn)
+                results.append((jsn, reply if status == 200 else None, time.perf_counter() - t0))
+        finally :
+            writer.close()
+            await writer.wait_closed()
+    await asyncio.gather(*[client() for _ in range(clients)])
+    await asyncio.sleep(0.01)                   # let the server see the connections close
+    return results
+
+def requestjson(req) :
+    """
+    A mazereplay.MazeRequest as the JSON pathmazesolvercall.lsl sends, with its observed barriers
+    """
+    return { "request" : "mazesolve", "pathid" : req.pathid, "segmentid" : req.segmentid,
+        "sizex" : req.sizex, "sizey" : req.sizey, "startx" : req.startx, "starty" : req.starty,
+        "endx" : req.endx, "endy" : req.endy, "cellsize" : req.cellsize,
+        "barriers" : sorted(req.barriers) }
+
+async def runlocal(requests, clients, workers, maxsize, port=0) :
+    """
+    Start a server here, run the requests against it, stop it. Returns (results, stats, elapsed).
+    """
+    service = MazeService(workers, maxsize)
+    srv = await httpserve.startserver(service.handle, "127.0.0.1", port)
+    port = srv.sockets[0].getsockname()[1]
+    try :
+        async with srv :
+            t0 = time.perf_counter()
+            results = await runclients("127.0.0.1", port, requests, clients)
+            elapsed = time.perf_counter() - t0
+    finally :
+        service.close()
+    return (results, service.stats(), elapsed)
+
+def pct(vals, p) :
+    if not vals :
+        return 0.0
+    vals = sorted(vals)
+    return vals[min(len(vals)-1, int(len(vals)*p/100.0))]
+
+def report(results, stats, elapsed, msg) :
+    latencies = [lat for (_, _, lat) in results]
+    failed = sum(1 for (_, reply, _) in results if reply is None)
+    print("%s: %d requests in %1.2fs, %1.1f/s. Latency p50 %1.4fs p95 %1.4fs max %1.4fs. %d solves, %d deduped, %d batches, %d failed." %
+        (msg, len(results), elapsed, len(results)/max(elapsed, 1e-9), pct(latencies, 50), pct(latencies, 95),
+        max(latencies, default=0.0), stats["solves"], stats["deduped"], stats["batches"], failed))
+
+def loadtest(args) :
+    import mazereplay                           # only needed here
+    requests = [requestjson(req) for req in mazereplay.extractrequests(args.files)]
+    requests = [jsn for jsn in requests for _ in range(args.repeat)]     # as if several NPCs were stuck at once
+    print("%d maze requests from logs." % (len(requests),))
+    if not requests :
+        return
+    for clients in [int(s) for s in args.clients.split(",")] :
+        (results, stats, elapsed) = asyncio.run(runlocal(requests, clients, args.workers, args.maxsize))
+        report(results, stats, elapsed, "%d clients" % (clients,))
+
+def selftest(args) :
+    random.seed(45)
+    size = 24
+    problems = []
+    for n in range(40) :
+        (start, end) = ((random.randrange(size), random.randrange(size)), (random.randrange(size), random.randrange(size)))
+        with contextlib.redirect_stdout(io.StringIO()) :
+            barriers = mazesolver.generaterandombarrier(size, size, start[0], start[1], end[0], end[1], size*size//5)
+        problems.append({ "request" : "mazesolve", "sizex" : size, "sizey" : size, "startx" : start[0], "starty" : start[1],
+            "endx" : end[0], "endy" : end[1], "cellsize" : 0.25, "pos" : "<128.0, 64.0, 22.0>", "rot" : "<0.0, 0.0, 0.0, 1.0>",
+            "refpt" : "<0.0, 0.0, 0.0>", "hitobj" : "00000000-0000-0000-0000-000000000000", "prim" : 2,
+            "barriers" : [list(b) for b in barriers] })
+    #   Every problem several times over, as if several NPCs were stuck at the same spot
+    requests = []
+    for (n, p) in enumerate(problems * 4) :
+        jsn = dict(p)
+        jsn["pathid"] = n
+        jsn["segmentid"] = n % 3
+        requests.append(jsn)
+    random.shuffle(requests)
+    requests.append({ "request" : "mazesolve", "pathid" : 999, "segmentid" : 0, "sizex" : 500, "sizey" : 500,
+        "startx" : 0, "starty" : 0, "endx" : 1, "endy" : 1 })
+    requests.append({ "request" : "mazesolve", "pathid" : 998, "segmentid" : 0, "sizex" : size, "sizey" : size,
+        "startx" : -1, "starty" : 0, "endx" : 1, "endy" : 1 })     # start off the grid
+    #   A failing problem stays with its own result
+    results = solvebatch([problemfor(requests[0], MAZEMAXSIZE), (size, size, -1, 0, 1, 1, ())])
+    assert(results[0] == solveproblem(problemfor(requests[0], MAZEMAXSIZE)) and isinstance(results[1], Exception))
+    (results, stats, elapsed) = asyncio.run(runlocal(requests, 16, args.workers, MAZEMAXSIZE))
+    assert(len(results) == len(requests))
+    for (jsn, reply, _) in results :
+        assert(reply is not None)
+        assert(reply["reply"] == "mazesolve" and reply["pathid"] == jsn["pathid"] and reply["segmentid"] == jsn["segmentid"])
+        assert(reply["prim"] == 0)              # the solver's link number, not the caller's
+        if problemfor(jsn, MAZEMAXSIZE) is None :
+            assert(reply["status"] == PATHERRMAZEBADSIZE)
+            continue
+        (status, points) = solveproblem(problemfor(jsn, MAZEMAXSIZE))
+        assert(reply["status"] == status and reply["points"] == points)
+        assert(reply["pos"] == jsn["pos"])
+    assert(stats["solves"] + stats["deduped"] == len(requests) - 2)
+    report(results, stats, elapsed, "Self test")
+
+def main() :
+    parser = argparse.ArgumentParser(description="Local maze solving service, pathmazesolver JSON protocol")
+    parser.add_argument("files", nargs="*", help="log files, for --loadtest")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--maxsize", type=int, default=MAZEMAXSIZE, help="largest maze accepted, cells")
+    parser.add_argument("--batchsize", type=int, default=16, help="problems per worker call")
+    parser.add_argument("--batchdelay", type=float, default=0.002, help="seconds to wait for a batch to fill")
+    parser.add_argument("--statsinterval", type=float, default=10.0, help="seconds between stats printouts")
+    parser.add_argument("--loadtest", action="store_true", help="replay requests from the log files against a local server")
+    parser.add_argument("--clients", default="1,4,16", help="load test clients at once, comma separated")
+    parser.add_argument("--repeat", type=int, default=1, help="load test each logged request this many times")
+    parser.add_argument("--selftest", action="store_true", help="check replies against direct solves")
+    args = parser.parse_args()
+    if args.selftest :
+        selftest(args)
+    elif args.loadtest :
+        loadtest(args)
+    else :
+        try :
+            asyncio.run(serve(args))
+        except KeyboardInterrupt :
+            pass
+
+if __name__ == "__main__" :
+    main()
@@ -130,7 +130,7 @@ def mazecellget(x,y) :
     """
     assert(x >= 0 and x < gMazeXsize)           # subscript check
     assert(y >= 0 and y < gMazeYsize)
-    cellix = y*gMazeYsize + x                   # index into cells
+    cellix = y*gMazeXsize + x                   # index into cells
     listix = int(cellix / 16)
     bitix = (cellix % 16) * 2
     return (gMazeCells[listix] >> bitix) & 0x3  # 2 bits only
@@ -143,14 +143,12 @@ def mazecellset(x,y, newval) :
     assert(x >= 0 and x < gMazeXsize)           # subscript check
     assert(y >= 0 and y < gMazeYsize)
     assert(newval <= 0x3)                       # only 2 bits
-    cellix = y*gMazeYsize + x                   # index into cells
+    cellix = y*gMazeXsize + x                   # index into cells
     listix = int(cellix / 16)                   # word index
     bitix = (cellix % 16) * 2                   # bit index within word
     w = gMazeCells[listix]
     w = (w & (~(0x3<<bitix)))| (newval<<bitix)  # insert into word
     gMazeCells[listix] = w                      # insert word
-    while len(gMazeCells) < listix :            # fill out list as needed
-        gMazeCells.append(0)
         
 #
 #   Maze path storage - X and Y in one 32-bit value
@@ -159,7 +157,7 @@ def mazepathx(val) :
     return val & 0xffff
     
 def mazepathy(val) :
-    return (val>> 16) % 0xffff                  # Y is high half
+    return (val>> 16) & 0xffff                  # Y is high half
     
 def mazepathval(x,y) :
     assert(x >= 0 and x < 65536)
@@ -172,9 +170,7 @@ def mazeinit(xsize, ysize) :
     global gMazeXsize, gMazeYsize, gMazeCells
     gMazeXsize = xsize                          # set size of map
     gMazeYsize = ysize
-    gMazeCells = []
-    while len(gMazeCells) < xsize*ysize :       # allocate list
-        gMazeCells.append(0)
+    gMazeCells = [0] * int((xsize*ysize + 15) / 16)   # 16 cells per word
     global testdata                             # Python only
     testdata = numpy.full((xsize, ysize), 0)    # only used as check on maze cell get/set
        
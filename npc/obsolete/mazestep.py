@@ -0,0 +1,509 @@
+#
+#   mazestep.py -- resumable, step-wise maze solver
+#
+#   mazesolver.mazesolve runs to completion in one call. In LSL, a long
+#   loop starves the script's other events. Here the same algorithm is a
+#   generator, which stops whenever it needs a barrier probe, and after
+#   every move. The caller answers the probe, and the solve resumes
+#   where it left off. Many solves can be interleaved this way, and a
+#   stale one can just be dropped.
+#
+#   The generator yields two kinds of events:
+#       (MAZEPROBE, fromx, fromy, x, y)     send back the barrier value
+#       (MAZESTEP, snapshot)                moved one cell, send back None
+#   and returns the route, packed as mazesolve returns it, or [] on failure.
+#
+#   With coalesce set, a probe of an unexamined cell instead yields
+#       (MAZEPROBEBATCH, [(fromx, fromy, x, y), ...])   send back a list of barrier values
+#   covering every unexamined cell around the position probed from, so a
+#   wall following step costs at most one round trip. Side cells are
+#   probed from the center, a one cell move, as the solver's own probes
+#   are. A diagonal is probed from a side cell already known to be
+#   clear, or else from the center, never from inside a wall. Cells are
+#   still examined once, so the moves are the same as without coalescing.
+#
+#   Each MazeSolver keeps its own state, rather than mazesolver's globals,
+#   so solves do not interfere. The moves and probes, in order, are the
+#   same as mazesolver.mazesolve makes.
+#
+#   MazeScheduler runs many solves, a slice of steps and probes each in
+#   turn, and cancels by pathid and segment, as pathmazequeue.lsl does.
+#
+import collections
+import contextlib
+import io
+import random
+
+import mazesolver
+from mazesolver import MAZEBARRIER, MAZEEXAMINED, MAZEEDGEFOLLOWDX, MAZEEDGEFOLLOWDY, mazemd, mazeclipto1, mazepathval
+
+#   Events
+MAZEPROBE = 0                                   # need a barrier probe
+MAZESTEP = 1                                    # moved one cell
+MAZEPROBEBATCH = 2                              # need barrier probes for a neighborhood
+
+#   Status
+MAZERUNNING = "running"
+MAZESOLVED = "solved"
+MAZEFAILED = "failed"
+MAZECANCELLED = "cancelled"
+
+#
+#   class MazeCells -- barrier and examined bits, 2 bits per cell
+#
+class MazeCells(object) :
+
+    def __init__(self, xsize, ysize) :
+        self.xsize = xsize
+        self.ysize = ysize
+        self.cells = bytearray(xsize*ysize)     # one byte per cell, low 2 bits used
+
+    def get(self, x, y) :
+        return self.cells[y*self.xsize + x]
+
+    def set(self, x, y, v) :
+        self.cells[y*self.xsize + x] = v
+
+class MazeSnapshot(object) :
+    def __init__(self, solver) :
+        self.x = solver.x                       # current position
+        self.y = solver.y
+        self.mdbest = solver.mdbest             # best distance to goal so far
+        self.dist = mazemd(solver.x, solver.y, solver.endx, solver.endy)
+        self.pathlen = len(solver.path)
+        self.steps = solver.steps
+        self.probes = solver.probes
+        self.roundtrips = solver.roundtrips
+        self.status = solver.status
+
+    def __repr__(self) :
+        return "MazeSnapshot((%d,%d), dist %d, best %d, %d steps, %d probes, %d round trips, %s)" % (
+            self.x, self.y, self.dist, self.mdbest, self.steps, self.probes, self.roundtrips, self.status)
+
+#
+#   class MazeSolver -- one solve, run a little at a time
+#
+class MazeSolver(object) :
+
+    def __init__(self, xsize, ysize, startx, starty, endx, endy, pathid=0, segmentid=0, cells=None, coalesce=False) :
+        self.xsize = xsize
+        self.ysize = ysize
+        self.startx = startx
+        self.starty = starty
+        self.endx = endx
+        self.endy = endy
+        self.pathid = pathid
+        self.segmentid = segmentid
+        self.cells = cells if cells is not None else MazeCells(xsize, ysize)
+        self.coalesce = coalesce                # probe whole neighborhoods at once
+        self.x = startx
+        self.y = starty
+        self.mdbest = xsize + ysize + 1
+        self.path = []
+        self.steps = 0                          # moves made
+        self.probes = 0                         # barrier probes answered
+        self.roundtrips = 0                     # probe events, batched or not
+        self.status = MAZERUNNING
+        self.route = None                       # result, when done
+        self.gen = self.solvegen()
+        self.reply = None                       # answer to pending probe, sent on resume
+
+    def key(self) :
+        return (self.pathid, self.segmentid)
+
+    def snapshot(self) :
+        return MazeSnapshot(self)
+
+    def done(self) :
+        return self.status != MAZERUNNING
+
+    #
+    #   Driving the generator
+    #
+    def nextevent(self, reply=None) :
+        """
+        Resume with the answer to the last event. Returns the next event, or None when done.
+        """
+        try :
+            event = self.gen.send(reply)
+        except StopIteration as e :
+            self.route = e.value
+            self.status = MAZESOLVED if self.route else MAZEFAILED
+            return None
+        if event[0] == MAZEPROBE :
+            self.probes += 1
+            self.roundtrips += 1
+        elif event[0] == MAZEPROBEBATCH :
+            self.probes += len(event[1])
+            self.roundtrips += 1
+        return event
+
+    def advance(self, barrierfn, maxsteps=None, maxprobes=None) :
+        """
+        Run until maxsteps moves or maxprobes probes have been made, or done.
+        Returns a snapshot.
+        """
+        steps = 0
+        probes = 0
+        while not self.done() :
+            if (maxsteps is not None and steps >= maxsteps) or (maxprobes is not None and probes >= maxprobes) :
+                break
+            reply = self.reply
+            self.reply = None
+            event = self.nextevent(reply)
+            if event is None :
+                break
+            if event[0] == MAZEPROBE :
+                (_, fromx, fromy, x, y) = event
+                self.reply = barrierfn(fromx, fromy, x, y)
+                probes += 1
+            elif event[0] == MAZEPROBEBATCH :
+                self.reply = [barrierfn(fromx, fromy, x, y) for (fromx, fromy, x, y) in event[1]]
+                probes += len(event[1])
+            else :
+                steps += 1
+        return self.snapshot()
+
+    def run(self, barrierfn) :
+        """
+        Run to completion, like mazesolve
+        """
+        self.advance(barrierfn)
+        return self.route
+
+    def cancel(self) :
+        if not self.done() :
+            self.gen.close()
+            self.status = MAZECANCELLED
+            self.route = []
+
+    #
+    #   The solver. Same as mazesolver, as generators.
+    #
+    def solvegen(self) :
+        self.addtopath()                        # add initial point
+        while (self.x != self.endx or self.y != self.endy) :
+            if len(self.path) > self.xsize*self.ysize*4 :
+                return []                       # we are in an undetected loop
+            if (yield from self.existsproductivepath()) :
+                yield from self.takeproductivepath()
+                self.mdbest = mazemd(self.x, self.y, self.endx, self.endy)
+                yield (MAZESTEP, self.snapshot())
+            else :
+                (sidelr, direction) = yield from self.pickside()
+                followstartx = self.x
+                followstarty = self.y
+                followstartdir = direction
+                while (mazemd(self.x, self.y, self.endx, self.endy) >= self.mdbest
+                        or not (yield from self.existsproductivepath())) :
+                    if self.x == self.endx and self.y == self.endy :
+                        return self.path
+                    direction = yield from self.followwall(sidelr, direction)
+                    yield (MAZESTEP, self.snapshot())
+                    if len(self.path) > self.xsize*self.ysize*4 :
+                        return []               # runaway
+                    if self.x == followstartx and self.y == followstarty and direction == followstartdir :
+                        return []               # back at start of follow, stuck
+        return self.path
+
+    def addtopath(self) :
+        self.path.append(mazepathval(self.x, self.y))
+        self.steps += 1
+
+    def testcell(self, fromx, fromy, x, y) :
+        """
+        Returns 1 if occupied cell. Yields a probe the first time a cell is checked.
+        """
+        if x < 0 or x >= self.xsize or y < 0 or y >= self.ysize :
+            return 1                            # off grid, treat as occupied
+        v = self.cells.get(x, y)
+        if v & MAZEEXAMINED :
+            return v & MAZEBARRIER
+        if self.coalesce :
+            yield from self.probeneighborhood(fromx, fromy)
+            return self.cells.get(x, y) & MAZEBARRIER
+        barrier = yield (MAZEPROBE, fromx, fromy, x, y)
+        self.cells.set(x, y, MAZEEXAMINED | (MAZEBARRIER if barrier else 0))
+        return barrier
+
+    def probeneighborhood(self, cx, cy) :
+        """
+        Probe all unexamined cells of the 3x3 around (cx, cy), in one batch
+        """
+        batch = []
+        for dy in (-1, 0, 1) :
+            for dx in (-1, 0, 1) :
+                (x, y) = (cx + dx, cy + dy)
+                if (dx == 0 and dy == 0) or x < 0 or x >= self.xsize or y < 0 or y >= self.ysize :
+                    continue
+                if self.cells.get(x, y) & MAZEEXAMINED :
+                    continue
+                (fromx, fromy) = (cx, cy)
+                if dx != 0 and dy != 0 :        # diagonal, one move from a side known to be clear, if any
+                    for (sx, sy) in ((cx + dx, cy), (cx, cy + dy)) :
+                        if self.cells.get(sx, sy) & (MAZEEXAMINED | MAZEBARRIER) == MAZEEXAMINED :
+                            (fromx, fromy) = (sx, sy)
+                            break
+                batch.append((fromx, fromy, x, y))
+        barriers = yield (MAZEPROBEBATCH, batch)
+        for ((_, _, x, y), barrier) in zip(batch, barriers) :
+            self.cells.set(x, y, MAZEEXAMINED | (MAZEBARRIER if barrier else 0))
+
+    def existsproductivepath(self) :
+        dx = mazeclipto1(self.endx - self.x)
+        dy = mazeclipto1(self.endy - self.y)
+        if dx != 0 :
+            if not (yield from self.testcell(self.x, self.y, self.x + dx, self.y)) :
+                return True
+        if dy != 0 :
+            if not (yield from self.testcell(self.x, self.y, self.x, self.y + dy)) :
+                return True
+        return False
+
+    def takeproductivepath(self) :
+        dx = self.endx - self.x
+        dy = self.endy - self.y
+        clippeddx = mazeclipto1(dx)
+        clippeddy = mazeclipto1(dy)
+        assert(dx != 0 or dy != 0)              # error to call this at dest
+        if abs(dx) > abs(dy) and clippeddx :
+            if not (yield from self.testcell(self.x, self.y, self.x + clippeddx, self.y)) :
+                self.x += clippeddx
+                self.addtopath()
+                return 1
+        if clippeddy :
+            if not (yield from self.testcell(self.x, self.y, self.x, self.y + clippeddy)) :
+                self.y += clippeddy
+                self.addtopath()
+                return 1
+        if clippeddx :
+            if not (yield from self.testcell(self.x, self.y, self.x + clippeddx, self.y)) :
+                self.x += clippeddx
+                self.addtopath()
+                return 1
+        return 0
+
+    def pickside(self) :
+        dx = self.endx - self.x
+        dy = self.endy - self.y
+        assert(dx != 0 or dy != 0)
+        clippeddx = mazeclipto1(dx)
+        clippeddy = mazeclipto1(dy)
+        if abs(dx) > abs(dy) :
+            clippeddy = 0
+        else :
+            clippeddx = 0
+        blocked = yield from self.testcell(self.x, self.y, self.x + clippeddx, self.y + clippeddy)
+        assert(blocked)                         # must have hit a wall
+        if clippeddx == 1 :
+            return (mazesolver.MAZEWALLONRIGHT, 1) if dy > 0 else (mazesolver.MAZEWALLONLEFT, 3)
+        elif clippeddx == -1 :
+            return (mazesolver.MAZEWALLONLEFT, 1) if dy > 0 else (mazesolver.MAZEWALLONRIGHT, 3)
+        elif clippeddy == 1 :
+            return (mazesolver.MAZEWALLONLEFT, 0) if dx > 0 else (mazesolver.MAZEWALLONRIGHT, 2)
+        elif clippeddy == -1 :
+            return (mazesolver.MAZEWALLONRIGHT, 0) if dx > 0 else (mazesolver.MAZEWALLONLEFT, 2)
+        assert(False)                           # should never get here
+
+    def followwall(self, sidelr, direction) :
+        """
+        One wall following move. See mazesolver.mazefollowwall for the rules.
+        """
+        dx = MAZEEDGEFOLLOWDX[direction]
+        dy = MAZEEDGEFOLLOWDY[direction]
+        dxsame = MAZEEDGEFOLLOWDX[((direction + sidelr) + 4) % 4]
+        dysame = MAZEEDGEFOLLOWDY[((direction + sidelr) + 4) % 4]
+        followedside = yield from self.testcell(self.x, self.y, self.x + dxsame, self.y + dysame)
+        assert(followedside)                    # must be next to obstacle
+        blockedahead = yield from self.testcell(self.x, self.y, self.x + dx, self.y + dy)
+        if blockedahead :
+            dxopposite = MAZEEDGEFOLLOWDX[((direction - sidelr) + 4) % 4]
+            dyopposite = MAZEEDGEFOLLOWDY[((direction - sidelr) + 4) % 4]
+            blockedopposite = yield from self.testcell(self.x, self.y, self.x + dxopposite, self.y + dyopposite)
+            if blockedopposite :
+                direction = (direction + 2) % 4     # dead end, reverse direction
+            else :
+                direction = (direction - sidelr + 4) % 4  # inside corner, turn
+        else :
+            blockedsameahead = yield from self.testcell(self.x + dx, self.y + dy, self.x + dx + dxsame, self.y + dy + dysame)
+            self.x += dx                        # move ahead 1
+            self.y += dy
+            self.addtopath()
+            if not blockedsameahead :           # outside corner
+                md = mazemd(self.x, self.y, self.endx, self.endy)
+                if md < self.mdbest and (yield from self.existsproductivepath()) :
+                    return direction            # productive path halfway around corner
+                direction = (direction + sidelr + 4) % 4
+                self.x += dxsame                # move around corner
+                self.y += dysame
+                self.addtopath()
+        return direction
+
+#
+#   class MazeScheduler -- interleave many solves fairly
+#
+class MazeScheduler(object) :
+
+    def __init__(self, quantum=8) :
+        self.quantum = quantum                  # steps or probes per turn
+        self.jobs = collections.OrderedDict()   # (pathid, segmentid) -> (solver, barrierfn), in turn order
+        self.finished = []                      # solvers, in order finished
+        self.turns = 0
+
+    def submit(self, solver, barrierfn) :
+        key = solver.key()
+        if key in self.jobs :
+            (old, _) = self.jobs.pop(key)       # replaced by newer request
+            old.cancel()
+            self.finished.append(old)
+        self.jobs[key] = (solver, barrierfn)    # new request waits its turn at the back
+        return key
+
+    def cancel(self, pathid, segmentid=None) :
+        """
+        Cancel one segment, or all segments of a path
+        """
+        for key in list(self.jobs.keys()) :
+            if key[0] == pathid and (segmentid is None or key[1] == segmentid) :
+                (solver, _) = self.jobs.pop(key)
+                solver.cancel()
+                self.finished.append(solver)
+
+    def runonce(self) :
+        """
+        One turn for the job at the head of the queue. Returns False when idle.
+        """
+        if not self.jobs :
+            return False
+        (key, (solver, barrierfn)) = next(iter(self.jobs.items()))
+        self.turns += 1
+        solver.advance(barrierfn, maxsteps=self.quantum, maxprobes=self.quantum)
+        if solver.done() :
+            del self.jobs[key]
+            self.finished.append(solver)
+            if solver.status == MAZEFAILED :
+                self.cancel(solver.pathid)      # later segments of a failed path are useless
+        else :
+            self.jobs.move_to_end(key)          # back of the line
+        return True
+
+    def run(self) :
+        while self.runonce() :
+            pass
+        return self.finished
+
+#
+#   Test-only code
+#
+def recordingbarrierfn(barriers, log) :
+    def barrierfn(prevx, prevy, ix, iy) :
+        log.append((prevx, prevy, ix, iy))
+        return (ix, iy) in barriers
+    return barrierfn
+
+def runtest(xsize, ysize, startx, starty, endx, endy, barrierpairs) :
+    """
+    Step-wise solve, in small slices, must match mazesolve, probe for probe
+    """
+    barriers = set(barrierpairs)
+    expectedprobes = []
+    with contextlib.redirect_stdout(io.StringIO()) :
+        mazesolver.mazeinit(xsize, ysize)
+        expected = mazesolver.mazesolve(startx, starty, endx, endy, recordingbarrierfn(barriers, expectedprobes))
+    probes = []
+    solver = MazeSolver(xsize, ysize, startx, starty, endx, endy)
+    barrierfn = recordingbarrierfn(barriers, probes)
+    slices = 0
+    while not solver.done() :
+        solver.advance(barrierfn, maxsteps=random.randint(1,3), maxprobes=random.randint(1,3))
+        slices += 1
+    assert(solver.route == expected)
+    assert(probes == expectedprobes)
+    return slices
+
+def runcoalesced(xsize, ysize, startx, starty, endx, endy, barrierpairs) :
+    """
+    Coalesced solve must move as mazesolve does. Returns round trips (plain, coalesced) and cells probed.
+    """
+    barriers = set(barrierpairs)
+    expectedprobes = []
+    with contextlib.redirect_stdout(io.StringIO()) :
+        mazesolver.mazeinit(xsize, ysize)
+        expected = mazesolver.mazesolve(startx, starty, endx, endy, recordingbarrierfn(barriers, expectedprobes))
+    probes = []
+    solver = MazeSolver(xsize, ysize, startx, starty, endx, endy, coalesce=True)
+    route = solver.run(recordingbarrierfn(barriers, probes))
+    assert(route == expected)
+    assert(set(p[2:] for p in expectedprobes) <= set(p[2:] for p in probes))   # everything mazesolve looked at
+    assert(all(abs(fx - x) + abs(fy - y) == 1 or (abs(fx - x) == 1 and abs(fy - y) == 1) for (fx, fy, x, y) in probes))
+    assert(not any((fx, fy) in barriers for (fx, fy, x, y) in probes))      # never from inside a wall
+    assert(len(set(p[2:] for p in probes)) == len(probes))                  # each cell once
+    return (len(expectedprobes), solver.roundtrips, len(probes))
+
+def reportcoalesced(msg, results) :
+    n = len(results)
+    (plain, trips, cells) = [sum(r[i] for r in results) for i in range(3)]
+    print("%s: %d solves, same routes. Round trips per solve %1.1f before, %1.1f coalesced. Cells probed per solve %1.1f before, %1.1f coalesced." %
+        (msg, n, plain/n, trips/n, plain/n, cells/n))
+
+def testscheduler(nsolves) :
+    sched = MazeScheduler(quantum=4)
+    barrierdefs = {}
+    for n in range(nsolves) :
+        barrierpairs = mazesolver.generaterandombarrier(20, 20, 0, 0, 19, 19, 80)
+        barriers = set(barrierpairs)
+        def barrierfn(prevx, prevy, ix, iy, barriers=barriers) :
+            return (ix, iy) in barriers
+        sched.submit(MazeSolver(20, 20, 0, 0, 19, 19, pathid=n // 2, segmentid=n % 2), barrierfn)
+        barrierdefs[(n // 2, n % 2)] = barrierpairs
+    replaced = sched.jobs[(0, 0)][0]
+    sched.submit(MazeSolver(20, 20, 0, 0, 19, 19, pathid=0, segmentid=0), sched.jobs[(0, 0)][1])   # newer request
+    assert(sched.finished == [replaced] and replaced.status == MAZECANCELLED)
+    assert(list(sched.jobs)[-1] == (0, 0))     # and it waits its turn
+    sched.cancel(1)                             # path abandoned
+    sched.runonce()
+    sched.cancel(2, 1)
+    finished = sched.run()
+    for solver in finished :
+        if solver.status in (MAZESOLVED, MAZEFAILED) :
+            mazesolver.mazeinit(20, 20)
+            barriers = set(barrierdefs[solver.key()])
+            expected = mazesolver.mazesolve(0, 0, 19, 19, lambda px, py, x, y : (x, y) in barriers)
+            assert(solver.route == expected)
+    return sched
+
+def test() :
+    random.seed(37)
+    for (name, barrierpairs) in (("Barrier in center", mazesolver.BARRIERDEF1 + mazesolver.BARRIERCENTER),
+            ("Blocked", mazesolver.BARRIERDEF1 + mazesolver.BARRIERBLOCKER), ("Stuck", mazesolver.BARRIERSTUCK),
+            ("Fail 1", mazesolver.BARRIERFAIL1), ("Fail 2", mazesolver.BARRIERFAIL2), ("Fail 3", mazesolver.BARRIERFAIL3),
+            ("Fail 4", mazesolver.BARRIERFAIL4), ("Fail 5", mazesolver.BARRIERFAIL5)) :
+        slices = runtest(12, 12, 0, 0, 11, 11, barrierpairs)
+        print("%s: same as mazesolve, in %d slices." % (name, slices))
+    for n in range(200) :
+        xsize = random.choice([8, 16, 41])
+        (startx, starty, endx, endy) = (random.randrange(xsize), random.randrange(xsize), random.randrange(xsize), random.randrange(xsize))
+        if (startx, starty) == (endx, endy) :
+            continue
+        with contextlib.redirect_stdout(io.StringIO()) :
+            barrierpairs = mazesolver.generaterandombarrier(xsize, xsize, startx, starty, endx, endy, int(xsize*xsize*0.3))
+        runtest(xsize, xsize, startx, starty, endx, endy, barrierpairs)
+    print("200 random mazes: same as mazesolve.")
+    #   Coalesced neighborhood probes
+    results = []
+    for barrierpairs in (mazesolver.BARRIERFAIL1, mazesolver.BARRIERFAIL2, mazesolver.BARRIERFAIL3,
+            mazesolver.BARRIERFAIL4, mazesolver.BARRIERFAIL5) :
+        results.append(runcoalesced(12, 12, 0, 0, 11, 11, barrierpairs))
+    reportcoalesced("BARRIERFAIL1-5, 12x12", results)
+    results = []
+    for n in range(100) :
+        with contextlib.redirect_stdout(io.StringIO()) :
+            barrierpairs = mazesolver.generaterandombarrier(41, 41, 0, 0, 40, 40, int(41*41*0.3))
+        results.append(runcoalesced(41, 41, 0, 0, 40, 40, barrierpairs))
+    reportcoalesced("Random, 41x41", results)
+    with contextlib.redirect_stdout(io.StringIO()) :
+        sched = testscheduler(10)
+    print("Scheduler: %d turns, %s" % (sched.turns, ", ".join("%s %s" % (s.key(), s.status) for s in sched.finished)))
+
+if __name__=="__main__":
+    test()
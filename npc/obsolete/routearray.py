@@ -0,0 +1,183 @@
+#
+#   routearray.py -- routes as Nx2 integer arrays
+#
+#   Routes from the solvers are lists of mazepathval-packed ints,
+#   decoded one at a time with mazepathx and mazepathy. Corner removal
+#   and conversion to world coordinates, as mazecellto3d does in
+#   pathbuildutils.lsl, are then per-point loops.
+#
+#   RouteArray holds a route as an Nx2 numpy array of (x, y) cells. The
+#   conversions to and from the packed form, corner extraction, length,
+#   and the cell to world transform are all whole-array operations.
+#
+import math
+import random
+import time
+import contextlib
+import io
+import numpy
+
+import mazesolver
+
+#
+#   class RouteArray
+#
+class RouteArray(object) :
+
+    def __init__(self, pts) :
+        self.pts = numpy.asarray(pts, dtype=numpy.int32).reshape(-1, 2)   # N x 2, (x, y)
+
+    @classmethod
+    def frompacked(cls, route) :
+        """
+        From a list of mazepathval values
+        """
+        vals = numpy.asarray(route, dtype=numpy.int64)
+        return cls(numpy.stack([vals & 0xffff, (vals >> 16) & 0xffff], axis=1))
+
+    def topacked(self) :
+        """
+        To a list of mazepathval values
+        """
+        pts = self.pts.astype(numpy.int64)
+        return ((pts[:,1] << 16) | pts[:,0]).tolist()
+
+    def __len__(self) :
+        return len(self.pts)
+
+    def __eq__(self, other) :
+        return isinstance(other, RouteArray) and numpy.array_equal(self.pts, other.pts)
+
+    def cornersonly(self) :
+        """
+        Drop repeated points, and points in line with their neighbors.
+
+        Dropping the middle of an out-and-back leaves a repeated point,
+        so passes repeat until nothing changes. Each pass is whole-array.
+        Same result as mazeroutecornersonly, except that it also removes
+        out-and-back spikes mazeroutecornersonly has already passed.
+        """
+        pts = self.pts
+        while len(pts) >= 2 :
+            keep = numpy.ones(len(pts), dtype=numpy.bool_)
+            keep[1:] = numpy.any(pts[1:] != pts[:-1], axis=1)   # repeats
+            if len(pts) >= 3 :
+                prev = pts[:-2]
+                mid = pts[1:-1]
+                nxt = pts[2:]
+                inline = (((prev[:,0] == mid[:,0]) & (mid[:,0] == nxt[:,0])) |
+                          ((prev[:,1] == mid[:,1]) & (mid[:,1] == nxt[:,1])))
+                keep[1:-1] &= ~inline
+            if keep.all() :
+                break
+            pts = pts[keep]
+        return RouteArray(pts)
+
+    def segmentlengths(self) :
+        d = numpy.diff(self.pts, axis=0).astype(numpy.float64)
+        return numpy.hypot(d[:,0], d[:,1])
+
+    def length(self) :
+        """
+        Length in cells
+        """
+        return float(self.segmentlengths().sum())
+
+    def toworld(self, cellsize, pos, rot) :
+        """
+        World coordinates, N x 3, as mazecellto3d: <x*cellsize, y*cellsize, 0>*rot + pos.
+        rot is an LSL rotation, (x, y, z, s).
+        """
+        flat = numpy.zeros((len(self.pts), 3))
+        flat[:,0:2] = self.pts * cellsize
+        return flat @ rotationmatrix(rot).T + numpy.asarray(pos, dtype=numpy.float64)
+
+def rotationmatrix(rot) :
+    """
+    3x3 matrix for an LSL rotation (x, y, z, s), unit length
+    """
+    (x, y, z, s) = rot
+    return numpy.array([
+        [1 - 2*(y*y + z*z), 2*(x*y - s*z),     2*(x*z + s*y)],
+        [2*(x*y + s*z),     1 - 2*(x*x + z*z), 2*(y*z - s*x)],
+        [2*(x*z - s*y),     2*(y*z + s*x),     1 - 2*(x*x + y*y)]])
+
+#
+#   Test-only code
+#
+def mazecellto3d(x, y, cellsize, pos, rot) :
+    """
+    Per-point version, as in pathbuildutils.lsl
+    """
+    v = numpy.array([x*cellsize, y*cellsize, 0.0])
+    return rotationmatrix(rot) @ v + numpy.asarray(pos, dtype=numpy.float64)
+
+def checkcorners(corners, expected) :
+    """
+    No repeats or inline points, and a subsequence of the mazeroutecornersonly result
+    """
+    if not expected :
+        assert(len(corners) == 0)
+        return
+    pts = [tuple(p) for p in corners.pts.tolist()]
+    assert(all(pts[i] != pts[i+1] for i in range(len(pts)-1)))
+    assert(not any(mazesolver.mazeinline(*(pts[i] + pts[i+1] + pts[i+2])) for i in range(len(pts)-2)))
+    it = iter(expected)
+    assert(all(v in it for v in corners.topacked()))
+    assert(corners.topacked()[0] == expected[0] and corners.topacked()[-1] == expected[-1])
+
+def zrotation(angle) :
+    return (0.0, 0.0, math.sin(angle/2), math.cos(angle/2))
+
+def test() :
+    random.seed(42)
+    #   Packed form round trip, including the top of the range mazepathy used to get wrong
+    pts = [(0, 0), (65535, 65535), (1, 65535), (65535, 2), (300, 7)]
+    packed = [mazesolver.mazepathval(x, y) for (x, y) in pts]
+    ra = RouteArray.frompacked(packed)
+    assert(ra.pts.tolist() == [list(p) for p in pts])
+    assert(ra.topacked() == packed)
+    assert([(mazesolver.mazepathx(v), mazesolver.mazepathy(v)) for v in packed] == pts)
+    #   Corners match mazeroutecornersonly on real solver routes
+    with contextlib.redirect_stdout(io.StringIO()) :
+        for n in range(100) :
+            xsize = random.choice([12, 24, 41])
+            barrierpairs = mazesolver.generaterandombarrier(xsize, xsize, 0, 0, xsize-1, xsize-1, int(xsize*xsize*0.2))
+            mazesolver.mazeinit(xsize, xsize)
+            route = mazesolver.mazesolve(0, 0, xsize-1, xsize-1, lambda px, py, x, y : (x, y) in barrierpairs)
+            expected = mazesolver.mazeroutecornersonly(route)
+            corners = RouteArray.frompacked(route).cornersonly()
+            checkcorners(corners, expected)
+    #   World transform matches per-point
+    ra = RouteArray([(0, 0), (3, 0), (3, 5), (10, 5)])
+    for rot in (zrotation(0.0), zrotation(math.pi/2), zrotation(1.234), (0.1, 0.2, 0.3, math.sqrt(1 - 0.14))) :
+        world = ra.toworld(0.25, (128.0, 64.0, 22.5), rot)
+        for (i, (x, y)) in enumerate(ra.pts.tolist()) :
+            assert(numpy.allclose(world[i], mazecellto3d(x, y, 0.25, (128.0, 64.0, 22.5), rot)))
+    assert(ra.length() == 3 + 5 + 7)
+    #   Speed, long route
+    route = []
+    (x, y) = (0, 0)
+    for n in range(100000) :
+        if random.random() < 0.2 :
+            (x, y) = (x, y+1)
+        else :
+            (x, y) = (x+1, y) if x < 60000 else (x, y+1)
+        route.append(mazesolver.mazepathval(x, y))
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()) :
+        expected = mazesolver.mazeroutecornersonly(route)
+    t1 = time.perf_counter()
+    corners = RouteArray.frompacked(route).cornersonly().topacked()
+    t2 = time.perf_counter()
+    assert(corners == expected)
+    t3 = time.perf_counter()
+    [mazecellto3d(mazesolver.mazepathx(v), mazesolver.mazepathy(v), 0.25, (0,0,0), zrotation(0.5)) for v in expected]
+    t4 = time.perf_counter()
+    RouteArray.frompacked(expected).toworld(0.25, (0,0,0), zrotation(0.5))
+    t5 = time.perf_counter()
+    print("100000 point route: corners %1.4fs per point, %1.4fs as array. %d corners to world: %1.4fs per point, %1.4fs as array." %
+        (t1-t0, t2-t1, len(expected), t4-t3, t5-t4))
+
+if __name__=="__main__":
+    test()
@@ -0,0 +1,206 @@
+#
+#   routecache.py -- memoize maze and A* solves
+#
+#   The same (start, end) request through the same doorway comes in many
+#   times a minute. A solve only depends on the cells it examined. So
+#   each cached result keeps the cells its solve probed, with their
+#   barrier values, and is keyed by the request. The result stays good
+#   as long as no probed cell changes.
+#
+#   Results are not keyed by a hash of the probed state. Checking such a
+#   key against the world means probing every one of those cells again,
+#   which is as many probes as the solve itself. Dropping results when
+#   a probed cell changes is the same test, paid for only on change.
+#
+#   When the caller learns that a cell's barrier status changed, for
+#   example "Maze cell (x,y) was empty, now occupied", it calls
+#   cellupdate. Only results that depended on that cell are dropped.
+#
+#   The cache is LRU with a size bound, and keeps hit rate statistics.
+#
+import collections
+import contextlib
+import io
+import random
+
+import mazesolver
+import astar
+
+MAZESOLVER = "maze"                             # solver names, part of the key
+ASTAR = "astar"
+
+class CacheEntry(object) :
+    def __init__(self, result, probed) :
+        self.result = result                    # route, as the solver returned it
+        self.probed = probed                    # (x,y) -> barrier, every cell the solve examined
+
+#
+#   class RouteCache
+#
+class RouteCache(object) :
+
+    def __init__(self, maxentries=1000) :
+        self.maxentries = maxentries
+        self.entries = collections.OrderedDict()  # (solver, mapid, xsize, ysize, start, goal) -> CacheEntry
+        self.cellindex = {}                     # (mapid, x, y) -> set of keys depending on that cell
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def lookup(self, key) :
+        entry = self.entries.get(key)
+        if entry is None :
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def insert(self, key, entry) :
+        mapid = key[1]
+        self.remove(key)
+        self.entries[key] = entry
+        for (x, y) in entry.probed :
+            self.cellindex.setdefault((mapid, x, y), set()).add(key)
+        while len(self.entries) > self.maxentries :
+            self.remove(next(iter(self.entries)))   # least recently used
+            self.evictions += 1
+
+    def remove(self, key) :
+        entry = self.entries.pop(key, None)
+        if entry is None :
+            return
+        mapid = key[1]
+        for (x, y) in entry.probed :
+            keys = self.cellindex.get((mapid, x, y))
+            if keys is not None :
+                keys.discard(key)
+                if not keys :
+                    del self.cellindex[(mapid, x, y)]
+
+    def cellupdate(self, x, y, barrier, mapid=0) :
+        """
+        Cell (x,y) now has this barrier status. Drop results that saw it differently.
+        """
+        for key in list(self.cellindex.get((mapid, x, y), ())) :
+            entry = self.entries[key]
+            if bool(entry.probed[(x, y)]) != bool(barrier) :
+                self.remove(key)
+                self.invalidations += 1
+
+    def invalidatecell(self, x, y, mapid=0) :
+        """
+        Cell (x,y) may have changed. Drop every result that examined it.
+        """
+        for key in list(self.cellindex.get((mapid, x, y), ())) :
+            self.remove(key)
+            self.invalidations += 1
+
+    def clear(self) :
+        self.entries.clear()
+        self.cellindex.clear()
+
+    def hitrate(self) :
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) :
+        return { "entries" : len(self.entries), "hits" : self.hits, "misses" : self.misses,
+            "hitrate" : self.hitrate(), "evictions" : self.evictions, "invalidations" : self.invalidations }
+
+    #
+    #   Cached solvers
+    #
+    def mazesolve(self, xsize, ysize, startx, starty, endx, endy, barrierfn, mapid=0) :
+        """
+        mazeinit + mazesolve + mazeroutecornersonly + mazeoptimizeroute, cached.
+        Returns the optimized route, empty if no route.
+        """
+        key = (MAZESOLVER, mapid, xsize, ysize, (startx, starty), (endx, endy))
+        entry = self.lookup(key)
+        if entry is not None :
+            return list(entry.result)
+        probed = {}
+        def recordingfn(prevx, prevy, x, y) :
+            barrier = barrierfn(prevx, prevy, x, y)
+            probed[(x, y)] = barrier
+            return barrier
+        mazesolver.mazeinit(xsize, ysize)
+        route = mazesolver.mazesolve(startx, starty, endx, endy, recordingfn)
+        route = mazesolver.mazeoptimizeroute(mazesolver.mazeroutecornersonly(route))
+        self.insert(key, CacheEntry(list(route), probed))
+        return route
+
+    def astarsearch(self, start, end, xsize, ysize, checkbarrier, mapid=0) :
+        """
+        AStarSearch on a fresh AStarGraph, cached. Raises RuntimeError if no
+        route, as AStarSearch does. Failures are cached too.
+        """
+        key = (ASTAR, mapid, xsize, ysize, start, end)
+        entry = self.lookup(key)
+        if entry is not None :
+            if entry.result is None :
+                raise RuntimeError("A* failed to find a solution")
+            return list(entry.result)
+        probed = {}
+        def recordingfn(x, y) :
+            barrier = checkbarrier(x, y)
+            probed[(x, y)] = barrier
+            return barrier
+        try :
+            path = astar.AStarSearch(start, end, astar.AStarGraph(xsize, ysize), recordingfn)
+        except RuntimeError :
+            self.insert(key, CacheEntry(None, probed))
+            raise
+        self.insert(key, CacheEntry(list(path), probed))
+        return path
+
+#
+#   Test-only code
+#
+def runtest(xsize, ysize, barrierpairs, nrequests, msg) :
+    barriers = set(barrierpairs)
+    def barrierfn(prevx, prevy, ix, iy) :
+        return (ix, iy) in barriers
+    def checkbarrier(ix, iy) :
+        return (ix, iy) in barriers
+    free = [(x, y) for x in range(xsize) for y in range(ysize) if (x, y) not in barriers]
+    doorways = [(random.choice(free), random.choice(free)) for _ in range(4)]   # a few hot requests
+    cache = RouteCache(maxentries=50)
+    with contextlib.redirect_stdout(io.StringIO()) :   # mazesolver prints a lot
+        for n in range(nrequests) :
+            (start, end) = random.choice(doorways)
+            if start == end :
+                continue
+            route = cache.mazesolve(xsize, ysize, start[0], start[1], end[0], end[1], barrierfn)
+            mazesolver.mazeinit(xsize, ysize)
+            expected = mazesolver.mazeoptimizeroute(mazesolver.mazeroutecornersonly(
+                mazesolver.mazesolve(start[0], start[1], end[0], end[1], barrierfn)))
+            assert(route == expected)
+            try :
+                path = cache.astarsearch(start, end, xsize, ysize, checkbarrier)
+            except RuntimeError :
+                path = None
+            try :
+                expected = astar.AStarSearch(start, end, astar.AStarGraph(xsize, ysize), checkbarrier)
+            except RuntimeError :
+                expected = None
+            assert(path == expected)
+            #   Now and then something moves into the doorway
+            if n % 25 == 24 and len(free) > 2 :
+                cell = random.choice(free)
+                if cell not in (start, end) :
+                    barriers.symmetric_difference_update([cell])
+                    cache.cellupdate(cell[0], cell[1], cell in barriers)
+    print("%s: %s" % (msg, cache.stats()))
+
+def test() :
+    runtest(12, 12, mazesolver.BARRIERDEF1 + mazesolver.BARRIERCENTER, 200, "Barrier in center")
+    runtest(12, 12, mazesolver.BARRIERFAIL1, 200, "Fail 1")
+    with contextlib.redirect_stdout(io.StringIO()) :
+        barrierpairs = mazesolver.generaterandombarrier(41, 41, -1, -1, -1, -1, int(41*41*0.2))
+    runtest(41, 41, barrierpairs, 200, "Random 41x41")
+
+if __name__=="__main__":
+    test()
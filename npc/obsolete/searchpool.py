@@ -0,0 +1,287 @@
+#
+#   searchpool.py -- reusable search workspaces with O(1) reset
+#
+#   Every AStarGraph(xsize, ysize) allocates five numpy arrays and four
+#   lists, and every mazeinit a fresh cell list. A planner doing
+#   thousands of small searches a minute spends a real part of its time
+#   allocating and zeroing them.
+#
+#   A SearchWorkspace is allocated once, at its largest size, and reused.
+#   Each cell carries the generation in which it was last written. Reset
+#   just increments the generation, and a cell whose stamp is older reads
+#   as never touched. Only when the counter wraps is anything cleared.
+#
+#   WorkspacePool keeps a few workspaces per worker thread, so searches
+#   on one worker never share one. A workspace is also a cell store with
+#   get/set, so it can be a mazestep.MazeSolver's cells.
+#
+import heapq
+import random
+import threading
+import time
+import tracemalloc
+import contextlib
+import io
+
+import astar
+import mazesolver
+import mazestep
+
+MAXGENERATION = 0xffffffff                      # stamps wrap here, then a real clear
+
+#
+#   class SearchWorkspace
+#
+class SearchWorkspace(object) :
+
+    def __init__(self, capacity) :
+        self.capacity = capacity                # cells
+        self.stamp = [0] * capacity             # generation cell was last written
+        self.flags = [0] * capacity             # maze cell bits, or barrier/examined/closed for A*
+        self.gcost = [0] * capacity
+        self.camefrom = [0] * capacity          # index of previous cell
+        self.generation = 0
+        self.xsize = 0
+        self.ysize = 0
+        self.resets = 0
+        self.clears = 0
+
+    def begin(self, xsize, ysize) :
+        """
+        Start a new search. O(1).
+        """
+        if xsize*ysize > self.capacity :
+            raise ValueError("Workspace too small: %d cells, need %dx%d" % (self.capacity, xsize, ysize))
+        self.xsize = xsize
+        self.ysize = ysize
+        self.generation += 1
+        self.resets += 1
+        if self.generation > MAXGENERATION :    # rare
+            self.stamp = [0] * self.capacity
+            self.generation = 1
+            self.clears += 1
+
+    def touch(self, i) :
+        """
+        First write to cell i this generation clears its old state
+        """
+        if self.stamp[i] != self.generation :
+            self.stamp[i] = self.generation
+            self.flags[i] = 0
+            self.gcost[i] = 0
+            self.camefrom[i] = -1
+
+    #   Cell store interface, as mazestep.MazeCells
+    def get(self, x, y) :
+        i = y*self.xsize + x
+        return self.flags[i] if self.stamp[i] == self.generation else 0
+
+    def set(self, x, y, v) :
+        i = y*self.xsize + x
+        self.touch(i)
+        self.flags[i] = v
+
+#
+#   class WorkspacePool -- workspaces for one worker
+#
+class WorkspacePool(object) :
+
+    def __init__(self, maxworkspaces=4) :
+        self.maxworkspaces = maxworkspaces      # kept when idle
+        self.free = []
+        self.created = 0
+
+    @contextlib.contextmanager
+    def workspace(self, xsize, ysize) :
+        ws = self.acquire(xsize, ysize)
+        try :
+            yield ws
+        finally :
+            self.release(ws)
+
+    def acquire(self, xsize, ysize) :
+        need = xsize*ysize
+        for (ix, ws) in enumerate(self.free) :
+            if ws.capacity >= need :
+                del self.free[ix]
+                ws.begin(xsize, ysize)
+                return ws
+        ws = SearchWorkspace(need)
+        self.created += 1
+        ws.begin(xsize, ysize)
+        return ws
+
+    def release(self, ws) :
+        self.free.append(ws)
+        if len(self.free) > self.maxworkspaces :
+            self.free.sort(key=lambda w : w.capacity)
+            del self.free[0]                    # keep the big ones
+
+_workerpools = threading.local()
+
+def workerpool(maxworkspaces=4) :
+    """
+    This worker thread's pool
+    """
+    pool = getattr(_workerpools, "pool", None)
+    if pool is None :
+        pool = WorkspacePool(maxworkspaces)
+        _workerpools.pool = pool
+    return pool
+
+#
+#   A* in a workspace
+#
+EXAMINED = 0x1
+BARRIER = 0x2
+CLOSED = 0x4
+
+def astarsearch(start, end, ws, checkbarrier) :
+    """
+    A* over the workspace, begun at the grid size. 4-way moves, as AStarSearch.
+    Returns path of (x,y), start first, or raises RuntimeError.
+    """
+    xsize = ws.xsize
+    ysize = ws.ysize
+    flags = ws.flags
+    gcost = ws.gcost
+    camefrom = ws.camefrom
+    stamp = ws.stamp
+    gen = ws.generation
+    (ex, ey) = end
+    starti = start[1]*xsize + start[0]
+    endi = ey*xsize + ex
+    ws.touch(starti)
+    openlist = [(abs(start[0]-ex) + abs(start[1]-ey), 0, starti)]
+    while openlist :
+        (_, g, i) = heapq.heappop(openlist)
+        if flags[i] & CLOSED or g != gcost[i] :
+            continue                            # stale
+        if i == endi :
+            path = []
+            while i != -1 :
+                path.append((i % xsize, i // xsize))
+                i = camefrom[i] if i != starti else -1
+            path.reverse()
+            return path
+        flags[i] |= CLOSED
+        (x, y) = (i % xsize, i // xsize)
+        for (dx, dy) in astar.AStarGraph.ALLOWEDMOVES :
+            x2 = x + dx
+            y2 = y + dy
+            if x2 < 0 or x2 >= xsize or y2 < 0 or y2 >= ysize :
+                continue
+            j = y2*xsize + x2
+            if stamp[j] != gen :
+                ws.touch(j)
+            f = flags[j]
+            if f & CLOSED :
+                continue
+            if not f & EXAMINED :
+                f |= EXAMINED | (BARRIER if checkbarrier(x2, y2) else 0)
+                flags[j] = f
+            if f & BARRIER :
+                continue
+            g2 = g + 1
+            if camefrom[j] != -1 and g2 >= gcost[j] :
+                continue
+            gcost[j] = g2
+            camefrom[j] = i
+            heapq.heappush(openlist, (g2 + abs(x2-ex) + abs(y2-ey), g2, j))
+    raise RuntimeError("A* failed to find a solution")
+
+#
+#   Test-only code
+#
+def allocated(fn, n) :
+    """
+    Bytes allocated and still live after n calls, and peak during
+    """
+    tracemalloc.start()
+    try :
+        fn()                                    # warm up
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        for _ in range(n) :
+            fn()
+        (current, peak) = tracemalloc.get_traced_memory()
+    finally :
+        tracemalloc.stop()
+    return (current - base, peak - base)
+
+def test() :
+    random.seed(43)
+    size = 16
+    problems = []
+    for _ in range(300) :
+        with contextlib.redirect_stdout(io.StringIO()) :
+            barriers = set(mazesolver.generaterandombarrier(size, size, -1, -1, -1, -1, 60))
+        free = [(x, y) for x in range(size) for y in range(size) if (x, y) not in barriers]
+        (start, end) = random.sample(free, 2)
+        problems.append((start, end, barriers))
+    pool = workerpool()
+    #   Same answers as AStarSearch and mazestep
+    for (start, end, barriers) in problems :
+        check = lambda x, y : (x, y) in barriers
+        try :
+            expected = len(astar.AStarSearch(start, end, astar.AStarGraph(size, size), check))
+        except RuntimeError :
+            expected = None
+        with pool.workspace(size, size) as ws :
+            try :
+                got = len(astarsearch(start, end, ws, check))
+            except RuntimeError :
+                got = None
+        assert(got == expected)
+        barrierfn = lambda px, py, x, y : (x, y) in barriers
+        expected = mazestep.MazeSolver(size, size, start[0], start[1], end[0], end[1]).run(barrierfn)
+        with pool.workspace(size, size) as ws :
+            got = mazestep.MazeSolver(size, size, start[0], start[1], end[0], end[1], cells=ws).run(barrierfn)
+        assert(got == expected)
+    assert(pool.created == 1)
+    #   Generation wrap
+    ws = SearchWorkspace(size*size)
+    ws.generation = MAXGENERATION
+    ws.begin(size, size)
+    assert(ws.clears == 1 and ws.get(3, 3) == 0)
+    #   Time and allocation, many small searches
+    def runfresh() :
+        for (start, end, barriers) in problems :
+            try :
+                astar.AStarSearch(start, end, astar.AStarGraph(size, size), lambda x, y : (x, y) in barriers)
+            except RuntimeError :
+                pass
+    def runpooled() :
+        for (start, end, barriers) in problems :
+            with pool.workspace(size, size) as ws :
+                try :
+                    astarsearch(start, end, ws, lambda x, y : (x, y) in barriers)
+                except RuntimeError :
+                    pass
+    def newgraph() :
+        astar.AStarGraph(size, size)
+    def newworkspace() :
+        with pool.workspace(size, size) as ws :
+            pass
+    t0 = time.perf_counter()
+    runfresh()
+    t1 = time.perf_counter()
+    runpooled()
+    t2 = time.perf_counter()
+    (_, graphpeak) = allocated(newgraph, 1)
+    (kept, wspeak) = allocated(newworkspace, 1000)
+    print("%d searches, %dx%d: AStarSearch with new graphs %1.3fs, pooled workspace %1.3fs." % (len(problems), size, size, t1-t0, t2-t1))
+    print("Setup allocation per search: new AStarGraph %d bytes, pooled workspace %d bytes peak, %d bytes kept after 1000." %
+        (graphpeak, wspeak, kept))
+    tstart = time.perf_counter()
+    for _ in range(1000) :
+        astar.AStarGraph(size, size)
+    tgraph = time.perf_counter() - tstart
+    tstart = time.perf_counter()
+    for _ in range(1000) :
+        newworkspace()
+    tws = time.perf_counter() - tstart
+    print("1000 setups: AStarGraph %1.4fs, workspace reset %1.4fs." % (tgraph, tws))
+
+if __name__=="__main__":
+    test()
@@ -0,0 +1,226 @@
+#
+#   sharedgrid.py -- barrier grids in shared memory, for process pools
+#
+#   A barrierfn that closes over a list of barrier pairs has to be
+#   pickled, map and all, for every task sent to a worker process, and
+#   then tests membership in that list, O(k), on every probe.
+#
+#   SharedBarrierGrid is one byte per cell in a multiprocessing
+#   shared_memory block, with the grid size in a small header. The map
+#   is loaded once. Pickling a grid sends only the block's name, and a
+#   worker attaches to the block the first time it sees that name, so
+#   tasks carry no map at all. barrierfn and checkbarrier are O(1)
+#   lookups in the forms mazesolve and AStarSearch take.
+#
+#   The process that creates a grid owns it, and must unlink it when
+#   done. Workers only close their attachment. Before Python 3.13,
+#   attaching registers the block with the process's resource tracker,
+#   which unlinks it when that process exits, out from under the owner.
+#   Attachments here are kept out of the tracker.
+#
+import os
+import sys
+import struct
+import random
+import pickle
+import time
+import concurrent.futures
+import contextlib
+import io
+import multiprocessing
+import multiprocessing.util
+import subprocess
+from multiprocessing import shared_memory
+from multiprocessing import resource_tracker
+
+import mazesolver
+import mazestep
+
+HEADER = struct.Struct("<II")                   # xsize, ysize
+HEADERSIZE = 16                                 # cells start here
+
+_attached = {}                                  # name -> SharedBarrierGrid, this process's attachments
+
+#
+#   class SharedBarrierGrid
+#
+class SharedBarrierGrid(object) :
+
+    def __init__(self, shm, owner) :
+        self.shm = shm
+        self.owner = owner                      # created here, so unlink when done
+        (self.xsize, self.ysize) = HEADER.unpack_from(shm.buf, 0)
+        self.cells = shm.buf[HEADERSIZE:HEADERSIZE + self.xsize*self.ysize]     # memoryview, one byte per cell, y*xsize + x
+
+    @classmethod
+    def create(cls, xsize, ysize, barrierpairs=()) :
+        shm = shared_memory.SharedMemory(create=True, size=HEADERSIZE + xsize*ysize)
+        HEADER.pack_into(shm.buf, 0, xsize, ysize)
+        grid = cls(shm, True)
+        grid.load(barrierpairs)
+        return grid
+
+    @classmethod
+    def attach(cls, name) :
+        """
+        Attach to a grid made by another process
+        """
+        return cls(openuntracked(name), False)
+
+    @property
+    def name(self) :
+        return self.shm.name
+
+    def load(self, barrierpairs) :
+        for (x, y) in barrierpairs :
+            self.cells[y*self.xsize + x] = 1
+
+    def get(self, x, y) :
+        return self.cells[y*self.xsize + x]
+
+    def set(self, x, y, v) :
+        self.cells[y*self.xsize + x] = 1 if v else 0
+
+    def barrierfn(self) :
+        """
+        barrierfn(prevx, prevy, x, y) for mazesolve. Off the grid is blocked.
+        """
+        cells = self.cells
+        xsize = self.xsize
+        ysize = self.ysize
+        def barrierfn(prevx, prevy, x, y) :
+            if x < 0 or x >= xsize or y < 0 or y >= ysize :
+                return 1
+            return cells[y*xsize + x]
+        return barrierfn
+
+    def checkbarrier(self) :
+        """
+        checkbarrier(x, y) for AStarSearch
+        """
+        cells = self.cells
+        xsize = self.xsize
+        return lambda x, y : cells[y*xsize + x] != 0
+
+    def close(self) :
+        self.cells.release()                    # views must go before the block can close
+        self.shm.close()
+        _attached.pop(self.shm.name, None)
+
+    def unlink(self) :
+        """
+        Close and free the block. Owner only.
+        """
+        name = self.shm.name
+        self.close()
+        if self.owner :
+            shared_memory.SharedMemory(name=name).unlink()
+
+    def __enter__(self) :
+        return self
+
+    def __exit__(self, *args) :
+        if self.owner :
+            self.unlink()
+        else :
+            self.close()
+
+    def __reduce__(self) :
+        return (attachgrid, (self.shm.name,))   # pickles as just the name
+
+def openuntracked(name) :
+    """
+    Open an existing block without the resource tracker taking ownership.
+
+    Registering then unregistering would not do. Pool workers share the
+    owner's tracker, and the unregister would drop the owner's entry.
+    """
+    if sys.version_info >= (3, 13) :
+        return shared_memory.SharedMemory(name=name, track=False)
+    register = resource_tracker.register        # called from SharedMemory.__init__
+    def registerothers(rname, rtype) :
+        if rtype != "shared_memory" :
+            register(rname, rtype)
+    resource_tracker.register = registerothers
+    try :
+        return shared_memory.SharedMemory(name=name)
+    finally :
+        resource_tracker.register = register
+
+def attachgrid(name) :
+    """
+    This process's attachment to a grid, made on first use
+    """
+    grid = _attached.get(name)
+    if grid is None :
+        if not _attached :                      # worker processes skip atexit, but run these
+            multiprocessing.util.Finalize(None, closeattached, exitpriority=10)
+        grid = SharedBarrierGrid.attach(name)
+        _attached[name] = grid
+    return grid
+
+def closeattached() :
+    for grid in list(_attached.values()) :
+        grid.close()
+
+#
+#   Test-only code
+#
+def solveshared(task) :
+    """
+    Worker. task is (grid, start, end), the grid arriving as a name.
+    """
+    (grid, start, end) = task
+    return mazestep.MazeSolver(grid.xsize, grid.ysize, start[0], start[1], end[0], end[1]).run(grid.barrierfn())
+
+def solvelist(task) :
+    """
+    Worker, as done today. task is (xsize, ysize, barrierpairs, start, end).
+    """
+    (xsize, ysize, barrierpairs, start, end) = task
+    def barrierfn(prevx, prevy, x, y) :
+        return (x, y) in barrierpairs           # list membership, as the test programs do
+    return mazestep.MazeSolver(xsize, ysize, start[0], start[1], end[0], end[1]).run(barrierfn)
+
+def test() :
+    random.seed(47)
+    size = 128
+    with contextlib.redirect_stdout(io.StringIO()) :
+        barrierpairs = mazesolver.generaterandombarrier(size, size, -1, -1, -1, -1, size*size//8)
+    barriers = set(barrierpairs)
+    free = [(x, y) for x in range(size) for y in range(size) if (x, y) not in barriers]
+    problems = [tuple(random.sample(free, 2)) for _ in range(64)]
+    with SharedBarrierGrid.create(size, size, barrierpairs) as grid :
+        #   Same answers as the list form, in this process
+        for (start, end) in problems[:8] :
+            assert(solveshared((grid, start, end)) == solvelist((size, size, barrierpairs, start, end)))
+        #   What goes to the workers per task
+        sharedbytes = len(pickle.dumps((grid, problems[0][0], problems[0][1])))
+        listbytes = len(pickle.dumps((size, size, barrierpairs, problems[0][0], problems[0][1])))
+        ctx = multiprocessing.get_context("spawn")
+        with concurrent.futures.ProcessPoolExecutor(max_workers=4, mp_context=ctx) as pool :
+            list(pool.map(solveshared, [(grid, s, e) for (s, e) in problems[:4]]))   # start the workers
+            t0 = time.perf_counter()
+            listroutes = list(pool.map(solvelist, [(size, size, barrierpairs, s, e) for (s, e) in problems]))
+            t1 = time.perf_counter()
+            sharedroutes = list(pool.map(solveshared, [(grid, s, e) for (s, e) in problems]))
+            t2 = time.perf_counter()
+        assert(listroutes == sharedroutes)
+        #   Attach by name, as an unrelated process would
+        other = SharedBarrierGrid.attach(grid.name)
+        assert(other.xsize == size and all(other.get(x, y) == (1 if (x, y) in barriers else 0) for (x, y) in free[:100] + barrierpairs[:100]))
+        other.close()
+        #   An unrelated process attaches, reads, exits. The block must outlive it.
+        (bx, by) = barrierpairs[0]
+        out = subprocess.run([sys.executable, "-c", "import sharedgrid; g = sharedgrid.SharedBarrierGrid.attach(%r); print(g.get(%d, %d)); g.close()" %
+            (grid.name, bx, by)], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True)
+        assert(out.stdout.strip() == "1" and "leaked" not in out.stderr)
+        time.sleep(0.5)                         # its resource tracker, if any, finishes after it exits
+        other = SharedBarrierGrid.attach(grid.name)
+        assert(other.get(bx, by) == 1)
+        other.close()
+    print("%d solves on %dx%d, %d barriers, 4 workers. Barrier list: %1.2fs, %d bytes per task. Shared grid: %1.2fs, %d bytes per task." %
+        (len(problems), size, size, len(barrierpairs), t1-t0, listbytes, t2-t1, sharedbytes))
+
+if __name__=="__main__":
+    test()
@@ -0,0 +1,322 @@
+#
+#   solverprofile.py -- per-phase timing and probe heatmaps for the solvers
+#
+#   Opt-in instrumentation. instrument() swaps timing wrappers in for the
+#   solver functions that make up each phase, and uninstrument() puts the
+#   originals back. When not instrumented, the solvers run their own
+#   code, untouched, so there is no cost at all.
+#
+#   Maze solver phases:
+#       productive      mazeexistsproductivepath, mazetakeproductivepath
+#       pickside        mazepickside
+#       wallfollow      mazefollowwall
+#       corners         mazeroutecornersonly
+#       optimize        mazeoptimizeroute
+#       probe           mazetestcell
+#   A* phases:
+#       openselect      findlowestfscore
+#       openfind        findinpairlist
+#       probe           AStarGraph.update_barrier
+#       cellstore       AStarGraph.get, AStarGraph.set
+#
+#   Times are inclusive. A wall follow step's time includes the probes it made.
+#
+#   The probe heatmap counts barrier function calls per cell, and exports
+#   as a numpy array or JSON.
+#
+#   Usage:
+#       solverprofile.py phases SCENARIO        per-phase time and calls
+#       solverprofile.py profile SCENARIO       same scenario under cProfile
+#       solverprofile.py heatmap SCENARIO FILE  probe counts per cell, as JSON
+#       solverprofile.py list                   scenario names
+#       solverprofile.py test                   check the scenarios solve
+#
+#   A* scenarios are only on grids small enough for AStarGraph's 8-bit
+#   costs, about 63 steps. The random grids use seeds whose corners are
+#   connected, so the solvers have real work to do.
+#
+import sys
+import time
+import json
+import random
+import argparse
+import contextlib
+import cProfile
+import pstats
+import numpy
+
+import mazesolver
+import astar
+import flowfield
+
+MAZEPHASES = { "mazeexistsproductivepath" : "productive", "mazetakeproductivepath" : "productive",
+    "mazepickside" : "pickside", "mazefollowwall" : "wallfollow", "mazeroutecornersonly" : "corners",
+    "mazeoptimizeroute" : "optimize", "mazetestcell" : "probe" }
+ASTARFNPHASES = { "findlowestfscore" : "openselect", "findinpairlist" : "openfind" }
+ASTARMETHODPHASES = { "update_barrier" : "probe", "get" : "cellstore", "set" : "cellstore" }
+ASTARMAXSTEPS = (astar.AStarGraph.MAXCOST - 1) // 4  # longest route AStarGraph costs can hold
+
+#
+#   class PhaseTimer -- accumulated time and calls per phase
+#
+class PhaseTimer(object) :
+
+    def __init__(self) :
+        self.times = {}                         # phase -> seconds, inclusive
+        self.calls = {}                         # phase -> call count
+
+    def wrap(self, phase, fn) :
+        times = self.times
+        calls = self.calls
+        times.setdefault(phase, 0.0)
+        calls.setdefault(phase, 0)
+        clock = time.perf_counter
+        def timed(*args, **kwargs) :
+            t0 = clock()
+            try :
+                return fn(*args, **kwargs)
+            finally :
+                times[phase] += clock() - t0
+                calls[phase] += 1
+        timed.__wrapped__ = fn
+        return timed
+
+    def report(self, total=None) :
+        lines = []
+        for phase in sorted(self.times, key=lambda p : -self.times[p]) :
+            if not self.calls[phase] :
+                continue                        # other solver's phases
+            pct = " %5.1f%%" % (100.0*self.times[phase]/total,) if total else ""
+            lines.append("  %-12s %9.5fs%s %8d calls" % (phase, self.times[phase], pct, self.calls[phase]))
+        return "\n".join(lines)
+
+    def asdict(self) :
+        return { "times" : dict(self.times), "calls" : dict(self.calls) }
+
+_saved = None                                   # originals, while instrumented
+
+def instrument(timer) :
+    """
+    Install timing wrappers. Only one timer at a time.
+    """
+    global _saved
+    assert(_saved is None)                      # already instrumented
+    _saved = []
+    sites = ([(mazesolver, name, phase) for (name, phase) in MAZEPHASES.items()] +
+        [(astar, name, phase) for (name, phase) in ASTARFNPHASES.items()] +
+        [(astar.AStarGraph, name, phase) for (name, phase) in ASTARMETHODPHASES.items()])
+    try :
+        for (where, name, phase) in sites :
+            fn = getattr(where, name)
+            setattr(where, name, timer.wrap(phase, fn))
+            _saved.append((where, name, fn))
+    except BaseException :
+        uninstrument()                          # put back what was swapped so far
+        raise
+
+def uninstrument() :
+    """
+    Put the original functions back
+    """
+    global _saved
+    for (where, name, fn) in reversed(_saved or []) :
+        setattr(where, name, fn)
+    _saved = None
+
+@contextlib.contextmanager
+def instrumented(timer) :
+    instrument(timer)
+    try :
+        yield timer
+    finally :
+        uninstrument()
+
+#
+#   class ProbeHeatmap -- barrier function calls per cell
+#
+class ProbeHeatmap(object) :
+
+    def __init__(self, xsize, ysize) :
+        self.counts = numpy.zeros((xsize, ysize), dtype=numpy.int32)
+
+    def mazebarrierfn(self, barrierfn) :
+        """
+        Counting wrapper, mazesolver form
+        """
+        counts = self.counts
+        def counting(prevx, prevy, x, y) :
+            counts[x][y] += 1
+            return barrierfn(prevx, prevy, x, y)
+        return counting
+
+    def astarbarrierfn(self, checkbarrier) :
+        """
+        Counting wrapper, astar form
+        """
+        counts = self.counts
+        def counting(x, y) :
+            counts[x][y] += 1
+            return checkbarrier(x, y)
+        return counting
+
+    def asarray(self) :
+        return self.counts.copy()
+
+    def asjson(self) :
+        """
+        Rows of counts, row n being y = n, to match the dumps
+        """
+        return json.dumps({ "xsize" : int(self.counts.shape[0]), "ysize" : int(self.counts.shape[1]),
+            "total" : int(self.counts.sum()), "counts" : self.counts.T.tolist() })
+
+#
+#   Scenarios. Named, reproducible solver runs.
+#
+def randombarrier(xsize, ysize, seed, density=0.3) :
+    state = random.getstate()
+    random.seed(seed)
+    with contextlib.redirect_stdout(nullwriter()) :
+        pairs = mazesolver.generaterandombarrier(xsize, ysize, 0, 0, xsize-1, ysize-1, int(xsize*ysize*density))
+    random.setstate(state)
+    return pairs
+
+MAZEGRIDS = { "center" : (12, 12, lambda : mazesolver.BARRIERDEF1 + mazesolver.BARRIERCENTER),
+    "blocked" : (12, 12, lambda : mazesolver.BARRIERDEF1 + mazesolver.BARRIERBLOCKER),
+    "stuck" : (12, 12, lambda : mazesolver.BARRIERSTUCK),
+    "fail1" : (12, 12, lambda : mazesolver.BARRIERFAIL1), "fail2" : (12, 12, lambda : mazesolver.BARRIERFAIL2),
+    "fail3" : (12, 12, lambda : mazesolver.BARRIERFAIL3), "fail4" : (12, 12, lambda : mazesolver.BARRIERFAIL4),
+    "fail5" : (12, 12, lambda : mazesolver.BARRIERFAIL5),
+    "random41" : (41, 41, lambda : randombarrier(41, 41, 45)),          # seeds checked by test()
+    "random32" : (32, 32, lambda : randombarrier(32, 32, 34, 0.2)),
+    "random24" : (24, 24, lambda : randombarrier(24, 24, 24, 0.2)) }
+
+def astarfits(gridname) :
+    """
+    Corner to corner can fit in AStarGraph's costs
+    """
+    (xsize, ysize, _) = MAZEGRIDS[gridname]
+    return xsize + ysize - 2 <= ASTARMAXSTEPS
+
+def scenarionames() :
+    return ["%s:%s" % (solver, grid) for solver in ("maze", "astar") for grid in sorted(MAZEGRIDS)
+        if solver == "maze" or astarfits(grid)]
+
+class nullwriter :
+    def write(self, s) :
+        pass
+    def flush(self) :
+        pass
+
+def runscenario(name, heatmap=None, repeat=1, quiet=True) :
+    """
+    Run a named scenario, "solver:grid". Start is (0,0), end is the far corner.
+    Returns the heatmap, if any, and the result of the last run.
+    """
+    (solver, _, gridname) = name.partition(":")
+    if name not in scenarionames() :
+        raise ValueError("Unknown scenario \"%s\". Try: %s" % (name, ", ".join(scenarionames())))
+    (xsize, ysize, barrierdef) = MAZEGRIDS[gridname]
+    barriers = set(barrierdef())
+    if heatmap is None :
+        heatmap = ProbeHeatmap(xsize, ysize)
+    result = None
+    with contextlib.redirect_stdout(nullwriter() if quiet else sys.stdout) :
+        for _ in range(repeat) :
+            if solver == "maze" :
+                def barrierfn(prevx, prevy, ix, iy) :
+                    return (ix, iy) in barriers
+                mazesolver.mazeinit(xsize, ysize)
+                route = mazesolver.mazesolve(0, 0, xsize-1, ysize-1, heatmap.mazebarrierfn(barrierfn))
+                route = mazesolver.mazeroutecornersonly(route)
+                result = mazesolver.mazeoptimizeroute(route)
+            else :
+                def checkbarrier(ix, iy) :
+                    return (ix, iy) in barriers
+                try :
+                    result = astar.AStarSearch((0,0), (xsize-1, ysize-1), astar.AStarGraph(xsize, ysize),
+                        heatmap.astarbarrierfn(checkbarrier))
+                except RuntimeError :
+                    result = None
+    return (heatmap, result)
+
+#
+#   Test-only code
+#
+def test() :
+    """
+    Random grids must connect their corners, A* routes must fit its costs,
+    and each scenario must get the answer a shortest path search does.
+    """
+    for name in scenarionames() :
+        (solver, _, gridname) = name.partition(":")
+        (xsize, ysize, barrierdef) = MAZEGRIDS[gridname]
+        barriers = set(barrierdef())
+        field = flowfield.DistanceField(xsize, ysize, (xsize-1, ysize-1), lambda x, y : (x, y) in barriers)
+        shortest = len(field.route((0, 0))) - 1 if field.reachable((0, 0)) else None
+        if gridname.startswith("random") :
+            assert(shortest is not None)
+        if solver == "astar" :
+            assert(shortest is None or shortest <= ASTARMAXSTEPS)
+        (heatmap, result) = runscenario(name)
+        if solver == "astar" :
+            assert((result is None) == (shortest is None) and (result is None or len(result) - 1 == shortest))
+        elif gridname.startswith("random") :
+            assert(result)                      # maze solver gets there too
+        print("%-16s shortest %4s  probes %5d  %s" % (name, shortest, heatmap.counts.sum(), "found" if result else "no route"))
+    #   Failed instrumenting puts everything back
+    timer = PhaseTimer()
+    originals = ([getattr(mazesolver, name) for name in MAZEPHASES] + [getattr(astar, name) for name in ASTARFNPHASES] +
+        [getattr(astar.AStarGraph, name) for name in ASTARMETHODPHASES])
+    wrap = timer.wrap
+    def failingwrap(phase, fn) :
+        if phase == "cellstore" :
+            raise RuntimeError("wrap failed")
+        return wrap(phase, fn)
+    timer.wrap = failingwrap
+    try :
+        instrument(timer)
+        assert(False)
+    except RuntimeError :
+        pass
+    assert(_saved is None)
+    assert(originals == [getattr(mazesolver, name) for name in MAZEPHASES] + [getattr(astar, name) for name in ASTARFNPHASES] +
+        [getattr(astar.AStarGraph, name) for name in ASTARMETHODPHASES])
+    print("Self test passed.")
+
+#
+#   Main program
+#
+def main() :
+    parser = argparse.ArgumentParser(description="Profile the maze solvers")
+    parser.add_argument("cmd", choices=["phases", "profile", "heatmap", "list", "test"])
+    parser.add_argument("scenario", nargs="?", default="maze:random41")
+    parser.add_argument("outfile", nargs="?", default=None, help="heatmap JSON output")
+    parser.add_argument("--repeat", type=int, default=10, help="runs of the scenario")
+    parser.add_argument("--verbose", action="store_true", help="keep the solvers' debug printing")
+    args = parser.parse_args()
+    if args.cmd == "list" :
+        print("\n".join(scenarionames()))
+    elif args.cmd == "test" :
+        test()
+    elif args.cmd == "phases" :
+        timer = PhaseTimer()
+        t0 = time.perf_counter()
+        with instrumented(timer) :
+            runscenario(args.scenario, repeat=args.repeat, quiet=not args.verbose)
+        total = time.perf_counter() - t0
+        print("%s, %d runs, %1.4fs total:" % (args.scenario, args.repeat, total))
+        print(timer.report(total))
+    elif args.cmd == "profile" :
+        prof = cProfile.Profile()
+        prof.runcall(runscenario, args.scenario, None, args.repeat, not args.verbose)
+        pstats.Stats(prof).sort_stats("cumulative").print_stats(25)
+    elif args.cmd == "heatmap" :
+        (heatmap, _) = runscenario(args.scenario, repeat=1, quiet=not args.verbose)
+        if args.outfile :
+            with open(args.outfile, "w") as outfile :
+                outfile.write(heatmap.asjson())
+        else :
+            print(heatmap.asjson())
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,286 @@
+#
+#   spacetimeastar.py -- cooperative A* for crowds of NPCs
+#
+#   When several NPCs plan through the same doorway, each AStarSearch
+#   treats the others as not there. They meet in the doorway, dodge
+#   (bhvavoid.lsl), and replan, over and over.
+#
+#   Here the search state is (x, y, tick), not just (x, y). Each step
+#   either moves one cell, as in AStarGraph.ALLOWEDMOVES, or waits in
+#   place, and takes one tick. A shared reservation table holds the
+#   (cell, tick) claims of agents already planned. Agents are planned in
+#   priority order, and each avoids the claims of those before it:
+#   - no two agents in one cell at one tick
+#   - no two agents swapping cells between ticks
+#   - an agent that has arrived stays on its goal cell
+#   So the paths returned do not collide.
+#
+#   The heuristic is the true distance to the goal ignoring other
+#   agents, from a flowfield.DistanceField, so searches go straight to
+#   the doorway and only wait or step aside when they must. Barriers are
+#   probed once, shared by all agents, through astarbatch.SharedBarrierLayer.
+#
+#   Claims in the past are evicted as the clock advances, and an agent's
+#   claims are released when it replans or leaves.
+#
+#   Paths are lists of (x,y), one per tick, starting at the start tick.
+#
+import heapq
+import random
+
+import astar
+import astarbatch
+import flowfield
+
+#
+#   class ReservationTable -- (cell, tick) claims
+#
+class ReservationTable(object) :
+
+    def __init__(self) :
+        self.cells = {}                         # (x, y) -> {tick : agent}
+        self.edges = {}                         # (x0, y0, x1, y1, tick) -> agent, move from tick to tick+1
+        self.parked = {}                        # (x, y) -> (tick, agent), agent stays there from tick on
+        self.byagent = {}                       # agent -> [(kind, key)], for release
+        self.bytick = {}                        # tick -> [(kind, key)], for eviction
+        self.evicted = 0
+
+    def isfree(self, x, y, tick, agent=None) :
+        owner = self.cells.get((x, y), {}).get(tick)
+        if owner is not None and owner != agent :
+            return False
+        park = self.parked.get((x, y))
+        return park is None or park[1] == agent or tick < park[0]
+
+    def canmove(self, x0, y0, x1, y1, tick, agent=None) :
+        """
+        Move from (x0,y0) at tick to (x1,y1) at tick+1. Cell free, and no swap.
+        """
+        if not self.isfree(x1, y1, tick+1, agent) :
+            return False
+        owner = self.edges.get((x1, y1, x0, y0, tick))     # someone coming the other way
+        return owner is None or owner == agent
+
+    def canpark(self, x, y, tick, agent=None) :
+        """
+        Can agent stay on (x,y) from tick on, for good? Nobody else may claim it later.
+        """
+        park = self.parked.get((x, y))
+        if park is not None and park[1] != agent :
+            return False
+        for (t, owner) in self.cells.get((x, y), {}).items() :
+            if t >= tick and owner != agent :
+                return False
+        return True
+
+    def claim(self, agent, kind, key, tick) :
+        self.byagent.setdefault(agent, []).append((kind, key))
+        self.bytick.setdefault(tick, []).append((kind, key))
+
+    def unclaim(self, kind, key) :
+        """
+        Remove one claim. True if it was there.
+        """
+        if kind == "cell" :
+            (x, y, tick) = key
+            ticks = self.cells.get((x, y))
+            if ticks is None or ticks.pop(tick, None) is None :
+                return False
+            if not ticks :
+                del self.cells[(x, y)]
+            return True
+        elif kind == "edge" :
+            return self.edges.pop(key, None) is not None
+        return self.parked.pop(key, None) is not None
+
+    def reserve(self, agent, path, starttick) :
+        """
+        Claim a path, one cell per tick from starttick. The agent parks at the end.
+        """
+        self.release(agent)
+        for (i, (x, y)) in enumerate(path) :
+            tick = starttick + i
+            self.cells.setdefault((x, y), {})[tick] = agent
+            self.claim(agent, "cell", (x, y, tick), tick)
+            if i > 0 :
+                (px, py) = path[i-1]
+                self.edges[(px, py, x, y, tick-1)] = agent
+                self.claim(agent, "edge", (px, py, x, y, tick-1), tick-1)
+        self.parked[path[-1]] = (starttick + len(path) - 1, agent)
+        self.byagent[agent].append(("park", path[-1]))  # parking lasts until release
+
+    def release(self, agent) :
+        """
+        Drop all of an agent's claims
+        """
+        for (kind, key) in self.byagent.pop(agent, []) :
+            self.unclaim(kind, key)
+
+    def evict(self, tick) :
+        """
+        Drop claims for ticks before this one. They are history.
+        """
+        for t in [t for t in self.bytick if t < tick] :
+            for (kind, key) in self.bytick.pop(t) :
+                if self.unclaim(kind, key) :
+                    self.evicted += 1
+
+    def size(self) :
+        return sum(len(ticks) for ticks in self.cells.values()) + len(self.edges) + len(self.parked)
+
+WAIT = (0, 0)
+
+def spacetimesearch(agent, start, goal, starttick, xsize, ysize, barriers, table, field, horizon) :
+    """
+    A* over (x, y, tick). Returns a path, one cell per tick, or raises RuntimeError.
+    """
+    if not table.isfree(start[0], start[1], starttick, agent) :
+        raise RuntimeError("Start cell already claimed at tick %d" % (starttick,))
+    h0 = field.dist[start[0]][start[1]]
+    if h0 == flowfield.UNREACHED :
+        raise RuntimeError("A* failed to find a solution")
+    state = (start[0], start[1], starttick)
+    camefrom = {}
+    gcost = { state : 0 }
+    openlist = [(h0, 0, state)]                 # (f, -g, state)
+    moves = list(astar.AStarGraph.ALLOWEDMOVES) + [WAIT]
+    while openlist :
+        (f, negg, state) = heapq.heappop(openlist)
+        (x, y, tick) = state
+        if gcost.get(state) != -negg :
+            continue                            # stale
+        if (x, y) == goal and table.canpark(x, y, tick, agent) :
+            path = [(x, y)]
+            while state in camefrom :
+                state = camefrom[state]
+                path.append((state[0], state[1]))
+            path.reverse()
+            return path
+        if tick - starttick >= horizon :
+            continue                            # give up on this branch
+        for (dx, dy) in moves :
+            (x2, y2) = (x + dx, y + dy)
+            if x2 < 0 or x2 >= xsize or y2 < 0 or y2 >= ysize :
+                continue
+            if not table.canmove(x, y, x2, y2, tick, agent) :
+                continue
+            if (dx, dy) != WAIT and barriers.check(x2, y2) :
+                continue
+            h = field.dist[x2][y2]
+            if h == flowfield.UNREACHED :
+                continue
+            nextstate = (x2, y2, tick+1)
+            g = -negg + 1
+            if g >= gcost.get(nextstate, g+1) :
+                continue
+            gcost[nextstate] = g
+            camefrom[nextstate] = state
+            heapq.heappush(openlist, (g + h, -g, nextstate))
+    raise RuntimeError("A* failed to find a solution")
+
+#
+#   class CooperativePlanner -- plans agents in priority order
+#
+class CooperativePlanner(object) :
+
+    def __init__(self, xsize, ysize, checkbarrier, horizon=None) :
+        self.xsize = xsize
+        self.ysize = ysize
+        self.barriers = astarbatch.SharedBarrierLayer(xsize, ysize, checkbarrier)
+        self.table = ReservationTable()
+        self.fields = flowfield.FlowFieldCache()
+        self.horizon = horizon if horizon is not None else 2*(xsize + ysize)   # ticks, beyond shortest
+        self.gridversion = 0
+
+    def plan(self, agents, tick) :
+        """
+        agents is [(agent, start, goal), ...], highest priority first.
+        Returns {agent : path}, path None if that agent could not be planned.
+        """
+        self.table.evict(tick)
+        paths = {}
+        for (agent, start, goal) in agents :
+            self.table.release(agent)           # replanning
+            field = self.fields.getfield(goal, self.gridversion, self.xsize, self.ysize, self.barriers.check)
+            if not field.reachable(start) :
+                paths[agent] = None
+                continue
+            try :
+                path = spacetimesearch(agent, start, goal, tick, self.xsize, self.ysize, self.barriers, self.table,
+                    field, field.dist[start[0]][start[1]] + self.horizon)
+            except RuntimeError :
+                paths[agent] = None
+                continue
+            self.table.reserve(agent, path, tick)
+            paths[agent] = path
+        return paths
+
+    def leave(self, agent) :
+        self.table.release(agent)
+
+#
+#   Test-only code
+#
+def countconflicts(paths) :
+    """
+    Vertex and swap conflicts among paths, one cell per tick, agents parking at the end
+    """
+    paths = [p for p in paths if p]
+    length = max(len(p) for p in paths)
+    def at(p, t) :
+        return p[min(t, len(p)-1)]
+    conflicts = 0
+    for t in range(length) :
+        seen = {}
+        for p in paths :
+            cell = at(p, t)
+            if cell in seen :
+                conflicts += 1
+            seen[cell] = p
+        if t > 0 :
+            moves = set()
+            for p in paths :
+                move = (at(p, t-1), at(p, t))
+                if move[0] != move[1] and (move[1], move[0]) in moves :
+                    conflicts += 1
+                moves.add(move)
+    return conflicts
+
+def runtest(xsize, ysize, barrierpairs, agents, msg) :
+    barriers = set(barrierpairs)
+    def checkbarrier(ix, iy) :
+        return (ix, iy) in barriers
+    fields = flowfield.FlowFieldCache()
+    independent = [fields.route(start, goal, 0, xsize, ysize, checkbarrier) for (_, start, goal) in agents]
+    planner = CooperativePlanner(xsize, ysize, checkbarrier)
+    paths = planner.plan(agents, 0)
+    planned = [paths[agent] for (agent, _, _) in agents]
+    for (path, (_, start, goal)) in zip(planned, agents) :
+        assert(path is None or (path[0] == start and path[-1] == goal))
+        for (a, b) in zip(path or [], (path or [])[1:]) :
+            assert(abs(a[0]-b[0]) + abs(a[1]-b[1]) <= 1 and b not in barriers)
+    assert(countconflicts(planned) == 0)
+    delay = sum(len(p) - len(q) for (p, q) in zip(planned, independent) if p)
+    print("%s: %d agents. Independent paths: %d conflicts. Cooperative: %d conflicts, %d planned, %d ticks total delay, %d probes, %d claims." %
+        (msg, len(agents), countconflicts(independent), countconflicts(planned), sum(1 for p in planned if p), delay,
+        planner.barriers.probes, planner.table.size()))
+    #   Time passes, and the planner replans the first agent from where it is
+    (agent, start, goal) = agents[0]
+    if planned[0] and len(planned[0]) > 5 :
+        paths = planner.plan([(agent, planned[0][5], goal)], 5)
+        assert(planner.table.evicted > 0)
+        assert(countconflicts([paths[agent]] + [p[5:] for p in planned[1:] if p and len(p) > 5]) == 0)
+
+def test() :
+    random.seed(41)
+    #   Wall across the middle, with a one cell doorway
+    wall = [(x, 10) for x in range(20) if x != 10]
+    agents = [(n, (2*n, 0), (19 - 2*n, 19)) for n in range(5)] + [(n+5, (2*n+1, 19), (18 - 2*n, 0)) for n in range(5)]
+    runtest(20, 20, wall, agents, "Doorway, both ways")
+    free = [(x, y) for x in range(24) for y in range(24)]
+    cells = random.sample(free, 40)
+    agents = [(n, cells[2*n], cells[2*n+1]) for n in range(20)]
+    runtest(24, 24, [], agents, "Open 24x24, 20 agents")
+
+if __name__=="__main__":
+    test()
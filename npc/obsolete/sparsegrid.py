@@ -0,0 +1,242 @@
+#
+#   sparsegrid.py -- sparse cell storage for large, mostly empty maps
+#
+#   mazeinit allocates a list entry per cell, and AStarGraph five dense
+#   numpy arrays and four lists. At 0.25m cells, a 256m parking lot is
+#   1024x1024 cells, almost all of them empty.
+#
+#   RunLengthGrid stores each row as runs of equal values. A row nobody
+#   has touched takes no space. Probed open ground is long runs of
+#   "examined, clear", so memory goes with the number of obstacle edges
+#   crossed, not the area. It can be a mazestep.MazeSolver's cells.
+#
+#   SparseAStarGraph is an AStarGraph whose per-cell layers only hold
+#   cells the search has touched. The barrier layer is run-length
+#   encoded, the rest are dicts. Layers still index as layer[x][y], so
+#   AStarSearch and dump work unchanged.
+#
+import bisect
+import contextlib
+import io
+import random
+import tracemalloc
+
+import astar
+import mazesolver
+import mazestep
+
+#
+#   class RunLengthGrid -- rows of (start, value) runs
+#
+class RunLengthGrid(object) :
+
+    def __init__(self, xsize, ysize, default=0) :
+        self.xsize = xsize
+        self.ysize = ysize
+        self.default = default
+        self.rows = {}                          # y -> (starts, values). Run i is starts[i] .. starts[i+1]-1.
+
+    def get(self, x, y) :
+        row = self.rows.get(y)
+        if row is None :
+            return self.default
+        (starts, values) = row
+        return values[bisect.bisect_right(starts, x) - 1]
+
+    def set(self, x, y, v) :
+        row = self.rows.get(y)
+        if row is None :
+            if v == self.default :
+                return
+            row = ([0], [self.default])
+            self.rows[y] = row
+        (starts, values) = row
+        i = bisect.bisect_right(starts, x) - 1
+        old = values[i]
+        if old == v :
+            return
+        runend = starts[i+1] if i+1 < len(starts) else self.xsize
+        newstarts = [x]
+        newvalues = [v]
+        if starts[i] < x :                      # keep the part before x
+            newstarts.insert(0, starts[i])
+            newvalues.insert(0, old)
+        if x+1 < runend :                       # and the part after
+            newstarts.append(x+1)
+            newvalues.append(old)
+        starts[i:i+1] = newstarts
+        values[i:i+1] = newvalues
+        #   Merge with neighbors of the same value
+        lo = max(i-1, 0)
+        j = min(i + len(newstarts), len(starts) - 1)
+        while j > lo :
+            if values[j] == values[j-1] :
+                del starts[j]
+                del values[j]
+            j -= 1
+        if len(starts) == 1 and values[0] == self.default :
+            del self.rows[y]                    # row back to all default
+
+    def runs(self) :
+        return sum(len(starts) for (starts, _) in self.rows.values())
+
+    def __getitem__(self, x) :
+        return GridColumn(self, x)
+
+class GridColumn(object) :
+    """
+    grid[x][y] indexing, as with the numpy layers
+    """
+    def __init__(self, grid, x) :
+        self.grid = grid
+        self.x = x
+
+    def __getitem__(self, y) :
+        return self.grid.get(self.x, y)
+
+    def __setitem__(self, y, v) :
+        self.grid.set(self.x, y, v)
+
+#
+#   class SparseLayer -- touched cells only
+#
+class SparseLayer(object) :
+
+    def __init__(self, default=0) :
+        self.default = default
+        self.cells = {}                         # (x,y) -> value
+
+    def get(self, x, y) :
+        return self.cells.get((x, y), self.default)
+
+    def set(self, x, y, v) :
+        if v == self.default :
+            self.cells.pop((x, y), None)
+        else :
+            self.cells[(x, y)] = v
+
+    def __getitem__(self, key) :
+        if isinstance(key, tuple) :             # layer[x,y], as numpy allows
+            return self.get(key[0], key[1])
+        return GridColumn(self, key)
+
+#
+#   class SparseAStarGraph -- AStarGraph with sparse layers
+#
+class SparseAStarGraph(astar.AStarGraph) :
+
+    def __init__(self, xsize, ysize) :
+        self.xsize = xsize
+        self.ysize = ysize
+        self.barrierarray = RunLengthGrid(xsize, ysize)     # 0 unknown, 1 obstacle, -1 clear
+        self.closedverticesarray = SparseLayer()
+        self.camefromarray = SparseLayer()
+        self.gcostarray = SparseLayer()
+        self.datacheck = SparseLayer()
+        self.data = SparseLayer()               # packed 16-bit values, in place of data0..data3
+
+    def get(self, x, y) :
+        v = self.data.get(x, y)
+        assert(v == self.datacheck.get(x, y))   # check
+        return v
+
+    def set(self, x, y, newval, mask = 0xffff) :
+        assert(mask & ~0xffff == 0)             # stay in 16 bits
+        assert(newval & ~0xffff == 0)
+        newval = newval & mask
+        self.datacheck.set(x, y, (self.datacheck.get(x, y) & ~mask) | newval)   # for checking only
+        self.data.set(x, y, (self.data.get(x, y) & ~mask) | newval)
+        assert(newval == mask & self.get(x,y))
+
+#
+#   Test-only code
+#
+def measure(fn) :
+    """
+    Run fn, returning (result, peak bytes allocated)
+    """
+    tracemalloc.start()
+    try :
+        result = fn()
+        (_, peak) = tracemalloc.get_traced_memory()
+    finally :
+        tracemalloc.stop()
+    return (result, peak)
+
+def testgrid() :
+    """
+    RunLengthGrid must act like a dense array
+    """
+    grid = RunLengthGrid(37, 5)
+    dense = [[0]*5 for _ in range(37)]
+    for _ in range(5000) :
+        (x, y, v) = (random.randrange(37), random.randrange(5), random.choice([0, 0, 1, 2, 3]))
+        grid[x][y] = v
+        dense[x][y] = v
+        for (starts, values) in grid.rows.values() :
+            assert(all(values[i] != values[i+1] for i in range(len(values)-1)))     # runs merged
+    assert(all(grid[x][y] == dense[x][y] for x in range(37) for y in range(5)))
+
+def testsame(xsize, barrierpairs, start, end) :
+    """
+    Sparse storage must give the same routes as dense
+    """
+    barriers = set(barrierpairs)
+    def barrierfn(prevx, prevy, ix, iy) :
+        return (ix, iy) in barriers
+    def checkbarrier(ix, iy) :
+        return (ix, iy) in barriers
+    dense = mazestep.MazeSolver(xsize, xsize, start[0], start[1], end[0], end[1]).run(barrierfn)
+    sparse = mazestep.MazeSolver(xsize, xsize, start[0], start[1], end[0], end[1],
+        cells=RunLengthGrid(xsize, xsize)).run(barrierfn)
+    assert(dense == sparse)
+    try :
+        dense = astar.AStarSearch(start, end, astar.AStarGraph(xsize, xsize), checkbarrier)
+    except RuntimeError :
+        dense = None
+    try :
+        sparse = astar.AStarSearch(start, end, SparseAStarGraph(xsize, xsize), checkbarrier)
+    except RuntimeError :
+        sparse = None
+    assert(dense == sparse)
+
+def testmemory(size) :
+    """
+    Open field with a few buildings, solved with dense and sparse storage
+    """
+    barriers = set()
+    for (bx, by) in [(200, 180), (500, 520), (800, 300), (300, 800)] :
+        barriers.update((x, y) for x in range(bx, bx+120) for y in range(by, by+60))
+    def barrierfn(prevx, prevy, ix, iy) :
+        return (ix, iy) in barriers
+    def checkbarrier(ix, iy) :
+        return (ix, iy) in barriers
+    (start, end) = ((10, 10), (size-10, size-10))
+    (dense, densebytes) = measure(lambda : mazestep.MazeSolver(size, size, start[0], start[1], end[0], end[1]).cells)
+    cells = RunLengthGrid(size, size)
+    (route, sparsebytes) = measure(lambda : mazestep.MazeSolver(size, size, start[0], start[1], end[0], end[1], cells=cells).run(barrierfn))
+    print("Maze solver, %dx%d: dense cells %d bytes before solving. Sparse, whole solve, %d bytes, %d runs, route %d cells." %
+        (size, size, densebytes, sparsebytes, cells.runs(), len(route)))
+    (start, end) = ((480, 490), (530, 500))     # A* costs are 8 bits, so short hops only
+    (_, densebytes) = measure(lambda : astar.AStarSearch(start, end, astar.AStarGraph(size, size), checkbarrier))
+    (path, sparsebytes) = measure(lambda : astar.AStarSearch(start, end, SparseAStarGraph(size, size), checkbarrier))
+    print("A*, %dx%d: dense graph %d bytes, sparse graph %d bytes, path %d cells." % (size, size, densebytes, sparsebytes, len(path)))
+
+def test() :
+    random.seed(39)
+    testgrid()
+    for (barrierpairs, start, end) in ((mazesolver.BARRIERDEF1 + mazesolver.BARRIERCENTER, (0,0), (11,11)),
+            (mazesolver.BARRIERFAIL1, (0,0), (11,11)), (mazesolver.BARRIERFAIL4, (0,0), (11,11))) :
+        testsame(12, barrierpairs, start, end)
+    for _ in range(100) :
+        (start, end) = ((random.randrange(16), random.randrange(16)), (random.randrange(16), random.randrange(16)))
+        if start == end :
+            continue
+        with contextlib.redirect_stdout(io.StringIO()) :
+            barrierpairs = mazesolver.generaterandombarrier(16, 16, start[0], start[1], end[0], end[1], 60)
+        testsame(16, barrierpairs, start, end)
+    print("Sparse and dense storage give the same routes.")
+    testmemory(1024)
+
+if __name__=="__main__":
+    test()
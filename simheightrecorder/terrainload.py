@@ -0,0 +1,132 @@
+#
+#   terrainload.py -- load generator for terrainserver.py
+#
+#   Replays recorded uploads against a terrain server, from many
+#   simulated objects at once, and reports throughput and latency.
+#
+#   Recordings are JSONL, one upload per line:
+#
+#       {"path": "/actions/uploadterrain.fcgi", "body": "..."}
+#
+#   terrainserver.py --record writes this format. With --synthesize,
+#   random region uploads in the elevstojson format are generated instead.
+#
+#   License: GPLv3.
+#
+import asyncio
+import argparse
+import collections
+import json
+import random
+import time
+
+import terrainserver
+
+def readrecording(fname) :
+    """
+    Read recorded uploads. Returns list of (path, body)
+    """
+    uploads = []
+    with open(fname, "r") as infile :
+        for line in infile :
+            line = line.strip()
+            if line :
+                item = json.loads(line)
+                uploads.append((item["path"], item["body"]))
+    return uploads
+
+def synthesizeterrain(n) :
+    """
+    Generate fake region uploads, same shape as simheightlogger.lsl sends.
+    """
+    uploads = []
+    for i in range(n) :
+        rows = []
+        for x in range(terrainserver.TERRAINSAMPLES) :
+            rows.append("".join("%02X" % (random.randrange(256),) for y in range(terrainserver.TERRAINSAMPLES)))
+        jsn = { "grid" : "agni", "name" : "Region %d" % (i,), "scale" : random.uniform(1.0, 100.0),
+            "offset" : random.uniform(0.0, 50.0), "water_lev" : 20.0,
+            "region_coords" : [256*(1000 + i % 100), 256*(1000 + i // 100)], "elevs" : rows }
+        uploads.append((terrainserver.TERRAINPATH, json.dumps(jsn)))
+    return uploads
+
+#
+#   class LoadStats -- client side results
+#
+class LoadStats(object) :
+
+    def __init__(self) :
+        self.statuses = collections.Counter()
+        self.latencies = []
+        self.errors = 0
+        self.bytes = 0
+
+    def report(self, elapsed) :
+        n = len(self.latencies)
+        print("Requests: %d in %1.2fs, %1.1f/s, %1.2f MB/s" % (n, elapsed, n / max(elapsed, 0.001),
+            self.bytes / max(elapsed, 0.001) / 1e6))
+        print("Statuses: %s  Connection errors: %d" % (dict(self.statuses), self.errors))
+        if n > 0 :
+            lats = sorted(self.latencies)
+            print("Latency p50 %1.4fs  p95 %1.4fs  p99 %1.4fs  max %1.4fs" % (lats[int(n*0.50)],
+                lats[min(n-1, int(n*0.95))], lats[min(n-1, int(n*0.99))], lats[-1]))
+
+async def postone(host, port, path, body, stats) :
+    """
+    One upload, one connection, like llHTTPRequest does it
+    """
+    data = body.encode("utf-8")
+    t0 = time.perf_counter()
+    try :
+        reader, writer = await asyncio.open_connection(host, port)
+        try :
+            writer.write(("POST %s HTTP/1.1\r\nHost: %s\r\nContent-Type: text/plain; charset=utf-8\r\n"
+                "Content-Length: %d\r\nConnection: close\r\n\r\n" % (path, host, len(data))).encode("latin-1") + data)
+            await writer.drain()
+            statusline = await reader.readline()
+            await reader.read()                         # rest of reply
+        finally :
+            writer.close()
+        status = int(statusline.split()[1])
+    except (ConnectionError, OSError, IndexError, ValueError) :
+        stats.errors += 1
+        return
+    stats.latencies.append(time.perf_counter() - t0)
+    stats.statuses[status] += 1
+    stats.bytes += len(data)
+
+async def runload(host, port, uploads, objects, repeat) :
+    """
+    Each simulated object works through its share of the uploads, one at a time.
+    """
+    stats = LoadStats()
+    work = uploads * repeat
+    async def obj(ix) :
+        for n in range(ix, len(work), objects) :
+            (path, body) = work[n]
+            await postone(host, port, path, body, stats)
+    t0 = time.perf_counter()
+    await asyncio.gather(*[obj(i) for i in range(objects)])
+    stats.report(time.perf_counter() - t0)
+    return stats
+
+def main() :
+    parser = argparse.ArgumentParser(description="Replay terrain uploads against terrainserver.py")
+    parser.add_argument("recording", nargs="?", default=None, help="JSONL file of recorded uploads")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--objects", type=int, default=50, help="concurrent uploading objects")
+    parser.add_argument("--repeat", type=int, default=1, help="replay the recording this many times")
+    parser.add_argument("--synthesize", type=int, default=0, help="generate this many fake region uploads")
+    args = parser.parse_args()
+    if args.recording :
+        uploads = readrecording(args.recording)
+    elif args.synthesize > 0 :
+        uploads = synthesizeterrain(args.synthesize)
+    else :
+        parser.error("Need a recording or --synthesize")
+    print("Replaying %d uploads x %d from %d objects" % (len(uploads), args.repeat, args.objects))
+    asyncio.run(runload(args.host, args.port, uploads, args.objects, args.repeat))
+
+if __name__ == "__main__" :
+    main()
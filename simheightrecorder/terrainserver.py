@@ -0,0 +1,332 @@
+#
+#   terrainserver.py -- local stand-in for the terrain upload endpoint
+#
+#   Accepts the same POST requests that simheightlogger.lsl and
+#   uploadasset.lsl send to the animats.info FastCGI endpoints:
+#
+#       POST /actions/uploadterrain.fcgi                JSON object, one region
+#       POST /actions/uploadimpostor.fcgi?version=1.0   JSON array of impostors
+#
+#   Decoded uploads are queued and written to a SQLite terrain store in
+#   batches. The queue is bounded. When it is full, new uploads wait a
+#   little, then get a 503 so the in-world script backs off.
+#
+#       GET /stats                                      counters, as JSON
+#
+#   Use terrainload.py to replay recorded uploads against this. The HTTP
+#   handling is npc/obsolete/httpserve.py, shared with the other local
+#   test services.
+#
+#   License: GPLv3.
+#
+import asyncio
+import argparse
+import collections
+import json
+import os
+import sqlite3
+import sys
+import time
+import concurrent.futures
+from urllib.parse import urlsplit, parse_qs
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "npc", "obsolete"))
+import httpserve
+
+TERRAINPATH = "/actions/uploadterrain.fcgi"
+IMPOSTORPATH = "/actions/uploadimpostor.fcgi"
+STATSPATH = "/stats"
+
+TERRAINSAMPLES = 65                             # 65x65 samples per region, see elevstojson
+LATENCYWINDOW = 10000                           # latencies kept for percentiles
+
+RETRYAFTER = { "Retry-After" : "5" }             # on 503, secs
+
+class UploadError(httpserve.HTTPError) :
+    """
+    Bad upload. Becomes an HTTP error status.
+    """
+    pass
+
+#
+#   Decoding. These take the raw body and return rows for the store.
+#
+def hex2list(s) :
+    """
+    Inverse of list2hex in simheightlogger.lsl
+    """
+    if len(s) % 2 != 0 :
+        raise ValueError("Odd length hex string")
+    return list(bytes.fromhex(s))
+
+def decodeterrain(body) :
+    """
+    Decode one region's elevations, as sent by elevstojson.
+
+    Returns a tuple ready for TerrainStore.
+    """
+    try :
+        jsn = json.loads(body)
+        elevs = jsn["elevs"]
+        if isinstance(elevs, str) :             # llList2Json may quote the inner array
+            elevs = json.loads(elevs)
+        rows = [hex2list(s) for s in elevs]
+        (rx, ry) = jsn["region_coords"]
+        row = (jsn.get("grid",""), jsn["name"], int(rx), int(ry), float(jsn["scale"]), float(jsn["offset"]),
+            float(jsn.get("water_lev", 0.0)), json.dumps(rows), time.time())
+    except (ValueError, KeyError, TypeError) as err :
+        raise UploadError(400, "Bad terrain upload: %s" % (err,))
+    if len(rows) != TERRAINSAMPLES or any(len(r) != TERRAINSAMPLES for r in rows) :
+        raise UploadError(400, "Bad terrain upload: expected %dx%d samples" % (TERRAINSAMPLES, TERRAINSAMPLES))
+    return row
+
+def decodeimpostors(body, version) :
+    """
+    Decode a batch of impostors, as sent by dump_all_texture_uuids.
+    """
+    try :
+        items = json.loads(body)
+        rows = []
+        for item in items :
+            (x, y) = item["region_loc"]
+            rows.append((item["asset_uuid"], item["asset_name"], item["prefix"], item.get("grid",""),
+                int(x), int(y), item["region_hash"], int(item["impostor_lod"]), int(item["viz_group"]),
+                json.dumps(item), version, time.time()))
+    except (ValueError, KeyError, TypeError) as err :
+        raise UploadError(400, "Bad impostor upload: %s" % (err,))
+    return rows
+
+#
+#   class TerrainStore -- SQLite storage for uploads
+#
+#   All calls must come from one thread. The server uses a single-thread executor.
+#
+class TerrainStore(object) :
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS terrain (
+            grid TEXT, name TEXT, region_x INTEGER, region_y INTEGER,
+            scale REAL, offset REAL, water_lev REAL, elevs TEXT, received REAL,
+            PRIMARY KEY (grid, region_x, region_y));
+        CREATE TABLE IF NOT EXISTS impostors (
+            asset_uuid TEXT PRIMARY KEY, asset_name TEXT, prefix TEXT, grid TEXT,
+            region_x INTEGER, region_y INTEGER, region_hash TEXT, impostor_lod INTEGER,
+            viz_group INTEGER, data TEXT, version TEXT, received REAL);
+        """
+
+    def __init__(self, fname) :
+        self.fname = fname
+        self.conn = None
+
+    def open(self) :
+        self.conn = sqlite3.connect(self.fname)
+        self.conn.execute("PRAGMA journal_mode=WAL")    # readers do not block the writer
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+
+    def writebatch(self, terrainrows, impostorrows) :
+        """
+        Write a batch of decoded uploads in one transaction
+        """
+        with self.conn :
+            if terrainrows :
+                self.conn.executemany("INSERT OR REPLACE INTO terrain VALUES (?,?,?,?,?,?,?,?,?)", terrainrows)
+            if impostorrows :
+                self.conn.executemany("INSERT OR REPLACE INTO impostors VALUES (?,?,?,?,?,?,?,?,?,?,?,?)", impostorrows)
+
+    def close(self) :
+        if self.conn :
+            self.conn.close()
+            self.conn = None
+
+#
+#   class ServerStats -- throughput and latency counters
+#
+class ServerStats(object) :
+
+    def __init__(self) :
+        self.starttime = time.time()
+        self.requests = 0                       # all requests
+        self.uploads = 0                        # uploads stored
+        self.bytes = 0                          # body bytes received
+        self.statuses = collections.Counter()   # by HTTP status
+        self.batches = 0                        # store transactions
+        self.rowswritten = 0
+        self.latencies = collections.deque(maxlen=LATENCYWINDOW)   # request receipt to reply, secs
+        self.batchtimes = collections.deque(maxlen=LATENCYWINDOW)  # store write time, secs
+
+    def percentile(self, vals, pct) :
+        if len(vals) == 0 :
+            return 0.0
+        vals = sorted(vals)
+        return vals[min(len(vals)-1, int(len(vals)*pct/100.0))]
+
+    def asdict(self, queuedepth) :
+        elapsed = max(time.time() - self.starttime, 0.001)
+        return { "uptime" : elapsed, "requests" : self.requests, "uploads" : self.uploads,
+            "bytes" : self.bytes, "uploads_per_sec" : self.uploads / elapsed,
+            "statuses" : dict((str(k),v) for (k,v) in self.statuses.items()),
+            "batches" : self.batches, "rows_written" : self.rowswritten, "queue_depth" : queuedepth,
+            "latency_p50" : self.percentile(self.latencies, 50),
+            "latency_p95" : self.percentile(self.latencies, 95),
+            "latency_p99" : self.percentile(self.latencies, 99),
+            "batch_write_p50" : self.percentile(self.batchtimes, 50),
+            "batch_write_p99" : self.percentile(self.batchtimes, 99) }
+
+#
+#   class TerrainServer -- the asyncio HTTP receiver
+#
+class TerrainServer(object) :
+
+    def __init__(self, store, queuesize=1000, batchsize=100, batchwait=0.05, queuetimeout=2.0, recordfile=None) :
+        self.store = store
+        self.queue = asyncio.Queue(maxsize=queuesize)   # bounded - this is the backpressure
+        self.batchsize = batchsize                      # max uploads per store transaction
+        self.batchwait = batchwait                      # (s) wait this long to fill a batch
+        self.queuetimeout = queuetimeout                # (s) wait this long for queue space, then 503
+        self.recordfile = recordfile                    # save accepted uploads for terrainload.py
+        self.stats = ServerStats()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)  # SQLite is single thread
+        self.writertask = None
+
+    async def start(self, host, port) :
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self.store.open)
+        self.writertask = asyncio.create_task(self.writer())
+        return await httpserve.startserver(self.handle, host, port, self.replied)
+
+    async def writer(self) :
+        """
+        Drain the queue in batches into the store.
+
+        Each queue item is (kind, rows, future). The future is completed
+        when the rows are committed, which is when the client gets its reply.
+        """
+        loop = asyncio.get_running_loop()
+        while True :
+            items = [await self.queue.get()]            # wait for at least one
+            deadline = loop.time() + self.batchwait
+            while len(items) < self.batchsize :         # then fill out the batch briefly
+                timeleft = deadline - loop.time()
+                if timeleft <= 0 :
+                    break
+                try :
+                    items.append(await asyncio.wait_for(self.queue.get(), timeleft))
+                except asyncio.TimeoutError :
+                    break
+            terrainrows = []
+            impostorrows = []
+            for (kind, rows, _) in items :
+                if kind == TERRAINPATH :
+                    terrainrows.extend(rows)
+                else :
+                    impostorrows.extend(rows)
+            t0 = time.perf_counter()
+            try :
+                await loop.run_in_executor(self.executor, self.store.writebatch, terrainrows, impostorrows)
+                err = None
+            except Exception as e :                     # any failure goes to the waiting clients, writer keeps going
+                err = e
+            self.stats.batchtimes.append(time.perf_counter() - t0)
+            self.stats.batches += 1
+            if err is None :
+                self.stats.rowswritten += len(terrainrows) + len(impostorrows)
+            for (_, _, fut) in items :
+                if not fut.done() :
+                    if err is None :
+                        fut.set_result(True)
+                    else :
+                        fut.set_exception(err)
+            for _ in items :
+                self.queue.task_done()
+
+    async def handle(self, req) :
+        """
+        Answer one HTTP request, for httpserve
+        """
+        self.stats.requests += 1
+        self.stats.bytes += len(req.body)
+        url = urlsplit(req.target)
+        if url.path == STATSPATH :
+            return (200, self.stats.asdict(self.queue.qsize()))
+        if url.path not in (TERRAINPATH, IMPOSTORPATH) :
+            raise UploadError(404, "No such endpoint: %s" % (url.path,))
+        if req.method != "POST" :
+            raise UploadError(405, "POST only")
+        try :
+            await self.accept(url, req.body.decode("utf-8", "replace"))
+        except sqlite3.Error as err :
+            return (500, "Store error: %s" % (err,))
+        return (200, "OK")
+
+    def replied(self, status, secs) :
+        """
+        After each reply, including ones for unreadable requests
+        """
+        self.stats.statuses[status] += 1
+        self.stats.latencies.append(secs)
+
+    async def accept(self, url, body) :
+        """
+        Decode an upload and queue it for the store. Returns when committed.
+        """
+        if url.path == TERRAINPATH :
+            rows = [decodeterrain(body)]
+        else :
+            version = parse_qs(url.query).get("version", [""])[0]
+            rows = decodeimpostors(body, version)
+        fut = asyncio.get_running_loop().create_future()
+        try :
+            await asyncio.wait_for(self.queue.put((url.path, rows, fut)), self.queuetimeout)
+        except asyncio.TimeoutError :
+            raise UploadError(503, "Overloaded, retry later", RETRYAFTER)
+        if self.recordfile :
+            self.recordfile.write(json.dumps({"path" : url.path + ("?" + url.query if url.query else ""), "body" : body}) + "\n")
+        await fut                                       # wait for commit
+        self.stats.uploads += 1
+
+    async def close(self) :
+        if self.writertask :
+            await self.queue.join()                     # finish pending writes
+            self.writertask.cancel()
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.store.close)
+        self.executor.shutdown()
+
+#
+#   Main program
+#
+async def serve(args) :
+    recordfile = open(args.record, "a", buffering=1) if args.record else None
+    server = TerrainServer(TerrainStore(args.db), queuesize=args.queuesize, batchsize=args.batchsize,
+        batchwait=args.batchwait, queuetimeout=args.queuetimeout, recordfile=recordfile)
+    srv = await server.start(args.host, args.port)
+    print("Terrain server listening on %s:%d, store \"%s\"" % (args.host, args.port, args.db))
+    try :
+        async with srv :
+            while True :
+                await asyncio.sleep(args.statsinterval)
+                print(json.dumps(server.stats.asdict(server.queue.qsize())))
+    finally :
+        await server.close()
+        if recordfile :
+            recordfile.close()
+
+def main() :
+    parser = argparse.ArgumentParser(description="Local terrain upload receiver")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--db", default="terrain.db", help="SQLite terrain store")
+    parser.add_argument("--queuesize", type=int, default=1000, help="max uploads waiting for the store")
+    parser.add_argument("--batchsize", type=int, default=100, help="max uploads per store transaction")
+    parser.add_argument("--batchwait", type=float, default=0.05, help="seconds to wait to fill a batch")
+    parser.add_argument("--queuetimeout", type=float, default=2.0, help="seconds to wait for queue space before 503")
+    parser.add_argument("--record", default=None, help="append accepted uploads to this JSONL file")
+    parser.add_argument("--statsinterval", type=float, default=10.0, help="seconds between stats printouts")
+    args = parser.parse_args()
+    try :
+        asyncio.run(serve(args))
+    except KeyboardInterrupt :
+        pass
+
+if __name__ == "__main__" :
+    main()